@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from schema import as_category
+
+# --- PITCHER ARCHETYPES ---
+# Classifiers work on a per-pitcher profile table (one row per pitcher, with
+# 'pitcher_avg_velo', 'pitcher_avg_spin' and 'pitches' = number of pitches
+# thrown) and return one style label per row. They run once per pitcher, so
+# new rules never need a per-pitch Python loop. Add a rule by writing a
+# function with the same signature and registering it in CLASSIFIERS.
+
+DEFAULT_CLASSIFIER = 'velo_spin'
+
+def weighted_median(values, weights):
+    """
+    Median of values with each value repeated weights times, i.e. the same
+    result as taking the median over every pitch instead of every pitcher.
+    NaN values are ignored.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.int64)
+    keep = ~np.isnan(values) & (weights > 0)
+    values, weights = values[keep], weights[keep]
+    if len(values) == 0:
+        return np.nan
+
+    order = np.argsort(values, kind='stable')
+    values, cum = values[order], np.cumsum(weights[order])
+    total = cum[-1]
+    # Positions (0-based) of the middle element(s) in the expanded array
+    lo = values[np.searchsorted(cum, (total - 1) // 2, side='right')]
+    hi = values[np.searchsorted(cum, total // 2, side='right')]
+    return (lo + hi) / 2
+
+def classify_velo_spin(profiles):
+    """Power vs. Crafty: above/below the league (pitch-weighted) median velo and spin."""
+    velo = profiles['pitcher_avg_velo'].to_numpy()
+    spin = profiles['pitcher_avg_spin'].to_numpy()
+    high_velo = velo > weighted_median(velo, profiles['pitches'])
+    high_spin = spin > weighted_median(spin, profiles['pitches'])
+
+    return np.select(
+        [high_velo & high_spin, high_velo, high_spin],
+        ['Power_HighSpin', 'Power_Sink', 'Crafty_Spin'],
+        default='Crafty_Finesse',
+    )
+
+CLASSIFIERS = {
+    'velo_spin': classify_velo_spin,
+}
+
+def classify_pitchers(profiles, classifier=DEFAULT_CLASSIFIER):
+    """Returns the pitcher_style categorical for each row of the profile table."""
+    labels = CLASSIFIERS[classifier](profiles)
+    return pd.Series(as_category(labels, 'pitcher_style'), index=profiles.index)
@@ -0,0 +1,276 @@
+import os
+import io
+import gc
+import csv
+import sys
+import queue
+import time
+import shutil
+import argparse
+import tempfile
+import traceback
+import subprocess
+import multiprocessing as mp
+from contextlib import redirect_stdout
+from datetime import datetime
+import lightgbm as lgb
+from synthetic import make_rows, write_season
+from schema import enforce
+from parallel import available_memory
+from cleaning import clean_year_data
+from rolling_batter_stats import add_at_bat_sequence_features, add_rolling_stats
+import master_process
+from features import build_features, clean_base
+from encoders import CategoryEncoder, encoder_path
+from model_train import FEATURES, CAT_FEATURES
+from compiled_model import compile_booster
+
+# --- BENCHMARK SUITE ---
+# Times the pipeline stages on synthetic seasons (synthetic.py) of fixed sizes,
+# so speedups and scaling regressions can be checked offline and reproducibly.
+# Every (stage, size) runs in a fresh process: its input is generated and the
+# earlier stages are applied first (untimed), then the stage itself is timed
+# and its peak memory above the input's footprint is measured.
+#
+#   python benchmark.py                               # every stage at every size
+#   python benchmark.py --sizes 100k 1m --only add_rolling_stats
+#   python benchmark.py --check                       # exit 1 on a regression
+#
+# Results are appended to benchmarks/results.csv together with the git commit.
+
+SIZES = [100_000, 1_000_000, 10_000_000]
+SEED = 0
+RESULTS_FILE = "benchmarks/results.csv"
+REGRESSION_TOLERANCE = 0.20  # Slower than the previous result by more than 20%
+BYTES_PER_ROW = 2_000        # Rough peak of the heaviest stage; larger sizes are skipped
+SCORING_CHUNK_ROWS = 250_000
+SCORING_TREES = 50           # Trees of the stand-in model when no --model is given
+RESULT_POLL_S = 5            # How often the parent checks that a silent child is still alive
+
+FIELDS = ['timestamp', 'commit', 'benchmark', 'size', 'rows', 'seconds', 'rows_per_s',
+          'peak_rss_mb', 'peak_delta_mb']
+
+# 1. STAGE INPUTS (untimed)
+def raw_input(size):
+    return make_rows(size, seed=SEED)
+
+def cleaned_input(size):
+    return enforce(clean_year_data(raw_input(size)), "cleaned input")
+
+def sequenced_input(size):
+    return add_at_bat_sequence_features(cleaned_input(size))
+
+def base_input(size):
+    return clean_base(raw_input(size))
+
+def master_input(size):
+    return enforce(build_features(base_input(size)), "master input")
+
+def season_files(size):
+    """A synthetic season on disk, with master_process pointed at temp folders."""
+    tmp = tempfile.mkdtemp(prefix="bench_")
+    df = raw_input(size)
+    write_season(df, 2023, os.path.join(tmp, "statcast_yearly"))
+    master_process.DATA_FOLDER = os.path.join(tmp, "statcast_yearly")
+    master_process.OUTPUT_DIR = os.path.join(tmp, "final_data")
+    master_process.FEATURE_CACHE = os.path.join(tmp, "feature_cache")
+    master_process.CHECK_DATA = False  # Synthetic seasons carry no real signal to check
+    return tmp, len(df)
+
+def cached_season_files(size):
+    """season_files with the feature cache already filled by an untimed run."""
+    tmp, rows = season_files(size)
+    master_process.process_master_data()
+    return tmp, rows
+
+def scoring_input(size, model_file=None):
+    df = master_input(size)
+    if model_file:
+        return (df, lgb.Booster(model_file=model_file), CategoryEncoder.load(encoder_path(model_file))), len(df)
+    # Stand-in zone model trained on a sample, so scoring is timed on a realistic tree count
+    encoder = CategoryEncoder.fit(df, CAT_FEATURES, target='zone')
+    sample = df.sample(n=min(len(df), 50_000), random_state=SEED)
+    train = lgb.Dataset(encoder.transform(sample, FEATURES), label=encoder.encode_classes(sample['zone']),
+                        feature_name=FEATURES, categorical_feature=CAT_FEATURES)
+    params = {'objective': 'multiclass', 'num_class': len(encoder.classes), 'num_leaves': 31,
+              'seed': SEED, 'verbose': -1}
+    return (df, lgb.train(params, train, num_boost_round=SCORING_TREES), encoder), len(df)
+
+def compiled_scoring_input(size, model_file=None):
+    """scoring_input with the booster compiled to packed node arrays (compiled_model.py)."""
+    (df, booster, encoder), rows = scoring_input(size, model_file)
+    return (df, compile_booster(booster), encoder), rows
+
+def _frame(make):
+    """Setup for stages that take one frame: (frame, its rows)."""
+    def setup(size, model_file):
+        df = make(size)
+        return df, len(df)
+    return setup
+
+# 2. TIMED STAGES: name -> (setup(size, model_file) -> (input, input rows), run(input))
+def _score(inputs):
+    df, booster, encoder = inputs
+    features = booster.feature_name()
+    for start in range(0, len(df), SCORING_CHUNK_ROWS):
+        booster.predict(encoder.transform(df.iloc[start:start + SCORING_CHUNK_ROWS], features))
+
+def _process_master(tmp):
+    try:
+        master_process.process_master_data()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+BENCHMARKS = {
+    'clean_year_data': (_frame(raw_input), clean_year_data),
+    'add_at_bat_sequence_features': (_frame(cleaned_input), add_at_bat_sequence_features),
+    'add_rolling_stats': (_frame(sequenced_input), add_rolling_stats),
+    'clean_base': (_frame(raw_input), clean_base),
+    'build_features': (_frame(base_input), build_features),
+    'process_master_data': (lambda size, _: season_files(size), _process_master),
+    'process_master_data_cached': (lambda size, _: cached_season_files(size), _process_master),
+    'model_scoring': (scoring_input, _score),
+    'model_scoring_compiled': (compiled_scoring_input, _score),
+}
+
+# 3. MEASUREMENT
+def _status_mb(field):
+    """A memory field of /proc/self/status (VmRSS, VmHWM) in MB, None if unavailable."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    return None
+
+def _reset_peak():
+    """Resets the kernel's peak-RSS mark (Linux >= 4.0), so VmHWM covers only the stage."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def _child(name, size, model_file, verbose, results):
+    try:
+        setup, run = BENCHMARKS[name]
+        with redirect_stdout(sys.stdout if verbose else io.StringIO()):
+            inputs, rows = setup(size, model_file)
+            gc.collect()
+            baseline = _status_mb("VmRSS")
+            exact_peak = _reset_peak()
+            t0 = time.perf_counter()
+            run(inputs)
+            seconds = time.perf_counter() - t0
+        peak = _status_mb("VmHWM")
+        results.put({
+            'benchmark': name, 'size': size, 'rows': rows, 'seconds': round(seconds, 4),
+            'rows_per_s': round(rows / seconds) if seconds > 0 else None,
+            'peak_rss_mb': None if peak is None else round(peak, 1),
+            'peak_delta_mb': None if peak is None or baseline is None or not exact_peak else round(peak - baseline, 1),
+        })
+    except Exception:
+        results.put({'benchmark': name, 'size': size, 'error': traceback.format_exc()})
+
+def run_benchmark(name, size, model_file=None, verbose=False):
+    """Runs one stage at one size in a fresh process and returns its measurements."""
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(name, size, model_file, verbose, results))
+    proc.start()
+    # A child killed before it reports (e.g. by the OOM killer) must not hang the suite
+    while True:
+        try:
+            result = results.get(timeout=RESULT_POLL_S)
+            break
+        except queue.Empty:
+            if proc.is_alive():
+                continue
+        try:
+            # It may have reported just before exiting
+            result = results.get(timeout=1)
+        except queue.Empty:
+            result = {'benchmark': name, 'size': size,
+                      'error': f"child exited with code {proc.exitcode} without a result"}
+        break
+    proc.join()
+    return result
+
+# 4. RESULTS
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def load_results():
+    if not os.path.exists(RESULTS_FILE):
+        return []
+    with open(RESULTS_FILE) as f:
+        return list(csv.DictReader(f))
+
+def save_results(rows):
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    new_file = not os.path.exists(RESULTS_FILE)
+    with open(RESULTS_FILE, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+
+def parse_size(text):
+    """'100k' -> 100000, '10m' -> 10000000."""
+    text = text.lower().replace("_", "")
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+def run_suite(sizes=SIZES, only=None, model_file=None, verbose=False):
+    """Runs the selected stages at every size; returns True if nothing regressed."""
+    previous = {(r['benchmark'], int(r['size'])): float(r['seconds']) for r in load_results()}
+    free = available_memory()
+    stamp, commit = datetime.now().isoformat(timespec="seconds"), git_commit()
+    names = only or list(BENCHMARKS)
+    regressions, results = [], []
+
+    print(f"{'benchmark':<30} {'rows':>11} {'seconds':>9} {'rows/s':>12} {'peak MB':>9} {'+MB':>8} {'vs prev':>8}")
+    for size in sizes:
+        if free is not None and size * BYTES_PER_ROW > free:
+            print(f"Skipping {size:,} rows: needs ~{size * BYTES_PER_ROW / 1e9:.0f} GB, {free / 1e9:.1f} GB free")
+            continue
+        for name in names:
+            result = run_benchmark(name, size, model_file, verbose)
+            if 'error' in result:
+                print(f"{name:<30} {size:>11,} FAILED\n{result['error']}")
+                regressions.append((name, size))
+                continue
+            before = previous.get((name, size))
+            change = "" if before is None else f"{(result['seconds'] - before) / before * 100:+.0f}%"
+            if before is not None and result['seconds'] > before * (1 + REGRESSION_TOLERANCE):
+                regressions.append((name, size))
+                change += " !"
+            print(f"{name:<30} {result['rows']:>11,} {result['seconds']:>9.2f} {result['rows_per_s'] or 0:>12,} "
+                  f"{result['peak_rss_mb'] or '-':>9} {result['peak_delta_mb'] or '-':>8} {change:>8}")
+            results.append({'timestamp': stamp, 'commit': commit, **result})
+
+    save_results(results)
+    print(f"Saved {len(results)} results to {RESULTS_FILE}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {REGRESSION_TOLERANCE:.0%}: {regressions}")
+    return not regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data.")
+    parser.add_argument("--sizes", nargs="+", default=[str(s) for s in SIZES], help="e.g. 100k 1m 10m")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="stages to run (default: all)")
+    parser.add_argument("--model", help="score with this booster (and its encoder) instead of a stand-in")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 on a regression")
+    parser.add_argument("--verbose", action="store_true", help="show the stages' own output")
+    args = parser.parse_args()
+
+    ok = run_suite([parse_size(s) for s in args.sizes], args.only, args.model, args.verbose)
+    if args.check and not ok:
+        raise SystemExit(1)
@@ -1,6 +1,12 @@
 import pandas as pd
 import glob
 import os
+import argparse
+from parallel import run_per_year
+from schema import enforce
+from dataset import write_dataset
+from profiling import stage
+from features import CLEANING_FEATURES, build_features
 
 # Configuration
 INPUT_DIR = "statcast_yearly"
@@ -17,18 +23,9 @@ def clean_year_data(df):
     non_competitive = ['intent_ball', 'pitchout', 'automatic_ball', 'automatic_strike']
     df = df[~df['description'].isin(non_competitive)]
     
-    # 3. Standardize Runner Columns
-    # Statcast uses Player IDs. We want 1 (runner present) or 0 (base empty).
-    runner_cols = ['on_1b', 'on_2b', 'on_3b']
-    for col in runner_cols:
-        df[col] = df[col].notna().astype(int)
-        
-    # 4. Standardize Handedness and Inning
-    # Models prefer numbers (0/1) over strings ('R'/'L')
-    mapping = {'R': 0, 'L': 1, 'top': 0, 'bot': 1}
-    df['stand'] = df['stand'].map(mapping)
-    df['p_throws'] = df['p_throws'].map(mapping)
-    df['inning_topbot'] = df['inning_topbot'].map(mapping)
+    # 3-4. Standardize Runner Columns (1/0) and Handedness / Inning (0/1)
+    # Same feature nodes as the master dataset (see features.py)
+    df = build_features(df, CLEANING_FEATURES)
     
     # 5. Deduplication
     # Ensures every pitch in your 6.5M rows is unique
@@ -43,24 +40,35 @@ def clean_year_data(df):
     
     return df
 
-def run_cleaning_pipeline():
-    all_files = sorted(glob.glob(f"{INPUT_DIR}/statcast_*.csv"))
+def clean_year_file(file_path):
+    year = os.path.basename(file_path).split('_')[1].split('.')[0]
+    print(f"Cleaning data for {year}...")
     
-    for file_path in all_files:
-        year = os.path.basename(file_path).split('_')[1].split('.')[0]
-        print(f"Cleaning data for {year}...")
-        
-        # Read data
-        df = pd.read_csv(file_path, low_memory=False)
-        
-        # Clean data
-        df_clean = clean_year_data(df)
-        
-        # Save as Parquet for the next step (Feature Engineering)
-        # Parquet is 10x faster to load and much smaller than CSV
-        output_path = f"{OUTPUT_DIR}/clean_{year}.parquet"
-        df_clean.to_parquet(output_path, index=False)
-        print(f"Success: {year} saved with {len(df_clean)} rows.")
+    # Read data
+    with stage(f"Reading {year}") as s:
+        df = enforce(pd.read_parquet(file_path), f"read {year}")
+        s.rows_out = len(df)
+    
+    # Clean data
+    with stage(f"Cleaning {year}", rows_in=len(df)) as s:
+        df_clean = enforce(clean_year_data(df), f"clean {year}")
+        s.rows_out = len(df_clean)
+    
+    # Save as Parquet for the next step (Feature Engineering)
+    # Parquet is 10x faster to load and much smaller than CSV
+    # Written to the season={year} partition of the cleaned dataset
+    with stage(f"Writing {year}", rows_in=len(df_clean)):
+        write_dataset(df_clean, OUTPUT_DIR)
+    print(f"Success: {year} saved with {len(df_clean)} rows.")
+    return year, len(df_clean)
+
+def run_cleaning_pipeline(workers=1):
+    all_files = sorted(glob.glob(f"{INPUT_DIR}/statcast_*.parquet"))
+    # Seasons are independent, so each one can be cleaned in its own process
+    run_per_year(clean_year_file, all_files, workers)
 
 if __name__ == "__main__":
-    run_cleaning_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Clean the yearly Statcast files.")
+    parser.add_argument("--workers", type=int, default=1, help="seasons to clean in parallel")
+    args = parser.parse_args()
+    run_cleaning_pipeline(workers=args.workers)
\ No newline at end of file
@@ -0,0 +1,404 @@
+import os
+import time
+import ctypes
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+import numpy as np
+import lightgbm as lgb
+from digests import file_digest
+
+# --- COMPILED BOOSTERS (FAST-PATH INFERENCE) ---
+# Loading a booster from its text model file means parsing every tree again on
+# each start (slow for a 1500-round multiclass model). compile_booster packs
+# all trees into flat node arrays instead, saved once next to the model as
+#   model_zone_optimized.compiled.npz
+# which later starts only have to map back in (np.load). The cache is keyed by the
+# model file's content hash, so retraining recompiles on the next load.
+#
+# Prediction runs a small C kernel over the packed arrays (compiled with the
+# system C compiler on first use and cached in model_cache/; OpenMP threads
+# over rows, blocks of rows walking each tree while its nodes are in cache).
+# Without a compiler, the same walk runs in numpy: all (rows x trees) node
+# indices advance one tree level per step, leaves pointing to themselves.
+# The split rules are LightGBM's own (<= for numerical splits, category
+# bitsets, NaN / zero missing values to the default side), so the
+# probabilities match Booster.predict to float rounding.
+# Class restriction: with allowed classes per row (a pitcher's repertoire) only
+# the trees of those classes are walked and the softmax runs over them alone,
+# which equals masking Booster.predict's probabilities and renormalizing.
+#
+#   python compiled_model.py compile model_zone_optimized.txt
+#   python compiled_model.py bench --model model_type_optimized.txt --rows 1 64 10000
+
+# --- CONFIGURATION ---
+VERSION = 1
+THREADS = os.cpu_count() or 1
+CHUNK_ELEMENTS = 2_000_000  # rows x trees walked at a time by the numpy fallback
+KERNEL_DIR = "model_cache"  # Compiled C kernel (one shared library per kernel source)
+COMPILER = os.environ.get("CC", "cc")
+MISSING_TYPES = {'None': 0, 'Zero': 1, 'NaN': 2}
+ZERO_THRESHOLD = 1e-35      # LightGBM's kZeroThreshold
+
+def compiled_path(model_file):
+    """Where the compiled form of a saved booster lives."""
+    return os.path.splitext(model_file)[0] + ".compiled.npz"
+
+# 1. PACKING
+def _pack(dump):
+    """Flat node arrays of every tree in a Booster.dump_model() dict."""
+    feature, threshold, left, right, default_left, missing, cat_start, cat_words, value = ([] for _ in range(9))
+    bits, roots, depths = [], [], []
+    n_bits = [0]  # Words in bits so far
+
+    def add(node, depth):
+        i = len(feature)
+        for column, init in ((feature, 0), (threshold, 0.0), (left, i), (right, i), (default_left, False),
+                             (missing, 0), (cat_start, -1), (cat_words, 0), (value, 0.0)):
+            column.append(init)
+        if 'leaf_value' in node:
+            value[i] = node['leaf_value']
+            return i, depth
+        feature[i] = node['split_feature']
+        default_left[i] = node['default_left']
+        missing[i] = MISSING_TYPES[node['missing_type']]
+        if node['decision_type'] == '==':
+            cats = [int(c) for c in str(node['threshold']).split('||')]
+            words = np.zeros(max(cats) // 32 + 1, dtype=np.uint32)
+            for c in cats:
+                words[c // 32] |= np.uint32(1 << (c % 32))
+            cat_start[i], cat_words[i] = n_bits[0], len(words)
+            bits.append(words)
+            n_bits[0] += len(words)
+        else:
+            threshold[i] = node['threshold']
+        left[i], left_depth = add(node['left_child'], depth + 1)
+        right[i], right_depth = add(node['right_child'], depth + 1)
+        return i, max(left_depth, right_depth)
+
+    for tree in dump['tree_info']:
+        root, depth = add(tree['tree_structure'], 0)
+        roots.append(root)
+        depths.append(depth)
+
+    return {
+        'feature': np.array(feature, dtype=np.int32),
+        'threshold': np.array(threshold, dtype=np.float64),
+        'left': np.array(left, dtype=np.int32),
+        'right': np.array(right, dtype=np.int32),
+        'default_left': np.array(default_left, dtype=bool),
+        'missing': np.array(missing, dtype=np.int8),
+        'cat_start': np.array(cat_start, dtype=np.int32),
+        'cat_words': np.array(cat_words, dtype=np.int32),
+        'cat_bits': np.concatenate(bits) if bits else np.zeros(0, dtype=np.uint32),
+        'value': np.array(value, dtype=np.float64),
+        'roots': np.array(roots, dtype=np.int32),
+        'depth': np.int32(max(depths, default=0)),
+    }
+
+def compile_booster(booster):
+    """A CompiledModel of a multiclass (softmax) booster."""
+    dump = booster.dump_model()
+    if not dump['objective'].startswith('multiclass ') or dump['num_tree_per_iteration'] != dump['num_class']:
+        raise ValueError(f"only softmax multiclass boosters can be compiled, not '{dump['objective']}'")
+    return CompiledModel(_pack(dump), dump['feature_names'], dump['num_class'])
+
+# 2. C KERNEL
+KERNEL_SOURCE = r"""
+#include <math.h>
+#include <stdint.h>
+#define BLOCK 64
+
+/* Adds the leaf value of every tree to out[row, tree_class[tree]], skipping
+   the trees of classes a row does not allow (allowed may be NULL: all). */
+void predict_raw(const float *X, int64_t n_rows, int64_t n_features, const uint8_t *allowed,
+                 const int32_t *roots, const int32_t *tree_class, int64_t n_trees,
+                 const int32_t *feature, const double *threshold, const int32_t *left, const int32_t *right,
+                 const int8_t *default_left, const int8_t *missing, const int32_t *cat_start,
+                 const int32_t *cat_words, const uint32_t *cat_bits, const double *value,
+                 double *out, int64_t n_class, int n_threads)
+{
+    int64_t n_blocks = (n_rows + BLOCK - 1) / BLOCK;
+    #pragma omp parallel for num_threads(n_threads) schedule(static)
+    for (int64_t b = 0; b < n_blocks; b++) {
+        int64_t end = (b + 1) * BLOCK < n_rows ? (b + 1) * BLOCK : n_rows;
+        for (int64_t t = 0; t < n_trees; t++) {
+            for (int64_t r = b * BLOCK; r < end; r++) {
+                if (allowed && !allowed[r * n_class + tree_class[t]])
+                    continue;
+                const float *x = X + r * n_features;
+                int32_t i = roots[t];
+                while (left[i] != i) {
+                    double v = x[feature[i]];
+                    int go_left;
+                    if (cat_start[i] >= 0) {
+                        /* NaN and negative codes go right, like LightGBM */
+                        go_left = 0;
+                        if (!isnan(v) && v > -1.0) {
+                            int64_t c = (int64_t)v;
+                            if (c / 32 < cat_words[i])
+                                go_left = (cat_bits[cat_start[i] + c / 32] >> (c % 32)) & 1;
+                        }
+                    } else {
+                        if (isnan(v) && missing[i] != 2) v = 0.0;
+                        if ((missing[i] == 1 && fabs(v) <= 1e-35) || (missing[i] == 2 && isnan(v)))
+                            go_left = default_left[i];
+                        else
+                            go_left = v <= threshold[i];
+                    }
+                    i = go_left ? left[i] : right[i];
+                }
+                out[r * n_class + tree_class[t]] += value[i];
+            }
+        }
+    }
+}
+"""
+_KERNEL = []
+_KERNEL_LOCK = threading.Lock()
+
+def _compile_kernel(library):
+    """
+    Compiles KERNEL_SOURCE into library. Every build uses its own temp files in
+    KERNEL_DIR, removed whatever happens, and is renamed into place atomically,
+    so concurrent first builds (threads or server workers) never see a partial file.
+    """
+    os.makedirs(KERNEL_DIR, exist_ok=True)
+    fd, source = tempfile.mkstemp(prefix="predict_kernel-", suffix=".c", dir=KERNEL_DIR)
+    tmp = source[:-2] + ".so.tmp"
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(KERNEL_SOURCE)
+        subprocess.run([COMPILER, "-O3", "-fPIC", "-shared", "-fopenmp", source, "-o", tmp],
+                       check=True, capture_output=True)
+        os.replace(tmp, library)
+    finally:
+        for path in (source, tmp):
+            if os.path.exists(path):
+                os.remove(path)
+
+def _load_kernel():
+    """Loads predict_raw from KERNEL_DIR, compiling it first if needed; None if that fails."""
+    digest = hashlib.sha1((KERNEL_SOURCE + COMPILER).encode()).hexdigest()[:16]
+    library = os.path.abspath(os.path.join(KERNEL_DIR, f"predict_kernel-{digest}.so"))
+    if not os.path.exists(library):
+        try:
+            _compile_kernel(library)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f" No C kernel ({e}); predicting with numpy")
+            return None
+
+    def array(dtype):
+        return np.ctypeslib.ndpointer(dtype=dtype, flags="C_CONTIGUOUS")
+    func = ctypes.CDLL(library).predict_raw
+    func.restype = None
+    func.argtypes = [array(np.float32), ctypes.c_int64, ctypes.c_int64, ctypes.c_void_p,
+                     array(np.int32), array(np.int32), ctypes.c_int64,
+                     array(np.int32), array(np.float64), array(np.int32), array(np.int32),
+                     array(np.int8), array(np.int8), array(np.int32),
+                     array(np.int32), array(np.uint32), array(np.float64),
+                     array(np.float64), ctypes.c_int64, ctypes.c_int]
+    return func
+
+def _kernel():
+    """The compiled predict_raw (built once per source into KERNEL_DIR); None without a C compiler."""
+    with _KERNEL_LOCK:
+        if not _KERNEL:
+            _KERNEL.append(_load_kernel())
+        return _KERNEL[0]
+
+# 3. PREDICTION
+class CompiledModel:
+    """A booster's trees as packed node arrays."""
+
+    def __init__(self, arrays, feature_names, num_class):
+        self.arrays = arrays
+        self.features = list(feature_names)
+        self.num_class = int(num_class)
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.tree_class = (np.arange(len(self.roots)) % self.num_class).astype(np.int32)
+        self.has_cats = bool((self.cat_start >= 0).any())
+        self.has_zero_missing = bool((self.missing == MISSING_TYPES['Zero']).any())
+
+    def feature_name(self):
+        return self.features
+
+    def save(self, path, digest=""):
+        np.savez(path, version=VERSION, digest=digest, features=np.array(self.features),
+                 num_class=self.num_class, **self.arrays)
+
+    @classmethod
+    def load(cls, path, digest=None):
+        """The model saved at path; None if it is stale (other digest) or from another VERSION."""
+        with np.load(path) as data:
+            if int(data['version']) != VERSION or (digest is not None and str(data['digest']) != digest):
+                return None
+            arrays = {k: data[k] for k in data.files if k not in ('version', 'digest', 'features', 'num_class')}
+            arrays['depth'] = arrays['depth'][()]
+            return cls(arrays, data['features'].tolist(), data['num_class'])
+
+    def _leaves(self, X, trees):
+        """Leaf node of every (row, tree) pair, walking all trees one level per step."""
+        node = np.broadcast_to(self.roots[trees], (len(X), len(trees))).copy()
+        has_nan = np.isnan(X).any()
+        for _ in range(self.depth):
+            f = self.feature[node]
+            x = np.take_along_axis(X, f, axis=1).astype(np.float64)
+            go_left = x <= self.threshold[node]
+            if has_nan or self.has_zero_missing:
+                # Missing values (numerical splits): NaN counts as 0 unless the split learned a NaN side
+                missing = self.missing[node]
+                nan = np.isnan(x)
+                value = np.where(nan & (missing != MISSING_TYPES['NaN']), 0.0, x)
+                to_default = (nan & (missing == MISSING_TYPES['NaN'])) | \
+                             ((missing == MISSING_TYPES['Zero']) & (np.abs(value) <= ZERO_THRESHOLD))
+                go_left = np.where(to_default, self.default_left[node], value <= self.threshold[node])
+            if self.has_cats:
+                start, words = self.cat_start[node], self.cat_words[node]
+                is_cat = start >= 0
+                if is_cat.any():
+                    # Category in the split's bitset -> left; negative, NaN or past the bitset -> right
+                    # (from the original values: NaN is not category 0 here)
+                    code = np.where(np.isnan(x), -1, x).astype(np.int64)
+                    word = code // 32
+                    in_range = is_cat & (code >= 0) & (word < words)
+                    bit = self.cat_bits[np.where(in_range, start + word, 0)] >> (code % 32).astype(np.uint32)
+                    go_left = np.where(is_cat, in_range & (bit & 1).astype(bool), go_left)
+            new = np.where(go_left, self.left[node], self.right[node])
+            if np.array_equal(new, node):
+                break
+            node = new
+        return node
+
+    def _raw(self, X, allowed, num_threads, use_kernel=True):
+        """Summed leaf values per class; classes a row does not allow are left out."""
+        raw = np.zeros((len(X), self.num_class))
+        kernel = _kernel() if use_kernel else None
+        if kernel is not None:
+            kernel(X, len(X), X.shape[1], None if allowed is None else allowed.ctypes.data,
+                   self.roots, self.tree_class, len(self.roots),
+                   self.feature, self.threshold, self.left, self.right, self.default_left.view(np.int8),
+                   self.missing, self.cat_start, self.cat_words, self.cat_bits, self.value,
+                   raw, self.num_class, num_threads)
+            return raw
+        # numpy fallback: walks every tree (restriction only masks the softmax)
+        trees = np.arange(len(self.roots))
+        step = max(1, CHUNK_ELEMENTS // len(trees))
+        for start in range(0, len(X), step):
+            leaves = self.value[self._leaves(X[start:start + step], trees)]
+            for k in range(self.num_class):
+                raw[start:start + step, k] = leaves[:, self.tree_class == k].sum(axis=1)
+        return raw
+
+    def predict(self, X, allowed=None, num_threads=THREADS, use_kernel=True):
+        """
+        (rows x classes) probabilities of float32 rows in feature_name() order.
+        allowed: optional (rows x classes) bool array; each row walks only the
+        trees of its allowed classes and the softmax runs over them alone
+        (a row with no allowed class gets all 0). use_kernel=False forces the
+        numpy walk (for parity checks).
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        num_threads = num_threads or THREADS  # 0 means all cores, like LightGBM
+        if allowed is not None:
+            allowed = np.ascontiguousarray(allowed, dtype=bool)
+        raw = self._raw(X, allowed, num_threads, use_kernel)
+        if allowed is not None:
+            raw[~allowed] = -np.inf
+        top = raw.max(axis=1, keepdims=True)
+        probs = np.exp(raw - np.where(np.isfinite(top), top, 0))
+        totals = probs.sum(axis=1, keepdims=True)
+        return np.divide(probs, totals, out=probs, where=totals > 0)
+
+def load_compiled(model_file):
+    """The compiled form of model_file, compiling and caching it first if it is missing or stale."""
+    path, digest = compiled_path(model_file), file_digest(model_file)
+    if os.path.exists(path):
+        model = CompiledModel.load(path, digest)
+        if model is not None:
+            return model
+    print(f" Compiling {model_file}...")
+    model = compile_booster(lgb.Booster(model_file=model_file))
+    # Saved under a temp name and renamed, so a concurrent load never reads a partial file
+    fd, tmp = tempfile.mkstemp(suffix=".npz", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            model.save(f, digest)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return model
+
+# 4. BENCHMARK
+def _best(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+def run_benchmark(model_file, row_counts, threads=THREADS, repeat=3, seed=0):
+    """Startup and throughput of Booster.predict vs the compiled model on random rows."""
+    print(f"--- {model_file} ---")
+    boot, booster = _best(lambda: lgb.Booster(model_file=model_file), repeat)
+    if os.path.exists(compiled_path(model_file)):
+        os.remove(compiled_path(model_file))
+    first, _ = _best(lambda: load_compiled(model_file), 1)
+    warm, model = _best(lambda: load_compiled(model_file), repeat)
+    print(f" Startup: Booster {boot * 1000:.0f} ms | compiled: first {first * 1000:.0f} ms "
+          f"(compiles and caches), then {warm * 1000:.0f} ms")
+
+    # Random rows inside every feature's observed range, codes for categoricals
+    rng = np.random.default_rng(seed)
+    infos = booster.dump_model(num_iteration=1)['feature_infos']
+    def column(info, n):
+        if info.get('values'):
+            return rng.choice(np.array(info['values'], dtype=np.float32), n)
+        return rng.uniform(info.get('min_value', 0), info.get('max_value', 1), n).astype(np.float32)
+    allowed_rng = np.random.default_rng(seed + 1)
+
+    print(f" {'rows':>7} {'Booster 1T':>12} {'Booster':>12} {'compiled':>12} {'restricted':>12} "
+          f"{'max diff':>9} {'numpy diff':>10}")
+    for n in row_counts:
+        X = np.column_stack([column(infos[f], n) for f in booster.feature_name()])
+        # Missing categoricals in a tenth of the rows (they must go right, never to category 0)
+        categorical = [i for i, f in enumerate(booster.feature_name()) if infos[f].get('values')]
+        if categorical:
+            X[rng.random(n) < 0.1, rng.choice(categorical)] = np.nan
+        # Half the classes allowed per row, from a few distinct repertoires
+        repertoires = allowed_rng.random((8, model.num_class)) < 0.5
+        allowed = repertoires[allowed_rng.integers(0, len(repertoires), n)]
+        t_one, expected = _best(lambda: booster.predict(X, num_threads=1), repeat)
+        t_all, _ = _best(lambda: booster.predict(X), repeat)
+        t_fast, probs = _best(lambda: model.predict(X, num_threads=threads), repeat)
+        t_mask, masked = _best(lambda: model.predict(X, allowed, num_threads=threads), repeat)
+        reference = expected * allowed
+        totals = reference.sum(axis=1, keepdims=True)
+        reference = np.divide(reference, totals, out=np.zeros_like(reference), where=totals > 0)
+        diff = max(np.abs(probs - expected).max(), np.abs(masked - reference).max())
+        fallback = np.abs(model.predict(X[:1000], use_kernel=False) - expected[:1000]).max()
+        print(f" {n:>7,} " + " ".join(f"{n / t:>10,.0f}/s" for t in (t_one, t_all, t_fast, t_mask))
+              + f" {diff:>9.1e} {fallback:>10.1e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile boosters to packed node arrays and benchmark them.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compile_cmd = sub.add_parser("compile", help="compile (or refresh) the cached form of model files")
+    compile_cmd.add_argument("models", nargs="+")
+    bench = sub.add_parser("bench", help="startup and throughput vs Booster.predict")
+    bench.add_argument("--model", default="model_zone_optimized.txt")
+    bench.add_argument("--rows", type=int, nargs="+", default=[1, 64, 10_000])
+    bench.add_argument("--threads", type=int, default=THREADS)
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        for model_file in args.models:
+            load_compiled(model_file)
+            print(f" {model_file} -> {compiled_path(model_file)}")
+    else:
+        run_benchmark(args.model, args.rows, args.threads)
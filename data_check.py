@@ -1,26 +1,255 @@
-import pandas as pd
+import os
+import re
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import pyarrow as pa
+from dataset import open_dataset, scan_batches
 
-# Load a sample year (e.g., 2024)
-df = pd.read_parquet("statcast_final/final_2024.parquet")
-
-print("--- DATA SANITY REPORT ---")
-print(f"Total Rows: {len(df)}")
-
-# 1. Check for 'Empty' Features
-# If these percentages are high (e.g., > 10%), your rolling stats failed.
-for col in ['batter_rolling_whiff_rate', 'pitcher_ff_usage']:
-    missing = df[col].isna().sum()
-    zeros = (df[col] == 0).sum()
-    print(f"{col}: {missing} NaNs, {zeros} Zeros ({zeros/len(df):.1%} of data)")
-
-# 2. Check Target Distribution
-# If one zone is 90% of the data, the model will just guess that zone.
-print("\nZone Distribution (Top 5):")
-print(df['zone'].value_counts(normalize=True).head(5))
-
-# 3. Correlation Check
-# Does 'strikes' actually relate to the 'zone'? 
-# In 2-strike counts, pitches should be in zones 11-14 more often.
-strike_zone_rate = df[df['strikes'] == 2]['zone'].isin([11,12,13,14]).mean()
-print(f"\nRate of 'Chase Zone' pitches with 2 strikes: {strike_zone_rate:.1%}")
+# --- DATA SANITY REPORT ---
+# Checks every season of a feature dataset after a rebuild, streaming it
+# record batch by record batch (memory is one batch per worker, whatever the
+# number of seasons). Each season is summarized in its own worker into a
+# mergeable Summary (null / zero counts, fixed-bin histograms, zone counts per
+# ball-strike count, pitch type counts); the summaries are compared season to
+# season for drift and merged for the all-seasons totals.
+# A broken structural threshold (rolling NaN / zero rates, one dominant zone)
+# is printed and makes the check fail (exit status 1), so a bad rebuild stops
+# the pipeline (master_process checks the rebuild before it replaces the
+# dataset). Chase lift and season-to-season drift are only warnings: real
+# seasons move (e.g. new pitch type codes), and their thresholds are uncalibrated.
+#
+#   python data_check.py                        # every season of final_data/
+#   python data_check.py --root statcast_final --workers 4 --json report.json
+
+# --- CONFIGURATION ---
+INPUT_DIR = "final_data"  # master_process.OUTPUT_DIR
+WORKERS = os.cpu_count() or 1
+ROLLING_FEATURES = ['batter_rolling_whiff_rate', 'pitcher_ff_usage']
+HISTOGRAMS = {  # column -> (low, high, bins); values outside fall into the end bins
+    'batter_rolling_whiff_rate': (0.0, 1.0, 20),
+    'pitcher_ff_usage': (0.0, 1.0, 20),
+    'release_speed': (60.0, 105.0, 45),
+    'score_diff': (-15, 15, 30),
+}
+ZONES = 15                      # zone codes 0-14 (0 = missing, 10 is unused)
+CHASE_ZONES = [11, 12, 13, 14]  # Outside the strike zone
+COUNTS = 12                     # balls 0-3 x strikes 0-2
+
+# Thresholds: a season breaking any of them fails the check
+MAX_ROLLING_NAN_RATE = 0.10  # Rolling stats failed for these pitches
+MAX_ROLLING_ZERO_RATE = 0.50
+MAX_ZONE_SHARE = 0.90        # One zone dominating the target: the model would just guess it
+
+# Warning thresholds: printed and reported, never fail the check (None disables them)
+MIN_CHASE_LIFT = 1.0         # 2-strike chase rate / other counts' chase rate
+MAX_DRIFT_PSI = 0.25         # Population stability index vs the previous season
+
+# 1. MERGEABLE SUMMARY
+class Summary:
+    """Counts over any number of record batches; two Summaries merge into the summary of both."""
+
+    def __init__(self):
+        self.rows = 0
+        self.nulls = {}
+        self.zeros = {}
+        self.hists = {col: np.zeros(bins, dtype=np.int64) for col, (_, _, bins) in HISTOGRAMS.items()}
+        self.zone_by_count = np.zeros((COUNTS, ZONES), dtype=np.int64)
+        self.pitch_types = {}
+
+    def update(self, batch):
+        """Adds one pyarrow RecordBatch."""
+        self.rows += batch.num_rows
+        for name, column in zip(batch.schema.names, batch.columns):
+            self.nulls[name] = self.nulls.get(name, 0) + column.null_count
+            if pa.types.is_integer(column.type) or pa.types.is_floating(column.type):
+                values = column.to_numpy(zero_copy_only=False)
+                self.zeros[name] = self.zeros.get(name, 0) + int(np.count_nonzero(values == 0))
+
+        columns = dict(zip(batch.schema.names, batch.columns))
+        for col, (low, high, bins) in HISTOGRAMS.items():
+            if col in columns:
+                values = columns[col].to_numpy(zero_copy_only=False).astype(np.float64)
+                values = values[~np.isnan(values)]
+                idx = ((values - low) / (high - low) * bins).astype(np.int64).clip(0, bins - 1)
+                self.hists[col] += np.bincount(idx, minlength=bins)
+        if {'balls', 'strikes', 'zone'} <= columns.keys():
+            balls, strikes, zone = (np.nan_to_num(columns[c].to_numpy(zero_copy_only=False)).astype(np.int64)
+                                    for c in ('balls', 'strikes', 'zone'))
+            count = balls.clip(0, 3) * 3 + strikes.clip(0, 2)
+            self.zone_by_count += np.bincount(count * ZONES + zone.clip(0, ZONES - 1),
+                                              minlength=COUNTS * ZONES).reshape(COUNTS, ZONES)
+        if 'pitch_type' in columns:
+            counts = columns['pitch_type'].value_counts()
+            for value, n in zip(counts.field('values').to_pylist(), counts.field('counts').to_pylist()):
+                self.pitch_types[value] = self.pitch_types.get(value, 0) + n
+
+    def merge(self, other):
+        merged = Summary()
+        merged.rows = self.rows + other.rows
+        for name in ('nulls', 'zeros', 'pitch_types'):
+            a, b = getattr(self, name), getattr(other, name)
+            setattr(merged, name, {k: a.get(k, 0) + b.get(k, 0) for k in {**a, **b}})
+        merged.hists = {col: self.hists[col] + other.hists[col] for col in HISTOGRAMS}
+        merged.zone_by_count = self.zone_by_count + other.zone_by_count
+        return merged
+
+    # Rates derived from the counts
+    def rate(self, counts, col):
+        return counts.get(col, 0) / self.rows if self.rows else 0.0
+
+    def zone_shares(self):
+        zones = self.zone_by_count.sum(axis=0)
+        return zones / max(zones.sum(), 1)
+
+    def chase_rates(self):
+        """Share of chase-zone pitches with 2 strikes and in every other count."""
+        two_strikes = self.zone_by_count[2::3].sum(axis=0)
+        other = self.zone_by_count.sum(axis=0) - two_strikes
+        return tuple(z[CHASE_ZONES].sum() / max(z.sum(), 1) for z in (two_strikes, other))
+
+    def distributions(self):
+        """name -> (keys, counts) of every distribution drift is measured on."""
+        dists = {f'hist:{col}': (list(range(len(h))), h) for col, h in self.hists.items() if h.sum()}
+        dists['zone'] = (list(range(ZONES)), self.zone_by_count.sum(axis=0))
+        if self.pitch_types:
+            dists['pitch_type'] = (list(self.pitch_types), np.array(list(self.pitch_types.values())))
+        return dists
+
+def summarize_season(root, season, columns=None):
+    """Streams one season of root into a Summary (runs in a worker process)."""
+    summary = Summary()
+    for batch in scan_batches(root, columns=columns, seasons=(season, season)):
+        summary.update(batch)
+    return season, summary
+
+def dataset_seasons(root):
+    """Seasons present in a season-partitioned dataset, from its file paths."""
+    found = {int(m.group(1)) for f in open_dataset(root).files if (m := re.search(r"season=(\d+)", f))}
+    return sorted(found)
+
+def summarize(root=INPUT_DIR, workers=WORKERS, seasons=None):
+    """{season: Summary} for every season of root, one worker per season."""
+    seasons = seasons or dataset_seasons(root)
+    workers = max(1, min(workers, len(seasons)))
+    print(f"Summarizing {len(seasons)} seasons of {root}/ with {workers} workers...")
+    if workers == 1:
+        results = [summarize_season(root, s) for s in seasons]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(summarize_season, [root] * len(seasons), seasons))
+    return dict(results)
+
+# 2. CHECKS
+def psi(expected, actual, keys_expected, keys_actual):
+    """Population stability index between two count distributions (keys aligned by value)."""
+    keys = list(dict.fromkeys(list(keys_expected) + list(keys_actual)))
+    def shares(keys_of, counts):
+        lookup = dict(zip(keys_of, counts))
+        p = np.array([lookup.get(k, 0) for k in keys], dtype=np.float64)
+        return np.maximum(p / max(p.sum(), 1), 1e-4)
+    p, q = shares(keys_expected, expected), shares(keys_actual, actual)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+def check_season(summary, min_chase_lift=MIN_CHASE_LIFT):
+    """Threshold failures and warnings of one season's Summary."""
+    failures, warnings = [], []
+    if summary.rows == 0:
+        return ["no rows"], warnings
+    for col in ROLLING_FEATURES:
+        if col not in summary.nulls:
+            failures.append(f"{col} is missing")
+            continue
+        nan_rate, zero_rate = summary.rate(summary.nulls, col), summary.rate(summary.zeros, col)
+        if nan_rate > MAX_ROLLING_NAN_RATE:
+            failures.append(f"{col} NaN rate {nan_rate:.1%} > {MAX_ROLLING_NAN_RATE:.0%}")
+        if zero_rate > MAX_ROLLING_ZERO_RATE:
+            failures.append(f"{col} zero rate {zero_rate:.1%} > {MAX_ROLLING_ZERO_RATE:.0%}")
+    top_share = summary.zone_shares().max()
+    if top_share > MAX_ZONE_SHARE:
+        failures.append(f"one zone is {top_share:.1%} of pitches > {MAX_ZONE_SHARE:.0%}")
+    two_strikes, other = summary.chase_rates()
+    if min_chase_lift is not None and other > 0 and two_strikes / other < min_chase_lift:
+        warnings.append(f"2-strike chase rate {two_strikes:.1%} is below {min_chase_lift:.1f}x "
+                        f"the other counts' {other:.1%}")
+    return failures, warnings
+
+def check_drift(previous, current, max_psi=MAX_DRIFT_PSI):
+    """{distribution: PSI} of current vs previous, and warnings for the ones over max_psi."""
+    before, after = previous.distributions(), current.distributions()
+    scores = {name: psi(before[name][1], after[name][1], before[name][0], after[name][0])
+              for name in after if name in before}
+    if max_psi is None:
+        return scores, []
+    return scores, [f"{name} drifted (PSI {s:.3f} > {max_psi})" for name, s in scores.items() if s > max_psi]
+
+# 3. REPORT
+def print_summary(label, summary):
+    print(f"\n--- {label}: {summary.rows:,} rows ---")
+    for col in ROLLING_FEATURES:
+        print(f"  {col}: {summary.nulls.get(col, 0)} NaNs ({summary.rate(summary.nulls, col):.1%}), "
+              f"{summary.zeros.get(col, 0)} Zeros ({summary.rate(summary.zeros, col):.1%})")
+    other_nulls = {c: n for c, n in summary.nulls.items() if n and c not in ROLLING_FEATURES}
+    if other_nulls:
+        print("  Other NaNs: " + ", ".join(f"{c} {n / summary.rows:.1%}" for c, n in other_nulls.items()))
+    shares = summary.zone_shares()
+    top = np.argsort(-shares, kind='stable')[:5]
+    print("  Zone Distribution (Top 5): " + ", ".join(f"{z}: {shares[z]:.1%}" for z in top))
+    two_strikes, other = summary.chase_rates()
+    print(f"  'Chase Zone' pitches: {two_strikes:.1%} with 2 strikes, {other:.1%} otherwise")
+
+def run_checks(root=INPUT_DIR, workers=WORKERS, report_file=None,
+               min_chase_lift=MIN_CHASE_LIFT, max_drift_psi=MAX_DRIFT_PSI):
+    """Prints the report for every season and the total; returns True if no failure threshold is broken."""
+    summaries = summarize(root, workers)
+    if not summaries:
+        print(f" No seasons found in {root}/")
+        return False
+
+    failures, warnings, report = [], [], {}
+    previous, total = None, Summary()
+    for season, summary in summaries.items():
+        print_summary(season, summary)
+        season_failures, season_warnings = check_season(summary, min_chase_lift)
+        drift = {}
+        if previous is not None:
+            drift, drifted = check_drift(previous, summary, max_drift_psi)
+            season_warnings += drifted
+            print("  Drift vs previous season (PSI): " + ", ".join(f"{n} {s:.3f}" for n, s in drift.items()))
+        failures += [f"{season}: {f}" for f in season_failures]
+        warnings += [f"{season}: {w}" for w in season_warnings]
+        report[season] = {'rows': summary.rows, 'nulls': summary.nulls, 'zeros': summary.zeros,
+                          'zone_shares': summary.zone_shares().round(4).tolist(),
+                          'chase_rates': summary.chase_rates(), 'drift': drift,
+                          'failures': season_failures, 'warnings': season_warnings}
+        previous, total = summary, total.merge(summary)
+    print_summary("All seasons", total)
+
+    if report_file:
+        with open(report_file, "w") as f:
+            json.dump(report, f, indent=1, default=float)
+        print(f"\nSaved {report_file}")
+    if warnings:
+        print(f"\n⚠️ {len(warnings)} data-quality warning(s):")
+        for warning in warnings:
+            print(f"  - {warning}")
+    if failures:
+        print(f"\n❌ {len(failures)} data-quality check(s) failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+        return False
+    print("\n✅ All data-quality checks passed")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming data-quality checks over every season.")
+    parser.add_argument("--root", default=INPUT_DIR, help="season-partitioned dataset to check")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--json", help="also save the per-season report to this file")
+    parser.add_argument("--min-chase-lift", type=float, default=MIN_CHASE_LIFT, help="warning threshold")
+    parser.add_argument("--max-drift-psi", type=float, default=MAX_DRIFT_PSI, help="warning threshold")
+    args = parser.parse_args()
+
+    if not run_checks(args.root, args.workers, args.json, args.min_chase_lift, args.max_drift_psi):
+        raise SystemExit(1)
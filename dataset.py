@@ -0,0 +1,115 @@
+import os
+import uuid
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from schema import apply_schema
+
+# --- PARTITIONED PARQUET DATASETS ---
+# Stages write Hive-partitioned datasets (root/season=2024/month=7/part-0.parquet)
+# instead of one monolithic file. Readers project only the columns they need
+# and push filters down to Parquet, so partitions and row groups that cannot
+# match (by partition value or row-group min/max statistics) are never read.
+
+ROW_GROUP_ROWS = 256_000  # Large enough for fast scans, small enough to skip by statistics
+MAX_ROWS_PER_FILE = 4_000_000
+COMPRESSION = "zstd"
+
+def add_partition_columns(df, by_month=False):
+    """Derives the season (and month) partition columns from game_date."""
+    dates = pd.to_datetime(df['game_date'])
+    df = df.assign(season=dates.dt.year.astype('int16'))
+    if by_month:
+        df = df.assign(month=dates.dt.month.astype('int8'))
+    return df
+
+def _write(df, root, by_month, existing_data_behavior, basename_template):
+    df = add_partition_columns(df, by_month)
+    partition_cols = ['season', 'month'] if by_month else ['season']
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    ds.write_dataset(
+        table, root,
+        format="parquet",
+        partitioning=partition_cols,
+        partitioning_flavor="hive",
+        existing_data_behavior=existing_data_behavior,
+        basename_template=basename_template,
+        max_rows_per_group=ROW_GROUP_ROWS,
+        min_rows_per_group=min(ROW_GROUP_ROWS, len(df)),
+        max_rows_per_file=MAX_ROWS_PER_FILE,
+        # Column statistics are written for every row group (pyarrow default)
+        file_options=ds.ParquetFileFormat().make_write_options(compression=COMPRESSION),
+    )
+
+def write_dataset(df, root, by_month=False):
+    """Writes df under root, replacing only the partitions df contains."""
+    _write(df, root, by_month, "delete_matching", "part-{i}.parquet")
+
+def replace_partitions(staging, root):
+    """
+    Moves every top-level partition of staging (a dataset written by write_dataset)
+    into root, replacing the same partitions there; the rest of root is untouched.
+    """
+    os.makedirs(root, exist_ok=True)
+    for name in sorted(os.listdir(staging)):
+        target, old = os.path.join(root, name), os.path.join(root, name + ".old")
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(target):
+            os.replace(target, old)
+        os.replace(os.path.join(staging, name), target)
+        shutil.rmtree(old, ignore_errors=True)
+    shutil.rmtree(staging, ignore_errors=True)
+
+def append_dataset(df, root, by_month=False, name=None):
+    """Adds df to root as new files named after name, leaving existing files untouched."""
+    name = name or uuid.uuid4().hex[:8]
+    _write(df, root, by_month, "overwrite_or_ignore", f"part-{name}-{{i}}.parquet")
+
+def open_dataset(root):
+    return ds.dataset(root, format="parquet", partitioning="hive")
+
+def build_filter(seasons=None, pitchers=None, where=None):
+    """
+    Combines the common filters into one pyarrow expression.
+      seasons:  (first, last) inclusive season range
+      pitchers: iterable of pitcher IDs
+      where:    extra conditions, e.g. [('strikes', '==', 2)] (ANDed, pandas/pyarrow style)
+    """
+    expr = None
+    def both(a, b):
+        return b if a is None else a & b
+
+    if seasons is not None:
+        first, last = seasons
+        expr = both(expr, (ds.field('season') >= first) & (ds.field('season') <= last))
+    if pitchers is not None:
+        expr = both(expr, ds.field('pitcher').isin(list(pitchers)))
+    if where:
+        expr = both(expr, pq.filters_to_expression(where))
+    return expr
+
+def scan_batches(root, columns=None, seasons=None, pitchers=None, where=None, batch_size=ROW_GROUP_ROWS):
+    """Yields pyarrow RecordBatches of the selected columns and rows."""
+    scanner = open_dataset(root).scanner(
+        columns=columns, filter=build_filter(seasons, pitchers, where), batch_size=batch_size,
+    )
+    yield from scanner.to_batches()
+
+def read_dataset(root, columns=None, seasons=None, pitchers=None, where=None):
+    """
+    Loads the selected columns and rows of a dataset into pandas.
+    Example: read_dataset("final_data", ["zone", "strikes"], seasons=(2022, 2024), where=[("strikes", "==", 2)])
+    """
+    table = open_dataset(root).to_table(columns=columns, filter=build_filter(seasons, pitchers, where))
+    return apply_schema(table.to_pandas(), numeric=False)
+
+def dataset_size(root):
+    """Total bytes of the Parquet files under root (or of a single file)."""
+    if os.path.isfile(root):
+        return os.path.getsize(root)
+    return sum(
+        os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(root) for f in files
+    )
@@ -0,0 +1,22 @@
+import hashlib
+
+# --- CONTENT DIGESTS ---
+# The sha1 hashes the caches are keyed by (feature cache, training cache,
+# compiled models). Kept in their own module so inference code can key its
+# caches without importing the feature pipeline.
+
+def digest(*parts):
+    """Hash of the str() of every part (separated, so ('ab', 'c') != ('a', 'bc'))."""
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(str(part).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+def file_digest(path, block=1 << 20):
+    """Content hash of a file."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
@@ -0,0 +1,118 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from schema import CATEGORIES
+
+# --- PERSISTENT CATEGORY ENCODER ---
+# Maps every categorical model feature (pitcher / batter IDs, pitch types,
+# styles, zones, handedness) to stable integer codes, and the target labels to
+# class indices. It is fitted once when a model is trained and saved next to
+# the booster (model_zone_optimized.txt -> model_zone_optimized.encoder.json),
+# so evaluation and serving reproduce the training codes with a lookup instead
+# of re-scanning the dataset.
+#
+# Code 0 is reserved for values not seen in training (and missing values);
+# known values are coded 1..n in sorted order. Schema categoricals use their
+# fixed category lists, so their codes never depend on the data.
+
+UNKNOWN = 0
+VERSION = 1
+
+def encoder_path(model_file):
+    """Where the encoder of a saved booster lives."""
+    return os.path.splitext(model_file)[0] + ".encoder.json"
+
+def _lookup_table(values):
+    """Sorted values and the position each had in the original list."""
+    values = np.asarray(values)
+    order = np.argsort(values, kind='stable')
+    return values[order], order.astype(np.int32)
+
+def _search(table, values):
+    """Position of every value in the original list, -1 where it is absent."""
+    keys, positions = table
+    values = np.asarray(values)
+    if len(keys) == 0:
+        return np.full(len(values), -1, dtype=np.int32)
+    if values.dtype == object or keys.dtype.kind == 'U':
+        # Strings (and missing values, which never match) compare as str
+        missing = pd.isna(values)
+        values = np.where(missing, '', values).astype(str)
+    pos = np.searchsorted(keys, values).clip(max=len(keys) - 1)
+    return np.where(keys[pos] == values, positions[pos], -1)
+
+class CategoryEncoder:
+    def __init__(self, categories, classes=None):
+        self.categories = {col: list(values) for col, values in categories.items()}
+        self.classes = None if classes is None else list(classes)
+        # Sorted lookup tables: a batch is encoded with one searchsorted per column
+        self._lookup = {col: _lookup_table(values) for col, values in self.categories.items()}
+        self._class_lookup = None if classes is None else _lookup_table(self.classes)
+
+    @classmethod
+    def fit(cls, df, columns, target=None):
+        """
+        Learns the codes of columns (and the classes of target) from df. Any
+        iterable of values per column also works in place of a frame column,
+        e.g. the unique values collected while streaming a dataset.
+        """
+        categories = {}
+        for col in columns:
+            if col in CATEGORIES:
+                categories[col] = CATEGORIES[col]
+            else:
+                categories[col] = np.unique(pd.Series(df[col]).dropna().to_numpy()).tolist()
+        classes = None
+        if target is not None:
+            labels = pd.Series(df[target]).dropna()
+            if isinstance(labels.dtype, pd.CategoricalDtype):
+                labels = labels.astype(object)
+            classes = np.unique(labels.to_numpy()).tolist()
+        return cls(categories, classes)
+
+    def encode(self, col, values):
+        """Codes of values for one column (UNKNOWN for unseen or missing values)."""
+        if isinstance(values, pd.Series) and isinstance(values.dtype, pd.CategoricalDtype):
+            if list(values.cat.categories) == self.categories[col]:
+                # Schema categoricals already carry the same fixed order
+                return values.cat.codes.to_numpy().astype(np.int32) + 1
+            values = values.astype(object)
+        return _search(self._lookup[col], values) + 1
+
+    def encode_classes(self, values):
+        """Class index of every label; -1 for labels the model never saw."""
+        if isinstance(values, pd.Series) and isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object)
+        return _search(self._class_lookup, values)
+
+    def transform(self, df, features):
+        """
+        float32 feature matrix in the given column order: encoded codes for
+        the categorical columns, the values themselves for the rest. df can
+        also be a dict of column arrays.
+        """
+        X = np.empty((len(df[features[0]]), len(features)), dtype=np.float32)
+        for j, col in enumerate(features):
+            if col in self.categories:
+                X[:, j] = self.encode(col, df[col])
+            else:
+                X[:, j] = np.asarray(df[col], dtype=np.float32)
+        return X
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({
+                'version': VERSION,
+                'unknown_code': UNKNOWN,
+                'categories': self.categories,
+                'classes': self.classes,
+            }, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != VERSION:
+            raise ValueError(f"{path}: unsupported encoder version {data.get('version')}")
+        return cls(data['categories'], data['classes'])
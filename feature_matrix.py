@@ -0,0 +1,181 @@
+import os
+import json
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+import lightgbm as lgb
+from schema import apply_schema
+from dataset import open_dataset, build_filter, scan_batches
+from encoders import CategoryEncoder, encoder_path
+from model_train import INPUT_DIR, TRAIN_SEASONS, FEATURES, CAT_FEATURES, TARGETS, VALID_FRACTION, DATASET_PARAMS
+from profiling import stage
+
+# --- MEMORY-MAPPED FEATURE MATRIX ---
+# Encodes the model FEATURES of final_data ONCE into a contiguous float32
+# matrix on disk (plain .npy files), streamed row group by row group:
+#   feature_matrix/X.npy            rows x FEATURES, float32, C order
+#   feature_matrix/<target>.npy     int32 class index per row (zone, pitch_type)
+#   feature_matrix/pitcher.npy      int32 pitcher ID per row (repertoire masks)
+#   feature_matrix/season.npy       int16 season per row (walk-forward folds, sweep.py)
+#   feature_matrix/encoder.json     category codes used for X
+#   feature_matrix/meta.json        features, seasons and classes per target
+# Training and scoring open it with np.load(mmap_mode='r') and hand the arrays
+# straight to LightGBM, which reads the mapped pages in place (float32, C
+# order: no conversion copy). Every process mapping the matrix (a parameter
+# sweep, evaluation, ...) shares the same page-cache pages.
+#
+#   python feature_matrix.py export                      # fit codes, export both targets
+#   python feature_matrix.py export --model model_type_optimized.txt --target pitch_type
+#   python feature_matrix.py train --target zone
+
+MATRIX_DIR = "feature_matrix"
+TARGET_COLUMNS = ['zone', 'pitch_type']
+SPLIT_SEED = 42
+
+class FeatureMatrix:
+    """Read-only, memory-mapped view of an exported feature matrix."""
+    def __init__(self, path=MATRIX_DIR):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta['features'] != FEATURES:
+            raise ValueError(f"{path} was exported for other features; re-export it")
+        self.path = path
+        self.categories = CategoryEncoder.load(os.path.join(path, "encoder.json")).categories
+        self.X = np.load(os.path.join(path, "X.npy"), mmap_mode='r')
+        self.pitchers = np.load(os.path.join(path, "pitcher.npy"), mmap_mode='r')
+        self.seasons = np.load(os.path.join(path, "season.npy"), mmap_mode='r')
+        self.labels = {t: np.load(os.path.join(path, f"{t}.npy"), mmap_mode='r') for t in self.meta['classes']}
+
+    def __len__(self):
+        return len(self.X)
+
+    def encoder(self, target):
+        """The encoder a model trained on this matrix for target uses."""
+        return CategoryEncoder(self.categories, self.meta['classes'][target])
+
+    def check_encoder(self, encoder, target):
+        """Raises if encoder's codes differ from the ones X and the labels were written with."""
+        if encoder.categories != self.categories or encoder.classes != self.meta['classes'].get(target):
+            raise ValueError(f"{self.path} uses other category codes than this model; "
+                             f"re-export it with --model")
+
+def fit_matrix_encoder(seasons, targets):
+    """Category codes and per-target classes from one scan of the narrow columns."""
+    id_features = [c for c in CAT_FEATURES if c not in ('pitcher_style', 'prev_pitch_type')]
+    uniques = {col: [] for col in id_features + targets}
+    for batch in scan_batches(INPUT_DIR, columns=id_features + targets, seasons=seasons):
+        block = apply_schema(batch.to_pandas(), numeric=False)
+        for col in uniques:
+            uniques[col].append(pd.unique(block[col].dropna().to_numpy()))
+    values = {col: np.concatenate(parts) if parts else np.array([]) for col, parts in uniques.items()}
+    encoder = CategoryEncoder.fit(values, CAT_FEATURES)
+    classes = {t: CategoryEncoder.fit(values, [], target=t).classes for t in targets}
+    return encoder, classes
+
+def export_matrix(path=MATRIX_DIR, seasons=TRAIN_SEASONS, targets=TARGET_COLUMNS, model_file=None):
+    """
+    Streams final_data into a feature matrix at path. With model_file, the
+    model's own encoder is used (so the model can be scored on the matrix)
+    and targets must be the single target it predicts.
+    """
+    if model_file:
+        if len(targets) != 1:
+            raise ValueError("--model exports exactly one --target")
+        encoder = CategoryEncoder.load(encoder_path(model_file))
+        classes = {targets[0]: encoder.classes}
+    else:
+        print("Scanning categories and labels...")
+        with stage("Scanning categories and labels"):
+            encoder, classes = fit_matrix_encoder(seasons, targets)
+    label_encoders = {t: CategoryEncoder({}, classes[t]) for t in targets}
+    n_rows = open_dataset(INPUT_DIR).count_rows(filter=build_filter(seasons))
+
+    # Written next to the old matrix and swapped in at the end, so readers
+    # never map a half-written file (open maps of the old one stay valid)
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    X = np.lib.format.open_memmap(os.path.join(tmp, "X.npy"), mode='w+', dtype=np.float32,
+                                  shape=(n_rows, len(FEATURES)))
+    pitchers = np.lib.format.open_memmap(os.path.join(tmp, "pitcher.npy"), mode='w+', dtype=np.int32,
+                                         shape=(n_rows,))
+    seasons_out = np.lib.format.open_memmap(os.path.join(tmp, "season.npy"), mode='w+', dtype=np.int16,
+                                            shape=(n_rows,))
+    labels = {t: np.lib.format.open_memmap(os.path.join(tmp, f"{t}.npy"), mode='w+', dtype=np.int32,
+                                           shape=(n_rows,)) for t in targets}
+
+    print(f"Encoding {n_rows} rows into {path}/...")
+    with stage("Exporting feature matrix", rows_in=n_rows) as s:
+        pos = 0
+        columns = list(dict.fromkeys(FEATURES + targets + ['season']))
+        for batch in scan_batches(INPUT_DIR, columns=columns, seasons=seasons):
+            df = apply_schema(batch.to_pandas(), numeric=False)
+            end = pos + len(df)
+            X[pos:end] = encoder.transform(df, FEATURES)
+            pitchers[pos:end] = df['pitcher'].to_numpy()
+            seasons_out[pos:end] = df['season'].to_numpy()
+            for t in targets:
+                labels[t][pos:end] = label_encoders[t].encode_classes(df[t])
+            pos = end
+        s.rows_out = pos
+    for array in [X, pitchers, seasons_out, *labels.values()]:
+        array.flush()
+    del X, pitchers, seasons_out, labels
+
+    CategoryEncoder(encoder.categories).save(os.path.join(tmp, "encoder.json"))
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({'features': FEATURES, 'seasons': seasons, 'rows': n_rows, 'classes': classes,
+                   'model_file': model_file}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    print(f"Saved feature matrix ({n_rows} x {len(FEATURES)}) to {path}/")
+
+def train_from_matrix(target='zone', params=None, path=MATRIX_DIR):
+    """
+    Trains one model on the mapped matrix. The full matrix is binned once and
+    split into train / valid with Dataset.subset, so rows are never gathered
+    into new arrays.
+    """
+    matrix = FeatureMatrix(path)
+    encoder = matrix.encoder(target)
+    y = matrix.labels[target]
+    config = TARGETS[target]
+
+    weights = None
+    is_valid = np.random.default_rng(SPLIT_SEED).random(len(matrix)) < VALID_FRACTION
+    if config['balanced']:
+        # class_weight='balanced' over the train rows; the valid rows get the same weights
+        counts = np.bincount(y[~is_valid], minlength=len(encoder.classes))
+        class_weight = counts.sum() / (len(encoder.classes) * np.maximum(counts, 1))
+        weights = class_weight[y]
+
+    full = lgb.Dataset(matrix.X, label=y, weight=weights, feature_name=FEATURES,
+                       categorical_feature=CAT_FEATURES, params=DATASET_PARAMS)
+    train = full.subset(np.flatnonzero(~is_valid))
+    valid = full.subset(np.flatnonzero(is_valid))
+
+    params = {**config['params'], 'num_class': len(encoder.classes), **(params or {})}
+    print(f"\n--- Training {target} model from {path} ---")
+    with stage(f"Training {target} model", rows_in=len(matrix)):
+        booster = lgb.train(params, train, num_boost_round=config['rounds'], valid_sets=[valid],
+                            callbacks=[lgb.early_stopping(stopping_rounds=50), lgb.log_evaluation(period=100)])
+    booster.save_model(config['model_file'])
+    encoder.save(encoder_path(config['model_file']))
+    print(f"Saved {config['model_file']}")
+    return booster
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or train from the memory-mapped feature matrix.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help=f"encode {INPUT_DIR}/ into {MATRIX_DIR}/")
+    export.add_argument("--model", help="reuse this model's category codes (to score it on the matrix)")
+    export.add_argument("--target", choices=TARGET_COLUMNS, help="only this target's labels")
+    train = sub.add_parser("train", help="train a model from the matrix")
+    train.add_argument("--target", choices=list(TARGETS), default="zone")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_matrix(targets=[args.target] if args.target else TARGET_COLUMNS, model_file=args.model)
+    else:
+        train_from_matrix(args.target)
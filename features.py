@@ -0,0 +1,454 @@
+import os
+import glob
+import inspect
+import types
+import numpy as np
+import pandas as pd
+from schema import as_category, enforce
+from archetypes import classify_pitchers, weighted_median
+from rolling import grouped_window_means
+from profiling import stage
+from digests import digest, file_digest
+
+# --- FEATURE DAG ---
+# Every pitch feature is declared ONCE below as a node: the columns it reads,
+# the columns it writes and how to compute them. build_features() plans the
+# nodes a set of target columns needs into passes (a pass holds every node
+# whose inputs exist after the previous passes) and runs each pass over the
+# same frame, so the data is sorted once and columns are added in place:
+#   - Shift nodes on the same group key share one groupby
+#   - Window nodes share one grouped_window_means call (rolling.py)
+#
+# With a base key (see load_base), every node's output is cached under
+# CACHE_DIR (as lz4 Feather files, cheap to write and read) by a content hash of the node's code and of the keys of its inputs.
+# The code hash follows every function the node calls, in any module, and the
+# constants they read (including dicts and registries such as
+# archetypes.CLASSIFIERS), so editing a feature, a helper or a constant changes
+# its key and the keys of every node that reads its output; only those are
+# recomputed and everything else is read from cache. VERSION is only for
+# changes to the cache format itself.
+#
+# HISTORY: the same nodes compute the features of new pitches only
+# (incremental.py) when given the state of the pitches before them, by node:
+#   pitcher_dna                pitcher_counts() of the earlier pitches
+#   batter_weak_zone           zone_counts() of the earlier whiffs
+#   batter_rolling_whiff_rate  the last WINDOW_SIZE (batter, is_whiff) rows of every batter
+#   pitcher_ff_usage           'count' and 'sum' of is_ff per pitcher
+
+CACHE_DIR = "feature_cache"
+VERSION = 1
+PITCH_KEY = ['game_pk', 'at_bat_number', 'pitch_number']
+AT_BAT = ['game_pk', 'at_bat_number']
+RUNNER_COLS = ['on_1b', 'on_2b', 'on_3b']
+HANDEDNESS = {'R': 0, 'L': 1, 'top': 0, 'bot': 1}
+HANDEDNESS_COLS = ['stand', 'p_throws', 'inning_topbot']
+WINDOW_SIZE = 100  # Number of pitches for batter rolling metrics
+ARCHETYPE_CLASSIFIER = "velo_spin"  # See archetypes.CLASSIFIERS
+WHIFFS = ['swinging_strike', 'swinging_strike_blocked']
+
+# 1. NODE TYPES
+class Node:
+    fuse_key = None  # Nodes of one pass with the same fuse key run as one call
+
+    def __init__(self, name, inputs, outputs, keep=True):
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.keep = keep  # False for helper columns dropped from the result
+
+    def signature(self):
+        """What the node computes; any change here (or in what run() calls) changes its cache key."""
+        return digest(inspect.getsource(type(self)), _code_signature(type(self).run))
+
+def _global_names(code):
+    """Global names read by a code object and the functions / lambdas nested in it."""
+    names = list(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names += _global_names(const)
+    return names
+
+def _value_signature(value, seen):
+    """Hashable description of a global: constants by value, functions by code (None for modules, classes...)."""
+    if isinstance(value, types.FunctionType):
+        return value.__qualname__ if value in seen else _code_signature(value, seen)
+    if isinstance(value, dict):
+        return digest(*(f"{k!r}:{_value_signature(v, seen)}" for k, v in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = sorted(value, key=repr) if isinstance(value, (set, frozenset)) else value
+        return digest(type(value).__name__, *(_value_signature(v, seen) for v in items))
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return repr(value)
+    return None
+
+def _code_signature(func, seen=None):
+    """
+    Source of func plus the constants (including dicts such as HANDEDNESS or a
+    registry of functions) and functions it refers to, recursively and across
+    modules, so editing WHIFFS, a classifier or a helper invalidates the node too.
+    """
+    seen = set() if seen is None else seen
+    seen.add(func)
+    try:
+        parts = [inspect.getsource(func)]
+    except (OSError, TypeError):  # Defined interactively: hash the bytecode instead
+        parts = [func.__code__.co_code.hex(), repr(func.__code__.co_consts)]
+    for name in dict.fromkeys(_global_names(func.__code__)):
+        if name in func.__globals__:
+            value = _value_signature(func.__globals__[name], seen)
+            if value is not None:
+                parts.append(f"{name}={value}")
+    return digest(*parts)
+
+class Feature(Node):
+    """
+    func(df) -> {column: values} (or the values, for a single output).
+    With history=True, func(df, prior) also gets the node's prior state (see HISTORY).
+    """
+    def __init__(self, name, func, inputs, outputs=None, keep=True, history=False):
+        super().__init__(name, inputs, outputs or [name], keep)
+        self.func = func
+        self.history = history
+
+    def signature(self):
+        return digest(super().signature(), _code_signature(self.func))
+
+    @staticmethod
+    def run(nodes, df, history=None):
+        out = {}
+        for node in nodes:
+            if node.history and history is not None:
+                values = node.func(df, history.get(node.name))
+            else:
+                values = node.func(df)
+            out.update(values if isinstance(values, dict) else {node.outputs[0]: values})
+        return out
+
+class Shift(Node):
+    """Previous value of col within each `by` group, first rows filled."""
+    def __init__(self, name, col, by, fill, category=None):
+        super().__init__(name, [col] + by, [name])
+        self.col, self.by, self.fill, self.category = col, by, fill, category
+        self.fuse_key = ('shift',) + tuple(by)
+
+    def signature(self):
+        return digest(super().signature(), self.col, self.by, self.fill, self.category)
+
+    @staticmethod
+    def run(nodes, df, history=None):
+        cols = list(dict.fromkeys(node.col for node in nodes))
+        shifted = df.groupby(nodes[0].by, sort=False, observed=True)[cols].shift(1)
+        out = {}
+        for node in nodes:
+            values = shifted[node.col]
+            if node.category:
+                values = pd.Series(as_category(values, node.category), index=values.index)
+            out[node.name] = values.fillna(node.fill).array
+        return out
+
+class Window(Node):
+    """Grouped rolling (or expanding, window=None) mean, gaps filled with fill."""
+    fuse_key = ('window',)
+
+    def __init__(self, name, col, by, window, min_periods, fill, closed='right'):
+        super().__init__(name, [col, by], [name])
+        self.spec = dict(by=by, col=col, window=window, min_periods=min_periods, closed=closed)
+        self.fill = fill
+
+    def signature(self):
+        return digest(super().signature(), sorted(self.spec.items()), self.fill)
+
+    def continued(self, prior, df):
+        """Means of df's rows continuing every group's window from the rows before df (prior, see HISTORY)."""
+        by, col = self.spec['by'], self.spec['col']
+        if self.spec['window'] is None:
+            # Expanding: the count and sum of every group so far offset each row's window
+            totals = prior.reindex(df[by].to_numpy()).fillna(0)
+            spec = dict(self.spec, prior_count=totals['count'].to_numpy(), prior_sum=totals['sum'].to_numpy())
+            return grouped_window_means(df, {self.name: spec})[self.name]
+        # Rolling: the last rows of every group are replayed in front of df
+        prior = prior.loc[prior[by].isin(df[by].unique()), [by, col]]
+        frame = pd.concat([prior, df[[by, col]]], ignore_index=True)
+        return grouped_window_means(frame, {self.name: self.spec})[self.name][len(prior):]
+
+    @staticmethod
+    def run(nodes, df, history=None):
+        history = history or {}
+        rolled = grouped_window_means(df, {node.name: node.spec for node in nodes if node.name not in history})
+        rolled.update({node.name: node.continued(history[node.name], df) for node in nodes if node.name in history})
+        return {node.name: np.where(np.isnan(rolled[node.name]), node.fill, rolled[node.name]) for node in nodes}
+
+# 2. FEATURE FUNCTIONS
+def runner_flags(df):
+    # Statcast uses Player IDs. We want 1 (runner present) or 0 (base empty).
+    return {col: df[col].notna().astype(int).to_numpy() for col in RUNNER_COLS}
+
+def handedness(df):
+    # Models prefer numbers (0/1) over strings ('R'/'L')
+    return {col: df[col].map(HANDEDNESS).to_numpy() for col in HANDEDNESS_COLS}
+
+def is_whiff(df):
+    return df['description'].isin(WHIFFS).astype(int).to_numpy()
+
+def is_ff(df):
+    # Fastball Usage - Identifying if they are a "one-trick" pitcher
+    return (df['pitch_type'] == 'FF').astype(int).to_numpy()
+
+def pitcher_counts(df):
+    """
+    Per-pitcher accumulators in one bincount pass: pitches and velo / spin sums
+    and counts, indexed by pitcher ID (they add up across frames).
+    """
+    codes, ids = pd.factorize(df['pitcher'], sort=True)
+    counts = {'pitches': np.bincount(codes, minlength=len(ids))}
+    for src, name in [('release_speed', 'velo'), ('release_spin_rate', 'spin')]:
+        values = df[src].to_numpy(np.float64)
+        valid = ~np.isnan(values)
+        counts[f'{name}_sum'] = np.bincount(codes[valid], weights=values[valid], minlength=len(ids))
+        counts[f'{name}_n'] = np.bincount(codes[valid], minlength=len(ids))
+    return pd.DataFrame(counts, index=pd.Index(ids, name='pitcher'))
+
+def pitcher_profiles_from_counts(counts):
+    """Average velo / spin (league-median filled) and pitcher_style from the accumulators."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        profiles = pd.DataFrame({
+            'pitcher_avg_velo': counts['velo_sum'] / counts['velo_n'].replace(0, np.nan),
+            'pitcher_avg_spin': counts['spin_sum'] / counts['spin_n'].replace(0, np.nan),
+            'pitches': counts['pitches'],
+        })
+    # Fill missing averages with league medians so the model doesn't crash
+    # (weighted by pitches, i.e. the median over every row of the dataset)
+    for col in ['pitcher_avg_velo', 'pitcher_avg_spin']:
+        profiles[col] = profiles[col].fillna(weighted_median(profiles[col], profiles['pitches']))
+    # Power vs. Crafty, classified once per pitcher
+    profiles['pitcher_style'] = classify_pitchers(profiles, ARCHETYPE_CLASSIFIER)
+    return profiles
+
+def pitcher_dna(df, prior=None):
+    """
+    Season-long pitcher 'stuff' (average velo / spin) and archetype, per row.
+    prior: pitcher_counts of the pitches before df (incremental updates).
+    """
+    counts = pitcher_counts(df)
+    if prior is not None:
+        counts = prior[counts.columns].add(counts, fill_value=0)
+    profiles = pitcher_profiles_from_counts(counts)
+    # Profiles are built once per pitcher and attached by position (no merges)
+    pos = profiles.index.get_indexer(df['pitcher'])
+    style = profiles['pitcher_style']
+    return {
+        'pitcher_avg_velo': profiles['pitcher_avg_velo'].to_numpy()[pos],
+        'pitcher_avg_spin': profiles['pitcher_avg_spin'].to_numpy()[pos],
+        'pitcher_style': pd.Categorical.from_codes(style.cat.codes.to_numpy()[pos], dtype=style.dtype),
+    }
+
+def zone_counts(batters, zones, first_seq=0):
+    """
+    Whiff counts per (batter, zone) of whiffs given in order, and the order of
+    each pair's first whiff (numbered from first_seq).
+    """
+    whiffs = pd.DataFrame({'batter': batters, 'zone': zones, 'seq': first_seq + np.arange(len(batters))})
+    return whiffs.groupby(['batter', 'zone']).agg(whiffs=('seq', 'size'), first_seen=('seq', 'min'))
+
+def merge_zones(*tables):
+    """Adds up zone_counts tables (numbered in order) into one."""
+    return pd.concat(tables).groupby(level=['batter', 'zone']).agg(
+        whiffs=('whiffs', 'sum'), first_seen=('first_seen', 'min')
+    )
+
+def weak_zones(zones):
+    """Most-whiffed zone per batter; ties go to the zone whiffed first (like value_counts().index[0])."""
+    ranked = zones.reset_index().sort_values(['batter', 'whiffs', 'first_seen'], ascending=[True, False, True])
+    return ranked.drop_duplicates('batter').set_index('batter')['zone']
+
+def batter_weak_zone(df, prior=None, default=14):
+    """
+    The "Hunting" signal: the zone where the batter has the most swinging strikes.
+    prior: zone_counts of the whiffs before df (incremental updates).
+    """
+    whiffs = df['is_whiff'].to_numpy() == 1
+    first_seq = 0 if prior is None or prior.empty else prior['first_seen'].max() + 1
+    zones = zone_counts(df['batter'].to_numpy()[whiffs], df['zone'].to_numpy()[whiffs], first_seq)
+    if prior is not None:
+        zones = merge_zones(prior, zones)
+    weak = weak_zones(zones)
+    if weak.empty:
+        return np.full(len(df), default)
+    pos = weak.index.get_indexer(df['batter'])
+    return np.where(pos >= 0, weak.to_numpy()[pos], default)
+
+def score_diff(df):
+    return (df['home_score'] - df['away_score']).to_numpy()
+
+def is_late_inning(df):
+    # Pressure logic
+    return (df['inning'] >= 7).astype(int).to_numpy()
+
+# 3. THE NODES (in the column order of the final dataset)
+NODES = [
+    Feature('runner_flags', runner_flags, RUNNER_COLS, RUNNER_COLS),
+    Feature('handedness', handedness, HANDEDNESS_COLS, HANDEDNESS_COLS),
+    # The first pitch of every at-bat gets 'START' and zone 0
+    Shift('prev_pitch_type', 'pitch_type', AT_BAT, fill='START', category='prev_pitch_type'),
+    Shift('prev_zone', 'zone', AT_BAT, fill=0),
+    Feature('is_whiff', is_whiff, ['description'], keep=False),
+    Feature('is_ff', is_ff, ['pitch_type'], keep=False),
+    Feature('pitcher_dna', pitcher_dna, ['pitcher', 'release_speed', 'release_spin_rate'],
+            ['pitcher_avg_velo', 'pitcher_avg_spin', 'pitcher_style'], history=True),
+    # Rolling average of the last WINDOW_SIZE pitches seen by that batter
+    Window('batter_rolling_whiff_rate', 'is_whiff', 'batter', WINDOW_SIZE, min_periods=10, fill=0.25),
+    Feature('batter_weak_zone', batter_weak_zone, ['batter', 'zone', 'is_whiff'], history=True),
+    Feature('score_diff', score_diff, ['home_score', 'away_score']),
+    Feature('is_late_inning', is_late_inning, ['inning']),
+    Window('pitcher_ff_usage', 'is_ff', 'pitcher', None, min_periods=20, fill=0.35),
+]
+
+CLEANING_FEATURES = RUNNER_COLS + HANDEDNESS_COLS
+SEQUENCE_FEATURES = ['prev_pitch_type', 'prev_zone']
+MASTER_FEATURES = [col for node in NODES if node.keep for col in node.outputs
+                   if col not in CLEANING_FEATURES + SEQUENCE_FEATURES]
+
+# 4. PLANNING
+def producers(nodes=NODES):
+    return {col: node for node in nodes for col in node.outputs}
+
+def plan(targets, available, nodes=NODES):
+    """
+    The nodes needed for targets, grouped into passes. A column in available
+    is taken as given unless it is a target itself (e.g. 'stand' is mapped
+    in place by the handedness node).
+    """
+    made_by = producers(nodes)
+    needed, stack = set(), [made_by[col] for col in targets]
+    while stack:
+        node = stack.pop()
+        if node.name in needed:
+            continue
+        needed.add(node.name)
+        for col in node.inputs:
+            source = made_by.get(col)
+            if source is not None and source is not node and col not in available:
+                stack.append(source)
+
+    passes, done = [], set(available)
+    todo = [node for node in nodes if node.name in needed]
+    while todo:
+        ready = [node for node in todo
+                 if all(col in done or made_by.get(col) is node for col in node.inputs)]
+        if not ready:
+            raise ValueError(f"Unresolvable inputs for {[node.name for node in todo]}")
+        passes.append(ready)
+        done.update(col for node in ready for col in node.outputs)
+        todo = [node for node in todo if node not in ready]
+    return passes
+
+def _fused(nodes):
+    """Splits a pass into the groups that run as one call."""
+    groups = {}
+    for node in nodes:
+        groups.setdefault(node.fuse_key or ('single', node.name), []).append(node)
+    return list(groups.values())
+
+# 5. CACHE
+def _cache_file(node, key, cache_dir):
+    return os.path.join(cache_dir, f"{node.name}-{key[:16]}.feather")
+
+def _prune(node, keep_file, cache_dir):
+    """Removes the outdated cache files of a node."""
+    for path in glob.glob(os.path.join(cache_dir, f"{node.name}-*.feather")):
+        if path != keep_file:
+            os.remove(path)
+
+def node_keys(passes, base_key, columns):
+    """Cache key of every planned node, chained from the keys of its inputs."""
+    col_keys = {col: digest(base_key, col) for col in columns}
+    keys = {}
+    for nodes in passes:
+        for node in nodes:
+            keys[node.name] = digest(VERSION, node.signature(), [col_keys[col] for col in node.inputs])
+        for node in nodes:
+            col_keys.update({col: digest(keys[node.name], col) for col in node.outputs})
+    return keys
+
+# 6. EXECUTION
+def build_features(df, targets=None, base_key=None, cache_dir=CACHE_DIR, history=None):
+    """
+    Adds the target columns (default: every kept feature) to df in place and
+    returns it. Helper columns are dropped again. Pass base_key (from
+    load_base) and a cache_dir to read and write the node cache, or the
+    history of the pitches before df (see HISTORY) to continue from it.
+    """
+    targets = targets or CLEANING_FEATURES + SEQUENCE_FEATURES + MASTER_FEATURES
+    given = set(df.columns)
+    passes = plan(targets, given)
+    keys = node_keys(passes, base_key, df.columns) if base_key and cache_dir and history is None else {}
+    if keys:
+        os.makedirs(cache_dir, exist_ok=True)
+    added = []
+
+    for i, nodes in enumerate(passes):
+        names = ", ".join(node.name for node in nodes)
+        with stage(f"Feature pass {i + 1}: {names}", rows_in=len(df)):
+            todo = []
+            for node in nodes:
+                path = _cache_file(node, keys[node.name], cache_dir) if keys else None
+                if path and os.path.exists(path):
+                    print(f"  [cache] {node.name}")
+                    cached = pd.read_feather(path)
+                    for col in node.outputs:
+                        df[col] = cached[col].array
+                else:
+                    todo.append(node)
+
+            for group in _fused(todo):
+                print(f"  Computing {', '.join(node.name for node in group)}...")
+                out = type(group[0]).run(group, df, history)
+                for node in group:
+                    for col in node.outputs:
+                        df[col] = out[col]
+                    if keys:
+                        path = _cache_file(node, keys[node.name], cache_dir)
+                        pd.DataFrame({col: df[col] for col in node.outputs}).to_feather(path)
+                        _prune(node, path, cache_dir)
+            added += [col for node in nodes for col in node.outputs if col not in added]
+
+    helpers = [col for col in added if col not in targets]
+    if helpers:
+        df.drop(columns=helpers, inplace=True)
+    # New columns in declaration order, whichever pass computed them
+    declared = [col for node in NODES for col in node.outputs if col in df.columns and col not in given]
+    order = [col for col in df.columns if col not in declared] + declared
+    return df if order == list(df.columns) else df[order]
+
+# 7. BASE FRAME
+def clean_base(df):
+    """
+    Drops pitches without a type or zone and duplicate pitches, and sorts
+    chronologically, with ONE row gather. Returns a new frame with a fresh index.
+    """
+    keep = np.flatnonzero(df['pitch_type'].notna().to_numpy() & df['zone'].notna().to_numpy())
+    keep = keep[~df[PITCH_KEY].iloc[keep].duplicated().to_numpy()]
+    # Dates are parsed once per distinct day, not once per pitch
+    day_codes, days = pd.factorize(df['game_date'].to_numpy()[keep])
+    dates = pd.to_datetime(days).to_numpy()[day_codes]
+    # Chronological sorting (stable) by game_date, at_bat_number, pitch_number,
+    # necessary for rolling statistics to be accurate
+    order = np.lexsort((df['pitch_number'].to_numpy()[keep], df['at_bat_number'].to_numpy()[keep], dates))
+    rows = keep[order]
+    df = df.take(rows).reset_index(drop=True)
+    df['game_date'] = dates[order]
+    return df
+
+def load_base(files):
+    """
+    Reads, cleans and sorts the raw yearly files. Returns (frame, base key),
+    the key being a content hash of the files and of the reading / cleaning
+    code, keyed like the nodes (so clean_base, schema.enforce and the schema's
+    category lists and integer widths are part of it).
+    """
+    key = digest(VERSION, _code_signature(load_base), sorted(file_digest(f) for f in files))
+    df_list = []
+    for f in sorted(files):
+        print(f"Reading: {os.path.basename(f)}")
+        df_list.append(enforce(pd.read_parquet(f), f"read {os.path.basename(f)}"))
+    return clean_base(pd.concat(df_list, ignore_index=True)), key
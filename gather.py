@@ -1,9 +1,19 @@
 import os
 import time
+import json
+import random
+import argparse
+import threading
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import datetime
 import glob
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pybaseball import statcast, cache
+from schema import apply_schema
+from profiling import stage
 
 # Enable local caching to speed up retries
 cache.enable()
@@ -11,6 +21,13 @@ cache.enable()
 # Configuration
 RAW_CHUNKS_DIR = "statcast_chunks"
 YEARLY_DIR = "statcast_yearly"
+MANIFEST_FILE = os.path.join(RAW_CHUNKS_DIR, "manifest.json")
+MAX_WORKERS = 4           # Concurrent chunk downloads in parallel mode
+REQUESTS_PER_SECOND = 1.0 # Shared across all workers (token bucket refill rate)
+BURST = 2                 # Token bucket capacity
+BACKOFF_BASE = 2.0        # Seconds before the first retry, doubled each attempt
+BACKOFF_MAX = 60.0
+EMPTY_MARGIN_DAYS = 3     # An empty window is final only if it ended this long before it was fetched
 os.makedirs(RAW_CHUNKS_DIR, exist_ok=True)
 os.makedirs(YEARLY_DIR, exist_ok=True)
 
@@ -22,46 +39,258 @@ USE_COLS = [
     "events", "description","release_speed","release_spin_rate",""
 ]
 
-def safe_statcast(start_dt, end_dt, retries=3):
-    """Downloads data with a retry mechanism."""
+# Explicit raw dtypes so every row group of the yearly Parquet file shares one
+# schema. String columns become the fixed categoricals from schema.py.
+CHUNK_DTYPES = {
+    "pitch_type": "str", "pitch_name": "str", "batter": "int32", "pitcher": "int32",
+    "stand": "str", "p_throws": "str", "balls": "float32", "strikes": "float32",
+    "outs_when_up": "float32", "inning": "float32", "inning_topbot": "str",
+    "game_pk": "int32", "game_date": "str", "at_bat_number": "int16", "pitch_number": "int16",
+    "zone": "float32", "home_score": "float32", "away_score": "float32",
+    "on_1b": "float32", "on_2b": "float32", "on_3b": "float32",
+    "events": "str", "description": "str",
+    "release_speed": "float32", "release_spin_rate": "float32",
+}
+SORT_COLS = ['game_date', 'game_pk', 'at_bat_number', 'pitch_number']
+ROW_GROUP_ROWS = 128_000
+
+class TokenBucket:
+    """Thread-safe token bucket so all download workers share one request budget."""
+
+    def __init__(self, rate=REQUESTS_PER_SECOND, capacity=BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def backoff_delay(attempt):
+    """Exponential backoff with jitter: ~2s, 4s, 8s... capped at BACKOFF_MAX."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+def fetch_range(start_dt, end_dt, retries=3, limiter=None):
+    """
+    Downloads start_dt..end_dt in one request (paced by the limiter) with a
+    retry mechanism. Returns the (possibly empty) frame, or None if every attempt raised.
+    """
     for attempt in range(1, retries + 1):
+        if limiter is not None:
+            limiter.acquire()
         try:
-            df = statcast(start_dt=start_dt, end_dt=end_dt, verbose=False)
-            if df is not None and not df.empty:
-                return df
+            df = statcast(start_dt=start_dt, end_dt=end_dt, verbose=False, parallel=False)
+            return pd.DataFrame() if df is None else df
         except Exception as e:
-            print(f"  Attempt {attempt} failed: {e}")
-            time.sleep(5)
+            print(f"  {start_dt} to {end_dt}: attempt {attempt} failed: {e}")
+            if attempt < retries:
+                time.sleep(backoff_delay(attempt))
     return None
 
-def download_all_data(start_year=2015, end_year=2024):
+def safe_statcast(start_dt, end_dt, retries=3, limiter=None):
+    """
+    Downloads a window in one request. Only if that keeps failing is it
+    fetched again day by day (smaller requests, each paced by the limiter).
+    Returns the (possibly empty) frame, or None if a day still failed.
+    """
+    df = fetch_range(start_dt, end_dt, retries, limiter)
+    if df is not None or start_dt == end_dt:
+        return df
+
+    print(f"  {start_dt} to {end_dt}: falling back to one request per day")
+    day = datetime.date.fromisoformat(start_dt)
+    end = datetime.date.fromisoformat(end_dt)
+    frames = []
+    while day <= end:
+        df = fetch_range(day.strftime('%Y-%m-%d'), day.strftime('%Y-%m-%d'), retries, limiter)
+        if df is None:
+            return None
+        if not df.empty:
+            frames.append(df)
+        day += datetime.timedelta(days=1)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def season_windows(year, days=5):
+    """Yields the (start, end) date strings of every download window in a season."""
+    current_date = datetime.date(year, 3, 25)
+    season_end = datetime.date(year, 11, 5)
+
+    while current_date <= season_end:
+        window_end = min(current_date + datetime.timedelta(days=days), season_end)
+        yield current_date.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')
+        current_date = window_end + datetime.timedelta(days=1)
+
+def chunk_path(s_str, e_str):
+    return f"{RAW_CHUNKS_DIR}/sc_{s_str}_{e_str}.csv"
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE) as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    # Write to a temp file first so a crash never leaves a half-written manifest
+    tmp_path = MANIFEST_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+def settled_empty(entry, e_str):
+    """
+    True if the manifest entry records the window as empty after its games
+    were over. Windows fetched before (or just after) they ended may still
+    fill up (a current season), so they are retried.
+    """
+    if entry.get("status") != "empty" or "updated" not in entry:
+        return False
+    fetched = datetime.date.fromisoformat(entry["updated"][:10])
+    return datetime.date.fromisoformat(e_str) < fetched - datetime.timedelta(days=EMPTY_MARGIN_DAYS)
+
+def download_chunk(s_str, e_str, limiter=None):
+    """Fetches one window, saves it and returns its manifest entry."""
+    filename = chunk_path(s_str, e_str)
+    start = time.perf_counter()
+    df_chunk = safe_statcast(s_str, e_str, limiter=limiter)
+
+    if df_chunk is None:
+        status, rows = "failed", 0
+    elif df_chunk.empty:
+        status, rows = "empty", 0
+    else:
+        cols_to_save = [c for c in USE_COLS if c in df_chunk.columns]
+        # Write then rename so an interrupted run never leaves a partial chunk behind
+        df_chunk[cols_to_save].to_csv(filename + ".tmp", index=False)
+        os.replace(filename + ".tmp", filename)
+        status, rows = "ok", len(df_chunk)
+
+    return {
+        "start": s_str, "end": e_str, "status": status, "rows": rows,
+        "elapsed_s": round(time.perf_counter() - start, 2),
+        "updated": datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+
+def download_all_data(start_year=2015, end_year=2024, workers=1, rate=REQUESTS_PER_SECOND):
+    """
+    Downloads every 5-day window between start_year and end_year.
+    Chunks already on disk (or recorded as empty well after the window ended)
+    are skipped, so a rerun only retries the windows that failed or could
+    still get games.
+    """
+    manifest = load_manifest()
+    limiter = TokenBucket(rate=rate, capacity=max(BURST, workers))
+
+    pending = []
     for year in range(start_year, end_year + 1):
         print(f"\n>>> STARTING DOWNLOAD FOR {year}")
-        current_date = datetime.date(year, 3, 25)
-        season_end = datetime.date(year, 11, 5)
+        for s_str, e_str in season_windows(year):
+            filename = chunk_path(s_str, e_str)
+            entry = manifest.get(os.path.basename(filename), {})
+            if os.path.exists(filename) or settled_empty(entry, e_str):
+                continue
+            pending.append((s_str, e_str))
 
-        while current_date <= season_end:
-            window_end = min(current_date + datetime.timedelta(days=5), season_end)
-            
-            s_str = current_date.strftime('%Y-%m-%d')
-            e_str = window_end.strftime('%Y-%m-%d')
-            filename = f"{RAW_CHUNKS_DIR}/sc_{s_str}_{e_str}.csv"
+    print(f"{len(pending)} windows to fetch with {workers} worker(s)...")
+    # Every request (a window, or a day when a window falls back) goes through
+    # the shared limiter, so rate bounds requests across all workers
+    with stage("Downloading chunks") as s, ThreadPoolExecutor(max_workers=workers) as pool:
+        s.rows_out = 0
+        futures = {
+            pool.submit(download_chunk, s_str, e_str, limiter): (s_str, e_str)
+            for s_str, e_str in pending
+        }
+        for future in as_completed(futures):
+            s_str, e_str = futures[future]
+            entry = future.result()
+            manifest[os.path.basename(chunk_path(s_str, e_str))] = entry
+            save_manifest(manifest)
+
+            if entry["status"] == "ok":
+                s.rows_out += entry['rows']
+                print(f"Fetched {s_str} to {e_str} | Rows: {entry['rows']} | {entry['elapsed_s']}s")
+            elif entry["status"] == "empty":
+                print(f"  Warning: No data for {s_str}")
+            else:
+                print(f"  Error: {s_str} to {e_str} failed, will retry on next run")
+
+    # Only this run's windows (the manifest also holds other years and earlier runs)
+    failed = [w for w in pending if manifest[os.path.basename(chunk_path(*w))]["status"] == "failed"]
+    if failed:
+        print(f"{len(failed)} windows failed. Rerun to retry them.")
+
+def pitch_keys(df):
+    """Packs (game_pk, at_bat_number, pitch_number) into one int64 per pitch."""
+    return (
+        (df['game_pk'].to_numpy(np.int64) << 20)
+        | (df['at_bat_number'].to_numpy(np.int64) << 8)
+        | df['pitch_number'].to_numpy(np.int64)
+    )
+
+def read_chunk(path):
+    """Reads one chunk CSV with the fixed USE_COLS schema."""
+    df = pd.read_csv(path, usecols=lambda c: c in CHUNK_DTYPES, dtype=CHUNK_DTYPES)
+    # Older seasons are missing a few columns; add them so the schema never changes
+    for col, dtype in CHUNK_DTYPES.items():
+        if col not in df.columns:
+            df[col] = pd.Series(index=df.index, dtype=dtype)
+    return apply_schema(df[list(CHUNK_DTYPES)], numeric=False)
+
+def combine_year(year_files, output_path):
+    """
+    Streams a season's chunks into one sorted Parquet file.
+    Only one chunk (plus a row group buffer and the sorted pitch key index)
+    is held in memory at a time. Windows never overlap, so sorting each chunk
+    and writing them in date order yields a globally sorted file.
+    """
+    schema = pa.Schema.from_pandas(read_chunk(year_files[0]).iloc[:0], preserve_index=False)
+    seen = np.empty(0, dtype=np.int64)
+    last_date = ""
+    buffer, buffered = [], 0
+    total = 0
 
-            if os.path.exists(filename):
-                current_date = window_end + datetime.timedelta(days=1)
+    with pq.ParquetWriter(output_path + ".tmp", schema, compression="snappy") as writer:
+        for path in sorted(year_files):
+            df = read_chunk(path)
+
+            # Drop pitches already seen in this chunk or an earlier one
+            keys = pitch_keys(df)
+            _, first_idx = np.unique(keys, return_index=True)
+            first_idx.sort()
+            keep = first_idx[~np.isin(keys[first_idx], seen, assume_unique=True)]
+            df = df.iloc[keep]
+            seen = np.union1d(seen, keys[keep])
+            if df.empty:
                 continue
 
-            print(f"Fetching {s_str} to {e_str}...")
-            df_chunk = safe_statcast(s_str, e_str)
+            df = df.sort_values(SORT_COLS)
+            if df['game_date'].iloc[0] < last_date:
+                raise ValueError(f"{path} overlaps an earlier chunk; cannot stream a sorted season")
+            last_date = df['game_date'].iloc[-1]
 
-            if df_chunk is not None and not df_chunk.empty:
-                cols_to_save = [c for c in USE_COLS if c in df_chunk.columns]
-                df_chunk[cols_to_save].to_csv(filename, index=False)
-            else:
-                print(f"  Warning: No data for {s_str}")
+            buffer.append(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            buffered += len(df)
+            if buffered >= ROW_GROUP_ROWS:
+                writer.write_table(pa.concat_tables(buffer), row_group_size=ROW_GROUP_ROWS)
+                total += buffered
+                buffer, buffered = [], 0
+
+        if buffer:
+            writer.write_table(pa.concat_tables(buffer), row_group_size=ROW_GROUP_ROWS)
+            total += buffered
 
-            current_date = window_end + datetime.timedelta(days=1)
-            time.sleep(1) 
+    os.replace(output_path + ".tmp", output_path)
+    return total
 
 def combine_into_years(start_year=2015, end_year=2024):
     print("\n>>> COMBINING CHUNKS INTO YEARLY FILES")
@@ -74,16 +303,18 @@ def combine_into_years(start_year=2015, end_year=2024):
             
         print(f"Combining {year} ({len(year_files)} chunks)...")
         
-        yearly_df = pd.concat((pd.read_csv(f) for f in year_files), ignore_index=True)
-        
-        yearly_df = yearly_df.drop_duplicates(subset=['game_pk', 'at_bat_number', 'pitch_number'])
-        
-        yearly_df = yearly_df.sort_values(['game_date', 'game_pk', 'at_bat_number', 'pitch_number'])
-        
-        output_path = f"{YEARLY_DIR}/statcast_{year}.csv"
-        yearly_df.to_csv(output_path, index=False)
-        print(f"Saved {output_path} | Rows: {len(yearly_df)}")
+        output_path = f"{YEARLY_DIR}/statcast_{year}.parquet"
+        with stage(f"Combining {year}") as s:
+            rows = s.rows_out = combine_year(year_files, output_path)
+        print(f"Saved {output_path} | Rows: {rows}")
 
 if __name__ == "__main__":
-    download_all_data()
-    combine_into_years()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Download Statcast chunks and combine them by season.")
+    parser.add_argument("--start-year", type=int, default=2015)
+    parser.add_argument("--end-year", type=int, default=2024)
+    parser.add_argument("--workers", type=int, default=1, help=f"concurrent downloads (e.g. {MAX_WORKERS})")
+    parser.add_argument("--rate", type=float, default=REQUESTS_PER_SECOND, help="max requests per second")
+    args = parser.parse_args()
+
+    download_all_data(args.start_year, args.end_year, workers=args.workers, rate=args.rate)
+    combine_into_years(args.start_year, args.end_year)
\ No newline at end of file
@@ -0,0 +1,197 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from gather import read_chunk, SORT_COLS
+from master_process import OUTPUT_DIR, PARTITION_BY_MONTH, DATA_FOLDER, raw_files
+from features import (
+    WINDOW_SIZE, build_features, clean_base, load_base, is_whiff, is_ff,
+    pitcher_counts, zone_counts, merge_zones,
+)
+from schema import enforce
+from dataset import read_dataset, append_dataset
+
+# --- INCREMENTAL DAILY UPDATES ---
+# Instead of rebuilding the final_data dataset from every season, we keep the
+# per-player state the master features depend on:
+#   pitchers.parquet   pitch / FF counts and velo / spin sums per pitcher
+#   whiff_tail.parquet the last WINDOW_SIZE whiff flags of every batter
+#   zones.parquet      whiff counts per (batter, zone) + first-seen order
+# New pitches (e.g. last night's gather chunk) get their features from the
+# same feature nodes as a full build (features.py), with this state as their
+# history, and are appended to the dataset as new files, so an update costs
+# time proportional to the new rows and the number of players, not the history.
+#
+# Features of the NEW rows match a full rebuild over old + new data. Rows
+# already written keep the season-long averages they were built with.
+
+STATE_DIR = "feature_state"
+FLOAT_TOLERANCE = 1e-5
+
+def player_state(df, first_seq=0):
+    """The state of the pitches in df (whiffs numbered from first_seq)."""
+    whiffs = is_whiff(df)
+    hit = whiffs == 1
+    return {
+        'pitchers': pitcher_counts(df).assign(ff=pd.Series(is_ff(df)).groupby(df['pitcher'].to_numpy()).sum()),
+        'whiff_tail': pd.DataFrame({'batter': df['batter'].to_numpy(), 'is_whiff': whiffs.astype('int8')}),
+        'zones': zone_counts(df['batter'].to_numpy()[hit], df['zone'].to_numpy()[hit], first_seq),
+        'whiffs': int(hit.sum()),
+    }
+
+def build_state(df):
+    """Builds the per-player state from chronologically sorted pitches."""
+    new = player_state(df)
+    return {
+        'pitchers': new['pitchers'],
+        'whiff_tail': new['whiff_tail'].groupby('batter').tail(WINDOW_SIZE).reset_index(drop=True),
+        'zones': new['zones'],
+        'meta': {
+            'last_game_date': str(df['game_date'].max().date()),
+            'rows': len(df),
+            'whiff_seq': new['whiffs'],
+        },
+    }
+
+def advance_state(state, df):
+    """The state after the (later) pitches in df."""
+    meta = state['meta']
+    new = player_state(df, first_seq=meta['whiff_seq'])
+    tail = pd.concat([state['whiff_tail'], new['whiff_tail']], ignore_index=True)
+    return {
+        'pitchers': state['pitchers'].add(new['pitchers'], fill_value=0),
+        'whiff_tail': tail.groupby('batter').tail(WINDOW_SIZE).reset_index(drop=True),
+        'zones': merge_zones(state['zones'], new['zones']),
+        'meta': {
+            'last_game_date': str(df['game_date'].max().date()),
+            'rows': meta['rows'] + len(df),
+            'whiff_seq': meta['whiff_seq'] + new['whiffs'],
+        },
+    }
+
+def feature_history(state):
+    """The state as the history inputs of the stateful feature nodes (see features.py HISTORY)."""
+    pitchers = state['pitchers']
+    return {
+        'pitcher_dna': pitchers,
+        'batter_weak_zone': state['zones'],
+        'batter_rolling_whiff_rate': state['whiff_tail'],
+        'pitcher_ff_usage': pd.DataFrame({'count': pitchers['pitches'], 'sum': pitchers['ff']}),
+    }
+
+def save_state(state, state_dir=STATE_DIR):
+    os.makedirs(state_dir, exist_ok=True)
+    state['pitchers'].to_parquet(f"{state_dir}/pitchers.parquet")
+    state['whiff_tail'].to_parquet(f"{state_dir}/whiff_tail.parquet", index=False)
+    state['zones'].to_parquet(f"{state_dir}/zones.parquet")
+    with open(f"{state_dir}/meta.json", "w") as f:
+        json.dump(state['meta'], f, indent=1)
+
+def load_state(state_dir=STATE_DIR):
+    with open(f"{state_dir}/meta.json") as f:
+        meta = json.load(f)
+    return {
+        'pitchers': pd.read_parquet(f"{state_dir}/pitchers.parquet"),
+        'whiff_tail': pd.read_parquet(f"{state_dir}/whiff_tail.parquet"),
+        'zones': pd.read_parquet(f"{state_dir}/zones.parquet"),
+        'meta': meta,
+    }
+
+def update_features(raw, state):
+    """
+    Computes the master features for new raw pitches from the saved state.
+    Returns (features for the new rows, updated state). Pitches on or before
+    the last date already in the state are ignored.
+    """
+    meta = state['meta']
+    df = clean_base(raw)
+    df = df[df['game_date'] > pd.Timestamp(meta['last_game_date'])].reset_index(drop=True)
+    if df.empty:
+        print(" No new pitches after", meta['last_game_date'])
+        return df, state
+
+    # The feature nodes, continued from the players' state instead of their history
+    print(" Computing features from the saved player state...")
+    df = build_features(df, history=feature_history(state))
+    return enforce(df, "incremental update"), advance_state(state, df)
+
+def init_state(input_dir=OUTPUT_DIR, state_dir=STATE_DIR):
+    """Builds the state from a full master build."""
+    print(f" Building player state from {input_dir}/...")
+    columns = ['game_date', 'pitcher', 'batter', 'pitch_type', 'description', 'zone',
+               'release_speed', 'release_spin_rate']
+    df = read_dataset(input_dir, columns=columns)
+    # Files hold disjoint date ranges, so a stable sort by date restores build order
+    state = build_state(df.sort_values('game_date', kind='stable'))
+    save_state(state, state_dir)
+    print(f" State saved to {state_dir}/ (through {state['meta']['last_game_date']})")
+
+def run_update(chunk_files, state_dir=STATE_DIR):
+    """Appends the features of new gather chunks and advances the saved state."""
+    raw = pd.concat([read_chunk(f) for f in chunk_files], ignore_index=True)
+    # Same row order the yearly combiner produces
+    raw = raw.sort_values(SORT_COLS)
+    df, state = update_features(raw, load_state(state_dir))
+    if df.empty:
+        return
+
+    first, last = df['game_date'].min().date(), df['game_date'].max().date()
+    append_dataset(df, OUTPUT_DIR, by_month=PARTITION_BY_MONTH, name=f"update-{first}-{last}")
+    save_state(state, state_dir)
+    print(f" Appended {len(df)} new rows ({first} to {last}) to {OUTPUT_DIR}/")
+
+def verify_incremental(cutoff):
+    """
+    Checks that an incremental build matches a full rebuild: builds state from
+    the pitches before cutoff, updates it with the rest and compares the new
+    rows against a full rebuild over all pitches.
+    """
+    cutoff = pd.Timestamp(cutoff)
+    files = raw_files()
+    if not files:
+        print(f" No data files found in {DATA_FOLDER}")
+        return False
+    base, _ = load_base(files)
+    before = base['game_date'] < cutoff
+    state = build_state(base[before])
+    actual, _ = update_features(base[~before], state)
+
+    full = enforce(build_features(base), "master dataset")
+    expected = full[~before].reset_index(drop=True)
+
+    mismatched = []
+    if len(actual) != len(expected) or list(actual.columns) != list(expected.columns):
+        mismatched.append("shape")
+    else:
+        for col in expected.columns:
+            a, e = actual[col], expected[col]
+            if pd.api.types.is_float_dtype(e):
+                same = np.allclose(a, e, rtol=FLOAT_TOLERANCE, equal_nan=True)
+            else:
+                same = a.astype(object).equals(e.astype(object))
+            if not same:
+                mismatched.append(col)
+
+    if mismatched:
+        print(f" MISMATCH vs full rebuild: {mismatched}")
+        return False
+    print(f" OK: {len(actual)} incremental rows match the full rebuild")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental master feature updates.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("init", help=f"build player state from {OUTPUT_DIR}/")
+    update = sub.add_parser("update", help="add features for new gather chunks")
+    update.add_argument("chunks", nargs="+")
+    verify = sub.add_parser("verify", help="compare an incremental build with a full rebuild")
+    verify.add_argument("--cutoff", required=True, help="first date (YYYY-MM-DD) treated as new")
+    args = parser.parse_args()
+
+    if args.command == "init":
+        init_state()
+    elif args.command == "update":
+        run_update(args.chunks)
+    elif not verify_incremental(args.cutoff):
+        raise SystemExit(1)
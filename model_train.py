@@ -3,10 +3,19 @@ import lightgbm as lgb
 from sklearn.model_selection import train_test_split
 import numpy as np
 import os
+import json
+import argparse
+import pyarrow.parquet as pq
 import matplotlib.pyplot as plt
+from schema import enforce, apply_schema
+from dataset import read_dataset, open_dataset, build_filter
+from encoders import CategoryEncoder, encoder_path
+from profiling import stage
+from digests import file_digest
 
 # --- 1. CONFIGURATION ---
-INPUT_FILE = "final_data.parquet"
+INPUT_DIR = "final_data"
+TRAIN_SEASONS = None  # e.g. (2022, 2024); None trains on every season
 
 # Updated to include "Archetype" and "Context" signals
 FEATURES = [
@@ -25,16 +34,50 @@ CAT_FEATURES = [
     'prev_pitch_type', 'prev_zone', 'stand', 'p_throws'
 ]
 
+# Out-of-core training: binned LightGBM Datasets are cached here per target
+CACHE_DIR = "model_cache"
+VALID_FRACTION = 0.2
+DATASET_PARAMS = {'max_bin': 255, 'verbose': -1}
+HASH_CACHE_FILES = False  # Key the cache on dataset file contents (reads them all) instead of size / mtime
+
+# lgb.train equivalents of the LGBMClassifier setups below
+TARGETS = {
+    'zone': {
+        'params': {
+            'objective': 'multiclass', 'num_leaves': 127, 'max_depth': 10,
+            'min_child_samples': 100, 'learning_rate': 0.05, 'subsample': 0.8,
+            'colsample_bytree': 0.7, 'n_jobs': -1, 'seed': 42, 'verbose': -1,
+        },
+        'rounds': 1500,
+        'balanced': False,
+        'model_file': "model_zone_optimized.txt",
+    },
+    'pitch_type': {
+        'params': {
+            'objective': 'multiclass', 'num_leaves': 255, 'learning_rate': 0.02,
+            'n_jobs': -1, 'seed': 42, 'verbose': -1,
+        },
+        'rounds': 2000,
+        'balanced': True,  # class_weight='balanced', stored as row weights
+        'model_file': "model_type_optimized.txt",
+    },
+}
+
 
 # --- 3. MAIN TRAINING LOOP ---
 def train_dual_optimized():
     print("Loading data...")
-    df = pd.read_parquet(INPUT_FILE)    
-    # Critical: Convert to category types
-    for col in CAT_FEATURES:
-        df[col] = df[col].astype('category')
-
-    X = df[FEATURES]
+    # Only the model columns of the selected season partitions are read
+    with stage("Loading data") as s:
+        df = enforce(
+            read_dataset(INPUT_DIR, columns=FEATURES + ['pitch_type', 'zone'], seasons=TRAIN_SEASONS),
+            "load training data",
+        )
+        s.rows_out = len(df)
+    # Critical: Stable category codes, saved next to the model for test.py / serve.py
+    with stage("Encoding categories", rows_in=len(df)):
+        encoder = CategoryEncoder.fit(df, CAT_FEATURES, target='zone')
+        X = encoder.transform(df, FEATURES)
     
     # # --- MODEL 1: ARSENAL (Pitch Type) ---
     # print("\n--- Training Model 1: Pitch Type ---")
@@ -56,7 +99,7 @@ def train_dual_optimized():
 
     # --- MODEL 2: LOCATION (Zone) ---
     print("\n--- Training Model 2: Zone ---")
-    y_zone = df['zone']
+    y_zone = encoder.encode_classes(df['zone'])
     X_train, X_test, y_train, y_test = train_test_split(X, y_zone, test_size=0.2, random_state=42)
     
     # The "Deep Brain" setup to move past the 5.5% wall
@@ -72,11 +115,198 @@ def train_dual_optimized():
         n_jobs=-1,                 # Uses all your laptop cores
         random_state=42
     )
-    zone_model.fit(X_train, y_train, eval_set=[(X_test, y_test)],
-        callbacks=[lgb.early_stopping(stopping_rounds=50),lgb.log_evaluation(period=100)])
+    with stage("Training Model 2: Zone", rows_in=len(X_train)):
+        zone_model.fit(X_train, y_train, eval_set=[(X_test, y_test)],
+            feature_name=FEATURES, categorical_feature=CAT_FEATURES,
+            callbacks=[lgb.early_stopping(stopping_rounds=50),lgb.log_evaluation(period=100)])
     zone_model.booster_.save_model("model_zone_optimized.txt")
+    encoder.save(encoder_path("model_zone_optimized.txt"))
 
     print("\nSUCCESS: Both Optimized Models Saved with Archetype Logic!")
 
+# --- 4. OUT-OF-CORE TRAINING WITH A CACHED BINARY DATASET ---
+# The frame is never loaded whole: Parquet row groups are encoded to float32
+# (with the CategoryEncoder) one at a time and streamed into LightGBM, which
+# bins them once. The binned Dataset is saved, so later runs and parameter
+# sweeps skip loading and binning.
+
+def dataset_files(seasons=TRAIN_SEASONS):
+    fragments = open_dataset(INPUT_DIR).get_fragments(filter=build_filter(seasons))
+    return sorted(f.path for f in fragments)
+
+class RowGroupSequence(lgb.Sequence):
+    """
+    Random-access view over the selected rows of one Parquet file. LightGBM
+    reads it in sorted order, so caching the last decoded row group means each
+    row group is decoded once per pass.
+    """
+    batch_size = 65536
+
+    def __init__(self, path, rows_by_group, encoder):
+        self.file = pq.ParquetFile(path)
+        self.rows_by_group = rows_by_group
+        self.offsets = np.concatenate(([0], np.cumsum([len(r) for r in rows_by_group])))
+        self.encoder = encoder
+        self.cached_group, self.cached_X = None, None
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def _group(self, g):
+        if g != self.cached_group:
+            df = apply_schema(self.file.read_row_group(g, columns=FEATURES).to_pandas(), numeric=False)
+            self.cached_group, self.cached_X = g, self.encoder.transform(df, FEATURES)[self.rows_by_group[g]]
+        return self.cached_X
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, _ = idx.indices(len(self))
+            parts = []
+            while start < stop:
+                g = np.searchsorted(self.offsets, start, side='right') - 1
+                end = min(stop, self.offsets[g + 1])
+                parts.append(self._group(g)[start - self.offsets[g]:end - self.offsets[g]])
+                start = end
+            return np.vstack(parts) if parts else np.empty((0, len(FEATURES)), dtype=np.float32)
+        g = np.searchsorted(self.offsets, idx, side='right') - 1
+        # Single rows feed LightGBM's bin sampling, which expects float64
+        return self._group(g)[idx - self.offsets[g]].astype(np.float64)
+
+def file_key(path, content=HASH_CACHE_FILES):
+    """(size, mtime_ns) of a dataset file (a stat call), or its content hash with content=True."""
+    if content:
+        return file_digest(path)
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def cache_meta(target='zone', seasons=TRAIN_SEASONS, content=HASH_CACHE_FILES):
+    """What a cached Dataset is built from: the cache is rebuilt when any of it changes."""
+    return {
+        'target': target, 'seasons': list(seasons) if seasons else None,
+        'features': FEATURES, 'cat_features': CAT_FEATURES,
+        'valid_fraction': VALID_FRACTION, 'balanced': TARGETS[target]['balanced'],
+        'dataset_params': DATASET_PARAMS,
+        # Any rebuild or update of INPUT_DIR rewrites files, so their stats change
+        'files': {os.path.relpath(path, INPUT_DIR): file_key(path, content) for path in dataset_files(seasons)},
+    }
+
+def stale_cache_fields(target, meta):
+    """Fields of meta that differ from the cached Dataset's (every field if there is no cache)."""
+    path = f"{CACHE_DIR}/{target}_meta.json"
+    if not all(os.path.exists(f"{CACHE_DIR}/{target}_{name}") for name in ("encoder.json", "train.bin", "valid.bin", "meta.json")):
+        return list(meta)
+    with open(path) as f:
+        cached = json.load(f)
+    return [key for key in meta if cached.get(key) != meta[key]]
+
+def build_training_cache(target='zone', seasons=TRAIN_SEASONS, meta=None):
+    """Streams the dataset into binned train/valid LightGBM Datasets and saves them."""
+    meta = meta or cache_meta(target, seasons)
+    files = dataset_files(seasons)
+    id_features = [c for c in CAT_FEATURES if c not in ('pitcher_style', 'prev_pitch_type')]
+    print(f"Scanning {len(files)} files for categories and labels...")
+
+    # Pass 1: only the ID-like categoricals and the target (a few narrow columns)
+    rng = np.random.default_rng(42)
+    uniques = {col: [] for col in id_features + [target]}
+    layout = []
+    with stage("Scanning categories and labels") as s:
+        for path in files:
+            parquet = pq.ParquetFile(path)
+            groups = []
+            for g in range(parquet.num_row_groups):
+                block = apply_schema(parquet.read_row_group(g, columns=id_features + [target]).to_pandas(), numeric=False)
+                for col in uniques:
+                    uniques[col].append(pd.unique(block[col].dropna().to_numpy()))
+                is_valid = rng.random(len(block)) < VALID_FRACTION
+                groups.append((block[target].to_numpy(), is_valid))
+            layout.append((path, groups))
+        s.rows_out = sum(len(y) for _, groups in layout for y, _ in groups)
+
+    encoder = CategoryEncoder.fit(
+        {col: np.concatenate(values) for col, values in uniques.items()}, CAT_FEATURES, target=target
+    )
+    classes = encoder.classes
+
+    def split(valid):
+        seqs, labels = [], []
+        for path, groups in layout:
+            rows = [np.flatnonzero(is_valid == valid) for _, is_valid in groups]
+            labels.extend(encoder.encode_classes(y[r]) for (y, _), r in zip(groups, rows))
+            seqs.append(RowGroupSequence(path, rows, encoder))
+        return seqs, np.concatenate(labels)
+
+    train_seqs, y_train = split(False)
+    valid_seqs, y_valid = split(True)
+
+    weights, valid_weights = None, None
+    if TARGETS[target]['balanced']:
+        counts = np.bincount(y_train, minlength=len(classes))
+        class_weight = len(y_train) / (len(classes) * np.maximum(counts, 1))
+        weights = class_weight[y_train]
+        # The valid set needs its own weights: a Sequence-built valid set
+        # with a weighted reference otherwise gets all-zero weights
+        valid_weights = class_weight[y_valid]
+
+    # Pass 2: LightGBM pulls the encoded rows batch by batch and bins them
+    print(f"Binning {len(y_train)} train / {len(y_valid)} valid rows...")
+    train = lgb.Dataset(train_seqs, label=y_train, weight=weights, feature_name=FEATURES,
+                        categorical_feature=CAT_FEATURES, params=DATASET_PARAMS)
+    valid = lgb.Dataset(valid_seqs, label=y_valid, weight=valid_weights, reference=train, feature_name=FEATURES,
+                        categorical_feature=CAT_FEATURES, params=DATASET_PARAMS)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # The Datasets are constructed (binned) lazily, when they are first saved
+    with stage("Binning Dataset", rows_in=len(y_train) + len(y_valid)):
+        for name, data in [('train', train), ('valid', valid)]:
+            path = f"{CACHE_DIR}/{target}_{name}.bin"
+            # LightGBM refuses to overwrite an existing binary file
+            if os.path.exists(path):
+                os.remove(path)
+            data.save_binary(path)
+    encoder.save(f"{CACHE_DIR}/{target}_encoder.json")
+    with open(f"{CACHE_DIR}/{target}_meta.json", "w") as f:
+        json.dump(meta, f, indent=1)
+    print(f"Saved binned Datasets to {CACHE_DIR}/{target}_*.bin")
+
+def load_training_cache(target='zone'):
+    """Reloads the binned Datasets and their encoder (no Parquet reads, no re-binning)."""
+    encoder = CategoryEncoder.load(f"{CACHE_DIR}/{target}_encoder.json")
+    train = lgb.Dataset(f"{CACHE_DIR}/{target}_train.bin", params=DATASET_PARAMS)
+    valid = lgb.Dataset(f"{CACHE_DIR}/{target}_valid.bin", reference=train, params=DATASET_PARAMS)
+    return train, valid, encoder
+
+def train_cached(target='zone', params=None, rebuild=False, hash_files=HASH_CACHE_FILES):
+    """Trains one model from the cached Dataset, (re)building the cache if it is missing or stale."""
+    meta = cache_meta(target, content=hash_files)
+    stale = stale_cache_fields(target, meta)
+    if rebuild or stale:
+        if stale and not rebuild and os.path.exists(f"{CACHE_DIR}/{target}_meta.json"):
+            print(f"Rebuilding the {target} cache ({', '.join(stale)} changed)...")
+        build_training_cache(target, meta=meta)
+    train, valid, encoder = load_training_cache(target)
+
+    config = TARGETS[target]
+    params = {**config['params'], 'num_class': len(encoder.classes), **(params or {})}
+    print(f"\n--- Training {target} model from {CACHE_DIR} ---")
+    with stage(f"Training {target} model"):
+        booster = lgb.train(params, train, num_boost_round=config['rounds'], valid_sets=[valid],
+                            callbacks=[lgb.early_stopping(stopping_rounds=50), lgb.log_evaluation(period=100)])
+    booster.save_model(config['model_file'])
+    encoder.save(encoder_path(config['model_file']))
+    print(f"Saved {config['model_file']}")
+    return booster
+
 if __name__ == "__main__":
-    train_dual_optimized()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the pitch models.")
+    parser.add_argument("--cached", action="store_true", help="train out-of-core from the binned Dataset cache")
+    parser.add_argument("--rebuild-cache", action="store_true", help="re-stream the data into the cache first")
+    parser.add_argument("--hash-files", action="store_true",
+                        help="check the cache against the dataset files' contents (reads them all), not their stats")
+    parser.add_argument("--target", choices=list(TARGETS), default="zone")
+    args = parser.parse_args()
+
+    if args.cached or args.rebuild_cache:
+        train_cached(args.target, rebuild=args.rebuild_cache, hash_files=args.hash_files or HASH_CACHE_FILES)
+    else:
+        train_dual_optimized()
\ No newline at end of file
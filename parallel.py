@@ -0,0 +1,81 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataset import dataset_size
+
+# Configuration
+# A season file expands to roughly this many times its on-disk size while a
+# worker cleans it or builds its features (strings, copies, groupby buffers)
+MEMORY_FACTOR = 15
+MEMORY_HEADROOM = 0.8  # Never plan to use more than 80% of the free memory
+
+def available_memory():
+    """Bytes of memory the OS reports as available for new processes."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def plan_workers(files, requested):
+    """
+    Caps the requested worker count by CPU count, number of files and the
+    memory the largest season file (or partition directory) is expected to need.
+    """
+    workers = max(1, min(requested, len(files), os.cpu_count() or 1))
+    free = available_memory()
+    if free is None or not files:
+        return workers
+
+    per_worker = max(dataset_size(f) for f in files) * MEMORY_FACTOR
+    fits = max(1, int(free * MEMORY_HEADROOM // max(per_worker, 1)))
+    if fits < workers:
+        print(f"Limiting to {fits} workers ({free / 1e9:.1f} GB free, ~{per_worker / 1e9:.1f} GB per season)")
+    return min(workers, fits)
+
+def run_per_year(func, files, workers=1):
+    """
+    Runs func(file_path) for every season file, optionally in a process pool.
+    func must be a module-level function returning (year, rows). Progress and
+    timing are logged per year; the first failure cancels the pending seasons
+    and is re-raised.
+    """
+    workers = plan_workers(files, workers)
+    start = time.perf_counter()
+    done = 0
+
+    def report(year, rows, elapsed):
+        print(f"[{done}/{len(files)}] {year}: {rows} rows in {elapsed:.1f}s")
+
+    if workers == 1:
+        for file_path in files:
+            t0 = time.perf_counter()
+            year, rows = func(file_path)
+            done += 1
+            report(year, rows, time.perf_counter() - t0)
+    else:
+        print(f"Processing {len(files)} seasons with {workers} workers...")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_timed, func, f): f for f in files}
+            for future in as_completed(futures):
+                try:
+                    year, rows, elapsed = future.result()
+                except Exception:
+                    print(f"FAILED: {os.path.basename(futures[future])}. Cancelling remaining seasons...")
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    raise
+                done += 1
+                report(year, rows, elapsed)
+
+    print(f"All {len(files)} seasons finished in {time.perf_counter() - start:.1f}s")
+
+def _timed(func, file_path):
+    t0 = time.perf_counter()
+    year, rows = func(file_path)
+    return year, rows, time.perf_counter() - t0
@@ -0,0 +1,220 @@
+import os
+import re
+import sys
+import csv
+import json
+import time
+import atexit
+import argparse
+import cProfile
+import pstats
+from contextlib import contextmanager, ExitStack
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# --- STAGE INSTRUMENTATION ---
+# Wrap a pipeline step in `with stage("Mapping Batter Vulnerability Zones", rows_in=len(df)) as s:`
+# (and set s.rows_out) to record its wall time, CPU time, peak RSS and row
+# counts. Every finished stage is appended to run_logs/stages.csv (one line per
+# stage, from every process of the run, so pool workers are included) and the
+# process that started the run writes run_logs/<run_id>.json when it exits.
+# Compare two runs with `python profiling.py compare`.
+#
+# Set PROFILE_STAGES to a comma-separated list of stage names (or "all") to
+# run those stages under cProfile; the .prof files land in run_logs/<run_id>/.
+# Other profilers (e.g. a sampling profiler) plug in with add_stage_hook().
+
+RUN_LOG_DIR = "run_logs"
+STAGES_CSV = os.path.join(RUN_LOG_DIR, "stages.csv")
+PROFILE_ENV = "PROFILE_STAGES"
+RUN_ID_ENV = "PIPELINE_RUN_ID"  # Inherited by worker processes
+PROFILE_TOP = 20  # Functions printed per profiled stage
+
+FIELDS = [
+    'run_id', 'script', 'pid', 'stage', 'started_at', 'wall_s', 'cpu_s',
+    'peak_rss_mb', 'rss_delta_mb', 'rows_in', 'rows_out',
+]
+
+SCRIPT = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+if not SCRIPT or SCRIPT.startswith("-"):  # python -c / interactive sessions
+    SCRIPT = "interactive"
+_owner = RUN_ID_ENV not in os.environ
+if _owner:
+    os.environ[RUN_ID_ENV] = f"{datetime.now():%Y%m%d-%H%M%S}-{SCRIPT}-{os.getpid()}"
+RUN_ID = os.environ[RUN_ID_ENV]
+_run_start = time.perf_counter()
+_hooks = []
+_profiling = False
+
+def peak_rss_mb():
+    """Highest resident memory of this process so far (MB)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / (1e6 if sys.platform == "darwin" else 1e3), 1)
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def add_stage_hook(hook):
+    """
+    Registers hook(name) -> context manager, entered around every stage.
+    Use it to attach another profiler without touching the pipeline code.
+    """
+    _hooks.append(hook)
+
+def _profiled_stages():
+    names = os.environ.get(PROFILE_ENV, "")
+    return {n.strip().lower() for n in names.split(",") if n.strip()}
+
+def _slug(name):
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+@contextmanager
+def _cprofile(name):
+    """Runs the stage under cProfile if PROFILE_STAGES selects it (never nested)."""
+    global _profiling
+    wanted = _profiled_stages()
+    if _profiling or not ({'all', name.lower()} & wanted):
+        yield
+        return
+    profiler = cProfile.Profile()
+    _profiling = True
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _profiling = False
+        out_dir = os.path.join(RUN_LOG_DIR, RUN_ID)
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"{_slug(name)}.prof")
+        profiler.dump_stats(path)
+        print(f"  [profile] {name} -> {path}")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_TOP)
+
+class Stage:
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+
+def _append(record):
+    os.makedirs(RUN_LOG_DIR, exist_ok=True)
+    new_file = not os.path.exists(STAGES_CSV)
+    # One write per line, so concurrent workers never interleave records
+    line = ",".join("" if record[f] is None else str(record[f]).replace(",", ";") for f in FIELDS) + "\n"
+    with open(STAGES_CSV, "a") as f:
+        f.write((",".join(FIELDS) + "\n" + line) if new_file else line)
+
+@contextmanager
+def stage(name, rows_in=None):
+    """Times a named pipeline stage and appends its record to the run log."""
+    record = Stage(name, rows_in)
+    started_at = datetime.now().isoformat(timespec="seconds")
+    rss_before = current_rss_mb()
+    wall, cpu = time.perf_counter(), time.process_time()
+    with ExitStack() as hooks:
+        hooks.enter_context(_cprofile(name))
+        for hook in _hooks:
+            hooks.enter_context(hook(name))
+        yield record
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    rss_after = current_rss_mb()
+
+    peak = peak_rss_mb()
+    print(f"  [time] {name}: {wall:,.2f}s wall, {cpu:,.2f}s CPU, peak RSS {peak:,.0f} MB"
+          if peak is not None else f"  [time] {name}: {wall:,.2f}s wall, {cpu:,.2f}s CPU")
+    _append({
+        'run_id': RUN_ID, 'script': SCRIPT, 'pid': os.getpid(), 'stage': name,
+        'started_at': started_at, 'wall_s': round(wall, 4), 'cpu_s': round(cpu, 4),
+        'peak_rss_mb': peak,
+        'rss_delta_mb': None if rss_before is None or rss_after is None else round(rss_after - rss_before, 1),
+        'rows_in': record.rows_in, 'rows_out': record.rows_out,
+    })
+
+def load_runs():
+    """Every stage record in the run log, oldest first."""
+    if not os.path.exists(STAGES_CSV):
+        return []
+    with open(STAGES_CSV) as f:
+        return list(csv.DictReader(f))
+
+def run_stages(run_id):
+    return [r for r in load_runs() if r['run_id'] == run_id]
+
+def write_run_summary():
+    """Writes run_logs/<run_id>.json with every stage of this run (all processes)."""
+    stages = run_stages(RUN_ID)
+    if not stages:
+        return
+    path = os.path.join(RUN_LOG_DIR, f"{RUN_ID}.json")
+    with open(path, "w") as f:
+        json.dump({
+            'run_id': RUN_ID,
+            'script': SCRIPT,
+            'argv': sys.argv,
+            'total_wall_s': round(time.perf_counter() - _run_start, 3),
+            'stages': stages,
+        }, f, indent=1)
+
+if _owner:
+    atexit.register(write_run_summary)
+
+def stage_totals(run_id):
+    """Wall / CPU seconds per stage name (summed over workers and repeats)."""
+    totals = {}
+    for r in run_stages(run_id):
+        wall, cpu = totals.get(r['stage'], (0.0, 0.0))
+        totals[r['stage']] = (wall + float(r['wall_s']), cpu + float(r['cpu_s']))
+    return totals
+
+def compare_runs(old_id=None, new_id=None, script=None):
+    """Prints the per-stage wall time of two runs (default: the last two runs of a script)."""
+    runs = list(dict.fromkeys(
+        r['run_id'] for r in load_runs() if script is None or r['script'] == script
+    ))
+    if new_id is None or old_id is None:
+        if len(runs) < 2:
+            print("Need at least two runs in", STAGES_CSV)
+            return
+        old_id, new_id = runs[-2], runs[-1]
+
+    old, new = stage_totals(old_id), stage_totals(new_id)
+    def fmt(seconds):
+        return "-" if seconds is None else f"{seconds:.2f}"
+    print(f"{'stage':<45} {'old s':>9} {'new s':>9} {'change':>8}")
+    for name in dict.fromkeys(list(old) + list(new)):
+        a, b = old.get(name, (None,))[0], new.get(name, (None,))[0]
+        change = f"{(b - a) / a * 100:+.0f}%" if a and b is not None else ""
+        print(f"{name[:45]:<45} {fmt(a):>9} {fmt(b):>9} {change:>8}")
+    print(f"(old: {old_id}, new: {new_id})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the pipeline run log.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="stage timings of one run (default: the latest)")
+    show.add_argument("run_id", nargs="?")
+    compare = sub.add_parser("compare", help="per-stage wall time of two runs")
+    compare.add_argument("old_run", nargs="?")
+    compare.add_argument("new_run", nargs="?")
+    compare.add_argument("--script", help="only consider runs of this script, e.g. master_process")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        records = load_runs()
+        run_id = args.run_id or (records[-1]['run_id'] if records else None)
+        for r in run_stages(run_id):
+            print(f"{r['stage'][:45]:<45} {float(r['wall_s']):>9.2f}s {float(r['cpu_s']):>9.2f}s CPU "
+                  f"{r['peak_rss_mb'] or '-':>8} MB  rows {r['rows_in'] or '-'} -> {r['rows_out'] or '-'}")
+    else:
+        compare_runs(args.old_run, args.new_run, args.script)
@@ -0,0 +1,29 @@
+import numpy as np
+
+# --- REPERTOIRE MASK ---
+# The pitch types every pitcher has thrown, used to mask the pitch_type
+# model's classes (offline scoring in test.py and the live server in serve.py
+# share it, so both score the same rows the same way).
+#
+# Policy: a pitcher with no history (a call-up, or a pitcher only in the scored
+# rows) keeps every class, so their rows are scored unmasked.
+
+def build_repertoire(pitchers, y, n_classes):
+    """
+    Boolean (pitchers x classes) matrix of the pitch codes every pitcher has thrown
+    (y is the class index of every row, -1 where unknown).
+    Returns the sorted pitcher IDs (the row order) and the matrix.
+    """
+    known = y >= 0
+    pitcher_ids, codes = np.unique(pitchers[known], return_inverse=True)
+    repertoire = np.zeros((len(pitcher_ids), n_classes), dtype=bool)
+    repertoire[codes, y[known]] = True
+    return pitcher_ids, repertoire
+
+def repertoire_rows(pitcher_ids, repertoire, pitchers):
+    """Allowed classes of every pitcher (rows x classes, bool); unseen pitchers allow every class."""
+    if len(pitcher_ids) == 0:
+        return np.ones((len(pitchers), repertoire.shape[1]), dtype=bool)
+    pos = np.searchsorted(pitcher_ids, pitchers).clip(max=len(pitcher_ids) - 1)
+    known = pitcher_ids[pos] == pitchers
+    return np.where(known[:, None], repertoire[pos], True)
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+# --- GROUPED ROLLING / EXPANDING MEANS ---
+# Replaces df.groupby(key)[col].transform(lambda x: x.rolling(...).mean()),
+# which builds one Series and one Python callback per player. Here the frame is
+# stable-sorted by each group key once, so every player is a contiguous
+# segment, and every window sum comes from a difference of two cumulative sums.
+# For integer/boolean inputs (our whiff and fastball flags) the sums are exact,
+# so the means are bit-for-bit identical to pandas.
+
+CLOSED = ('right', 'left', 'both', 'neither')
+
+def _segments(keys):
+    """Stable sort order by key and the start of each row's group (in sorted order)."""
+    codes, _ = pd.factorize(keys)
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    n = len(codes)
+    is_start = np.ones(n, dtype=bool)
+    is_start[1:] = sorted_codes[1:] != sorted_codes[:-1]
+    starts = np.flatnonzero(is_start)
+    group_start = np.repeat(starts, np.diff(np.append(starts, n)))
+    return order, group_start, sorted_codes < 0
+
+def _window_bounds(group_start, window, closed):
+    """Half-open [lo, hi) bounds of each row's window, in sorted positions."""
+    pos = np.arange(len(group_start))
+    if window is None:
+        return group_start, pos + 1
+    if closed not in CLOSED:
+        raise ValueError(f"closed must be one of {CLOSED}, got {closed!r}")
+    hi = pos + (1 if closed in ('right', 'both') else 0)
+    lo = pos - window + (0 if closed in ('left', 'both') else 1)
+    return np.maximum(lo, group_start), hi
+
+def grouped_window_means(df, specs):
+    """
+    Computes several grouped rolling/expanding means in one call.
+
+    specs maps output name -> dict(by=, col=, window=, min_periods=, closed=).
+    window=None gives an expanding mean. Each result equals
+        df.groupby(by)[col].transform(lambda x: x.rolling(window, min_periods=min_periods, closed=closed).mean())
+    computed over the frame's current row order. Expanding specs may also give
+    prior_count= and prior_sum= arrays (aligned with the rows of df): the count
+    and sum of observations of the row's group before the frame. Returns a
+    dict of float64 arrays aligned with the rows of df.
+    """
+    segments = {}
+    results = {}
+    for name, spec in specs.items():
+        by = spec['by']
+        if by not in segments:
+            segments[by] = _segments(df[by].to_numpy())
+        order, group_start, null_key = segments[by]
+
+        values = df[spec['col']].to_numpy()[order]
+        if np.issubdtype(values.dtype, np.integer) or values.dtype == bool:
+            valid = np.ones(len(values), dtype=bool)
+            sums = np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+        else:
+            values = values.astype(np.float64)
+            valid = ~np.isnan(values)
+            sums = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+        counts = np.concatenate(([0], np.cumsum(valid, dtype=np.int64)))
+
+        window = spec.get('window')
+        lo, hi = _window_bounds(group_start, window, spec.get('closed', 'right'))
+        n_obs = counts[hi] - counts[lo]
+        totals = sums[hi] - sums[lo]
+        if spec.get('prior_count') is not None:
+            if window is not None:
+                raise ValueError("prior_count / prior_sum need an expanding window (window=None)")
+            n_obs = n_obs + np.asarray(spec['prior_count'])[order]
+            totals = totals + np.asarray(spec['prior_sum'], dtype=np.float64)[order]
+        min_periods = spec.get('min_periods')
+        if min_periods is None:
+            min_periods = 1 if window is None else window
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = totals.astype(np.float64) / n_obs
+        means[(n_obs < max(min_periods, 1)) | null_key] = np.nan
+
+        out = np.empty(len(means))
+        out[order] = means
+        results[name] = out
+    return results
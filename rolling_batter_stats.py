@@ -1,7 +1,12 @@
-import pandas as pd
-import numpy as np
 import glob
 import os
+import argparse
+from parallel import run_per_year
+from schema import enforce
+from rolling import grouped_window_means
+from dataset import read_dataset, write_dataset
+from profiling import stage
+from features import SEQUENCE_FEATURES, build_features
 
 # Configuration
 INPUT_DIR = "statcast_cleaned"
@@ -15,23 +20,14 @@ def add_at_bat_sequence_features(df):
     # Sort to ensure the sequence is correct: Game -> At-Bat -> Pitch Number
     df = df.sort_values(['game_date', 'game_pk', 'at_bat_number', 'pitch_number'])
     
-    # Group by the unique at-bat identifier
-    group = df.groupby(['game_pk', 'at_bat_number'])
-    
     # 1. Previous Pitch Type and Zone
-    # shift(1) looks at the row directly above within the same at-bat
-    df['prev_pitch_type'] = group['pitch_type'].shift(1)
-    df['prev_zone'] = group['zone'].shift(1)
+    # The previous row within the same at-bat; the first pitch of an at-bat
+    # gets 'START' and zone 0 (the shared Shift nodes in features.py)
     
     # 2. Pitch Count in At-Bat
     # (Already handled by pitch_number, but useful to keep)
     
-    # 3. Fill 'First Pitch' logic
-    # The first pitch of an at-bat has no 'previous'. We label it 'START'
-    df['prev_pitch_type'] = df['prev_pitch_type'].fillna('START')
-    df['prev_zone'] = df['prev_zone'].fillna(0) # Zone 0 = No previous zone
-    
-    return df
+    return build_features(df, SEQUENCE_FEATURES)
 
 def add_rolling_stats(df):
     """
@@ -40,48 +36,59 @@ def add_rolling_stats(df):
     # Create binary outcome flags
     whiff_strings = ['swinging_strike', 'swinging_strike_blocked', 'missed_bunt']
     df['is_whiff'] = df['description'].isin(whiff_strings).astype(int)
+    # We want to know if the pitcher is currently relying on their Fastball (FF)
+    df['is_fastball'] = (df['pitch_type'] == 'FF').astype(int)
     
     # Sort by batter and date for rolling calculations
     df = df.sort_values(['batter', 'game_date'])
     
-    # Batter Rolling Whiff Rate (Last 100 pitches seen)
+    # Both windows are computed in one grouped pass (see rolling.py)
     # closed='left' is CRITICAL: it prevents the model from seeing the current pitch outcome
-    df['batter_rolling_whiff_rate'] = df.groupby('batter')['is_whiff'].transform(
-        lambda x: x.rolling(window=100, min_periods=10, closed='left').mean()
-    )
-    
-    # Pitcher Usage (Last 50 pitches thrown)
-    # We want to know if the pitcher is currently relying on their Fastball (FF)
-    df['is_fastball'] = (df['pitch_type'] == 'FF').astype(int)
-    df['pitcher_ff_usage'] = df.groupby('pitcher')['is_fastball'].transform(
-        lambda x: x.rolling(window=50, min_periods=5, closed='left').mean()
-    )
+    rolled = grouped_window_means(df, {
+        # Batter Rolling Whiff Rate (Last 100 pitches seen)
+        'batter_rolling_whiff_rate': dict(by='batter', col='is_whiff', window=100, min_periods=10, closed='left'),
+        # Pitcher Usage (Last 50 pitches thrown)
+        'pitcher_ff_usage': dict(by='pitcher', col='is_fastball', window=50, min_periods=5, closed='left'),
+    })
+    for col, values in rolled.items():
+        df[col] = values
     
     return df
 
-def run_feature_pipeline():
-    all_files = sorted(glob.glob(f"{INPUT_DIR}/clean_*.parquet"))
+def build_year_features(partition_path):
+    year = os.path.basename(partition_path).split('=')[1]
+    print(f"Engineering features for {year}...")
+    
+    with stage(f"Reading {year}") as s:
+        df = enforce(read_dataset(INPUT_DIR, seasons=(int(year), int(year))), f"read {year}")
+        s.rows_out = len(df)
     
-    for file_path in all_files:
-        year = os.path.basename(file_path).split('_')[1].split('.')[0]
-        print(f"Engineering features for {year}...")
-        
-        df = pd.read_parquet(file_path)
-        
-        # Apply At-Bat Sequences
+    # Apply At-Bat Sequences
+    with stage(f"At-bat sequence features {year}", rows_in=len(df)):
         df = add_at_bat_sequence_features(df)
-        
-        # Apply Rolling Performance
+    
+    # Apply Rolling Performance
+    with stage(f"Rolling stats {year}", rows_in=len(df)):
         df = add_rolling_stats(df)
-        
+    
         # Fill any remaining NaNs with global means
         df['batter_rolling_whiff_rate'] = df['batter_rolling_whiff_rate'].fillna(df['is_whiff'].mean())
         df['pitcher_ff_usage'] = df['pitcher_ff_usage'].fillna(0.5) # Assume 50% if unknown
-        
-        # Save final version
-        output_path = f"{OUTPUT_DIR}/final_{year}.parquet"
-        df.to_parquet(output_path, index=False)
-        print(f"Final data saved: {year}")
+    
+    # Save final version
+    with stage(f"Writing {year}", rows_in=len(df)):
+        df = enforce(df, f"features {year}")
+        write_dataset(df, OUTPUT_DIR)
+    print(f"Final data saved: {year}")
+    return year, len(df)
+
+def run_feature_pipeline(workers=1):
+    # One season=YYYY partition per year of the cleaned dataset
+    all_partitions = sorted(glob.glob(f"{INPUT_DIR}/season=*"))
+    run_per_year(build_year_features, all_partitions, workers)
 
 if __name__ == "__main__":
-    run_feature_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Add sequence and rolling features to each season.")
+    parser.add_argument("--workers", type=int, default=1, help="seasons to process in parallel")
+    args = parser.parse_args()
+    run_feature_pipeline(workers=args.workers)
\ No newline at end of file
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+# --- SHARED DTYPE SCHEMA ---
+# Every stage casts its frames through apply_schema() when it reads and before
+# it writes, so the same column always has the same compact dtype on disk and
+# in memory. Category lists are FIXED: codes never depend on which values
+# happen to appear in a given season. Only append to these lists, never reorder.
+
+PITCH_TYPES = [
+    'FF', 'SI', 'FC', 'SL', 'ST', 'SV', 'CU', 'KC', 'CS', 'CH', 'FS', 'FO',
+    'SC', 'KN', 'EP', 'FA', 'FT', 'PO', 'IN', 'AB', 'UN',
+]
+PREV_PITCH_TYPES = ['START'] + PITCH_TYPES
+
+DESCRIPTIONS = [
+    'ball', 'blocked_ball', 'called_strike', 'foul', 'foul_bunt', 'foul_tip',
+    'bunt_foul_tip', 'foul_pitchout', 'hit_by_pitch', 'hit_into_play',
+    'hit_into_play_no_out', 'hit_into_play_score', 'missed_bunt',
+    'swinging_strike', 'swinging_strike_blocked', 'swinging_pitchout',
+    'pitchout', 'pitchout_hit_into_play', 'intent_ball', 'automatic_ball',
+    'automatic_strike', 'unknown_strike',
+]
+
+EVENTS = [
+    'single', 'double', 'triple', 'home_run', 'field_out', 'strikeout',
+    'strikeout_double_play', 'walk', 'intent_walk', 'hit_by_pitch',
+    'force_out', 'grounded_into_double_play', 'double_play', 'triple_play',
+    'fielders_choice', 'fielders_choice_out', 'field_error', 'sac_fly',
+    'sac_fly_double_play', 'sac_bunt', 'sac_bunt_double_play',
+    'catcher_interf', 'batter_interference', 'fan_interference',
+    'caught_stealing_2b', 'caught_stealing_3b', 'caught_stealing_home',
+    'pickoff_1b', 'pickoff_2b', 'pickoff_3b', 'pickoff_caught_stealing_2b',
+    'pickoff_caught_stealing_3b', 'pickoff_caught_stealing_home',
+    'stolen_base_2b', 'stolen_base_3b', 'stolen_base_home', 'wild_pitch',
+    'passed_ball', 'other_out', 'other_advance', 'runner_double_play',
+    'defensive_indiff', 'game_advisory', 'truncated_pa', 'ejection',
+]
+
+COUNTS = [f"{b}-{s}" for b in range(4) for s in range(3)]
+
+PITCHER_STYLES = ['Power_HighSpin', 'Power_Sink', 'Crafty_Spin', 'Crafty_Finesse']
+
+CATEGORIES = {
+    'pitch_type': PITCH_TYPES,
+    'prev_pitch_type': PREV_PITCH_TYPES,
+    'description': DESCRIPTIONS,
+    'events': EVENTS,
+    'count': COUNTS,
+    'pitcher_style': PITCHER_STYLES,
+}
+
+# Integer columns get the narrowest width that holds them. A column that still
+# has NaNs (raw data) or does not fit (raw runner columns hold player IDs) is
+# stored as float32 instead.
+INTEGERS = {
+    'balls': 'int8', 'strikes': 'int8', 'outs_when_up': 'int8', 'inning': 'int8',
+    'zone': 'int8', 'prev_zone': 'int8', 'batter_weak_zone': 'int8',
+    'on_1b': 'int8', 'on_2b': 'int8', 'on_3b': 'int8',
+    'stand': 'int8', 'p_throws': 'int8', 'inning_topbot': 'int8',
+    'is_late_inning': 'int8', 'is_whiff': 'int8', 'is_fastball': 'int8', 'is_ff': 'int8',
+    'home_score': 'int16', 'away_score': 'int16', 'score_diff': 'int16',
+    'at_bat_number': 'int16', 'pitch_number': 'int16',
+    'batter': 'int32', 'pitcher': 'int32', 'game_pk': 'int32',
+}
+
+FLOATS = [
+    'release_speed', 'release_spin_rate', 'pitcher_avg_velo', 'pitcher_avg_spin',
+    'batter_rolling_whiff_rate', 'pitcher_ff_usage',
+]
+
+def as_category(values, col):
+    """Casts values to the fixed categorical dtype of col."""
+    return pd.Categorical(values, categories=CATEGORIES[col])
+
+def _fits(series, dtype):
+    info = np.iinfo(dtype)
+    return series.min() >= info.min and series.max() <= info.max
+
+def apply_schema(df, numeric=True):
+    """
+    Casts every known column of df to its compact dtype (in place) and returns df.
+    numeric=False leaves numeric columns alone for callers (like the chunk
+    combiner) that already read them with fixed raw dtypes.
+    """
+    for col in df.columns:
+        if col in CATEGORIES:
+            if isinstance(df[col].dtype, pd.CategoricalDtype) and list(df[col].cat.categories) == CATEGORIES[col]:
+                continue
+            cast = as_category(df[col], col)
+            lost = df[col].notna().to_numpy() & (cast.codes == -1)
+            if lost.any():
+                unknown = sorted(map(str, pd.unique(df[col][lost])))
+                print(f"  Warning: unknown {col} values set to NaN: {unknown[:10]}")
+            df[col] = cast
+        elif col in INTEGERS and numeric:
+            s = df[col]
+            if not pd.api.types.is_numeric_dtype(s) or pd.api.types.is_bool_dtype(s):
+                continue
+            if s.isna().any() or not _fits(s, INTEGERS[col]):
+                df[col] = s.astype(np.float32)
+            else:
+                df[col] = s.astype(INTEGERS[col])
+        elif col in FLOATS and numeric:
+            df[col] = df[col].astype(np.float32)
+    return df
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+def enforce(df, stage):
+    """Applies the schema and reports the frame's memory before and after."""
+    before = memory_mb(df)
+    df = apply_schema(df)
+    print(f"  [memory] {stage}: {before:,.1f} MB -> {memory_mb(df):,.1f} MB ({len(df):,} rows)")
+    return df
@@ -0,0 +1,283 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from dataset import read_dataset
+from incremental import STATE_DIR
+from master_process import OUTPUT_DIR
+from features import AT_BAT, PITCH_KEY
+from serve import TOP_K, DEFAULTS, HANDEDNESS, validate, Predictor
+
+# --- AT-BAT SEQUENCE SCORING ---
+# Scores whole at-bats (or games, or a season) pitch by pitch in ONE booster
+# predict call per model, instead of one full feature row per pitch request:
+#   {"pitcher": 543037, "batter": 660271, "stand": "L", "inning": 3, "outs_when_up": 1,
+#    "home_score": 2, "away_score": 0, "on_1b": true,
+#    "pitches": [{"balls": 0, "strikes": 0, "pitch_type": "FF", "zone": 5},
+#                {"balls": 0, "strikes": 1, "pitch_type": "SL", "zone": 14},
+#                {"balls": 1, "strikes": 1}]}
+# Row i of an at-bat is the moment before pitch i: its count and runners
+# (runner fields left out are carried over from the previous pitch, so only a
+# steal needs restating) and the type / zone of pitch i-1 ('START' / 0 for the
+# first pitch, as in add_at_bat_sequence_features). Only the last pitch may
+# leave out what was thrown.
+# The player lookups and the encoding of the at-bat's fixed fields run once
+# per at-bat and are repeated over its pitches; only the pitch fields are
+# encoded per row.
+#
+#   python sequences.py replay --season 2023 --out replay_2023.parquet
+#   python sequences.py bench --at-bats 500
+
+# --- CONFIGURATION ---
+AT_BAT_FIELDS = ['pitcher', 'batter', 'stand', 'p_throws', 'inning', 'outs_when_up', 'home_score', 'away_score']
+PITCH_FIELDS = ['balls', 'strikes', 'on_1b', 'on_2b', 'on_3b']
+CARRIED_FIELDS = ['on_1b', 'on_2b', 'on_3b']
+BATCH_THREADS = 0  # LightGBM default (all cores): sequence batches are large
+
+# 1. SEQUENCES, COLUMN-WISE
+class SequenceBatch:
+    """
+    Many at-bats laid out as columns: at_bat holds one value per at-bat,
+    pitch one value per pitch (at-bats back to back, lengths[i] pitches each).
+    """
+
+    def __init__(self, at_bat, pitch, lengths):
+        self.at_bat = at_bat
+        self.pitch = pitch
+        self.lengths = lengths
+
+    def __len__(self):
+        return int(self.lengths.sum())
+
+    def split(self, rows):
+        """Per-pitch results (a list or array) cut back into one list per at-bat."""
+        bounds = np.cumsum(self.lengths)[:-1]
+        return [list(part) for part in np.split(np.asarray(rows, dtype=object), bounds)]
+
+    @classmethod
+    def from_at_bats(cls, at_bats):
+        """From at-bat objects (see the header); raises ValueError on a malformed one."""
+        at_bat = {f: [] for f in AT_BAT_FIELDS}
+        pitch = {f: [] for f in PITCH_FIELDS + ['prev_pitch_type', 'prev_zone']}
+        lengths = []
+        for ab in at_bats:
+            validate(ab)
+            pitches = ab.get('pitches')
+            if not isinstance(pitches, list) or not pitches:
+                raise ValueError("'pitches' must be a non-empty list")
+            for f in AT_BAT_FIELDS:
+                at_bat[f].append(ab.get(f, DEFAULTS.get(f)))
+
+            state = {f: ab.get(f, DEFAULTS[f]) for f in CARRIED_FIELDS}
+            prev = ('START', 0)
+            for i, p in enumerate(pitches):
+                if not isinstance(p, dict):
+                    raise TypeError("each pitch must be a JSON object")
+                state.update({f: p[f] for f in CARRIED_FIELDS if f in p})
+                row = {**ab, **state, 'balls': p.get('balls', DEFAULTS['balls']),
+                       'strikes': p.get('strikes', DEFAULTS['strikes'])}
+                # Checked as the request for the next pitch (what this one threw
+                # is its prev_*), so a bad pitch is rejected as serve would
+                try:
+                    validate({**row, 'prev_pitch_type': p.get('pitch_type', 'START'), 'prev_zone': p.get('zone', 0)})
+                except (ValueError, TypeError) as e:
+                    raise ValueError(f"pitch {i}: {e}") from None
+                for f in PITCH_FIELDS:
+                    pitch[f].append(bool(row[f]) if f in CARRIED_FIELDS else row[f])
+                pitch['prev_pitch_type'].append(prev[0])
+                pitch['prev_zone'].append(prev[1])
+                if i < len(pitches) - 1 and ('pitch_type' not in p or 'zone' not in p):
+                    raise ValueError("only the last pitch of an at-bat may leave out 'pitch_type' and 'zone'")
+                prev = (p.get('pitch_type'), p.get('zone'))
+            lengths.append(len(pitches))
+
+        at_bat['stand'] = [HANDEDNESS[v] for v in at_bat['stand']]
+        at_bat['p_throws'] = [HANDEDNESS[v] for v in at_bat['p_throws']]
+        return cls({f: np.array(v) for f, v in at_bat.items()},
+                   {f: np.array(v) for f, v in pitch.items()},
+                   np.array(lengths, dtype=np.int64))
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        From pitch rows (raw Statcast or final_data columns), without a loop
+        over rows. Returns the batch and the order its pitches were taken from
+        df in (at-bats by PITCH_KEY).
+        """
+        order = np.lexsort([df[c].to_numpy() for c in reversed(PITCH_KEY)])
+        keys = [df[c].to_numpy()[order] for c in AT_BAT]
+        new_at_bat = np.ones(len(order), dtype=bool)
+        new_at_bat[1:] = np.logical_or.reduce([k[1:] != k[:-1] for k in keys])
+        starts = np.flatnonzero(new_at_bat)
+        lengths = np.diff(np.append(starts, len(order)))
+
+        def column(name):
+            return df[name].to_numpy()[order]
+
+        at_bat = {f: column(f)[starts] for f in AT_BAT_FIELDS}
+        for f in ('stand', 'p_throws'):
+            at_bat[f] = pd.Series(at_bat[f]).map(HANDEDNESS).to_numpy()
+
+        # Runners are IDs (NaN when empty) in raw Statcast and 0/1 in final_data
+        pitch = {f: column(f) for f in ('balls', 'strikes')}
+        for f in CARRIED_FIELDS:
+            pitch[f] = np.nan_to_num(column(f).astype(np.float64)) != 0
+        # Previous pitch of the same at-bat, shifted in place of a groupby
+        for name, col, fill in (('prev_pitch_type', 'pitch_type', 'START'), ('prev_zone', 'zone', 0)):
+            values = df[col].astype(object).to_numpy()[order] if col == 'pitch_type' else column(col)
+            prev = np.roll(values, 1)
+            prev[starts] = fill
+            pitch[name] = prev
+        return cls(at_bat, pitch, lengths), order
+
+# 2. SCORING
+class SequenceScorer:
+    """Scores SequenceBatches with the server's models and player state."""
+
+    def __init__(self, predictor=None):
+        self.predictor = predictor or Predictor()
+
+    def features(self, batch):
+        """Raw columns: per at-bat (fixed fields and player lookups) and per pitch."""
+        ab = batch.at_bat
+        static = {
+            'pitcher': ab['pitcher'],
+            'batter': ab['batter'],
+            'stand': ab['stand'],
+            'p_throws': ab['p_throws'],
+            'outs_when_up': ab['outs_when_up'],
+            'score_diff': ab['home_score'] - ab['away_score'],
+            'is_late_inning': ab['inning'] >= 7,
+        }
+        static.update(self.predictor.store.player_features(ab['pitcher'], ab['batter']))
+        return static, batch.pitch
+
+    def matrix(self, model, static, pitch, lengths):
+        """model's float32 rows: at-bat columns encoded once and repeated, pitch columns per row."""
+        encoder = model.encoder
+        X = np.empty((int(lengths.sum()), len(model.features)), dtype=np.float32)
+        for j, col in enumerate(model.features):
+            per_at_bat = col in static
+            values = static[col] if per_at_bat else pitch[col]
+            if col in encoder.categories:
+                values = encoder.encode(col, values)
+            values = np.asarray(values, dtype=np.float32)
+            X[:, j] = np.repeat(values, lengths) if per_at_bat else values
+        return X
+
+    def probabilities(self, batch):
+        """target -> (pitches x classes) probabilities, one predict call per model."""
+        static, pitch = self.features(batch)
+        pitchers = np.repeat(static['pitcher'], batch.lengths)
+        return {
+            target: model.probabilities(self.matrix(model, static, pitch, batch.lengths), pitchers,
+                                        num_threads=BATCH_THREADS)
+            for target, model in self.predictor.models.items()
+        }
+
+    def score(self, at_bats, k=TOP_K):
+        """Top-k per target for every pitch: one list of {target: [[label, p], ...]} per at-bat."""
+        batch = SequenceBatch.from_at_bats(at_bats)
+        rows = [{} for _ in range(len(batch))]
+        for target, probs in self.probabilities(batch).items():
+            for row, top in zip(rows, self.predictor.models[target].top_k(probs, k)):
+                row[target] = top
+        return batch.split(rows)
+
+    def replay(self, df):
+        """
+        Scores every pitch of df (e.g. a season of final_data) in one batched
+        pass. Returns a frame on df's index with the top-1 label and its
+        probability per target, and whether the actual pitch was in the
+        top 1 / top 3 when df has the target column. Player features come from
+        the live state, as the server would see them, not from df.
+        """
+        batch, order = SequenceBatch.from_frame(df)
+        out = pd.DataFrame(index=df.index[order])
+        for target, probs in self.probabilities(batch).items():
+            model = self.predictor.models[target]
+            top = np.argsort(-probs, axis=1, kind='stable')[:, :3]
+            out[f'{target}_pred'] = model.classes[top[:, 0]]
+            out[f'{target}_prob'] = probs[np.arange(len(probs)), top[:, 0]]
+            if target in df.columns:
+                actual = model.encoder.encode_classes(df[target].iloc[order])
+                out[f'{target}_top1'] = top[:, 0] == actual
+                out[f'{target}_top3'] = (top == actual[:, None]).any(axis=1)
+        return out.loc[df.index]
+
+# 3. CLI
+def replay_season(season=None, out=None, state_dir=STATE_DIR, data_dir=OUTPUT_DIR):
+    """Replays final_data (one season, or all) through the models in one batched pass."""
+    columns = list(dict.fromkeys(PITCH_KEY + AT_BAT_FIELDS + PITCH_FIELDS + ['pitch_type', 'zone']))
+    df = read_dataset(data_dir, columns=columns, seasons=None if season is None else (season, season))
+    scorer = SequenceScorer(Predictor(state_dir, data_dir))
+
+    t0 = time.perf_counter()
+    results = scorer.replay(df)
+    seconds = time.perf_counter() - t0
+    print(f" Replayed {len(df):,} pitches in {seconds:.1f}s ({len(df) / seconds:,.0f} pitches/s)")
+    for target in scorer.predictor.models:
+        print(f"   {target}: Top 1 {results[f'{target}_top1'].mean() * 100:.2f}%, "
+              f"Top 3 {results[f'{target}_top3'].mean() * 100:.2f}%")
+    if out:
+        results.to_parquet(out)
+        print(f" Saved {out}")
+    return results
+
+def sample_at_bats(n, data_dir=OUTPUT_DIR, seed=42):
+    """n complete at-bats of the feature dataset as at-bat objects."""
+    columns = list(dict.fromkeys(PITCH_KEY + AT_BAT_FIELDS + PITCH_FIELDS + ['pitch_type', 'zone']))
+    df = read_dataset(data_dir, columns=columns)
+    keys = df[AT_BAT].drop_duplicates().sample(n=n, random_state=seed)
+    df = df.merge(keys, on=AT_BAT).sort_values(PITCH_KEY)
+    at_bats = []
+    for _, rows in df.groupby(AT_BAT, sort=False):
+        first = rows.iloc[0]
+        ab = {f: first[f].item() for f in AT_BAT_FIELDS}
+        ab['pitches'] = [
+            {'balls': int(r.balls), 'strikes': int(r.strikes), 'on_1b': bool(r.on_1b), 'on_2b': bool(r.on_2b),
+             'on_3b': bool(r.on_3b), 'pitch_type': str(r.pitch_type), 'zone': int(r.zone)}
+            for r in rows.itertuples()
+        ]
+        at_bats.append(ab)
+    return at_bats
+
+def run_benchmark(n_at_bats):
+    """Batched sequence scoring vs one predict_batch call per pitch, on the same at-bats."""
+    scorer = SequenceScorer()
+    at_bats = sample_at_bats(n_at_bats)
+    requests = []
+    for ab in at_bats:
+        fixed = {k: v for k, v in ab.items() if k != 'pitches'}
+        prev = ('START', 0)
+        for p in ab['pitches']:
+            requests.append({**fixed, **{f: p[f] for f in PITCH_FIELDS},
+                             'prev_pitch_type': prev[0], 'prev_zone': prev[1]})
+            prev = (p['pitch_type'], p['zone'])
+
+    t0 = time.perf_counter()
+    per_pitch = [scorer.predictor.predict_batch([r])[0] for r in requests]
+    row_seconds = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    batched = [row for ab in scorer.score(at_bats) for row in ab]
+    batch_seconds = time.perf_counter() - t0
+
+    print(f" {len(at_bats)} at-bats, {len(requests)} pitches")
+    print(f"   one call per pitch: {row_seconds:.2f}s ({len(requests) / row_seconds:,.0f} pitches/s)")
+    print(f"   batched sequences:  {batch_seconds:.2f}s ({len(requests) / batch_seconds:,.0f} pitches/s)")
+    print(f"   same predictions: {per_pitch == batched}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score whole at-bats and replay seasons in batches.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    replay = sub.add_parser("replay", help=f"score every pitch of {OUTPUT_DIR}/")
+    replay.add_argument("--season", type=int, help="only this season (default: all)")
+    replay.add_argument("--out", help="save the per-pitch results to this parquet file")
+    bench = sub.add_parser("bench", help="compare batched sequences with one call per pitch")
+    bench.add_argument("--at-bats", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        replay_season(args.season, args.out)
+    else:
+        run_benchmark(args.at_bats)
@@ -0,0 +1,409 @@
+import json
+import math
+import time
+import queue
+import argparse
+import threading
+import traceback
+import urllib.request
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from dataset import read_dataset
+from encoders import CategoryEncoder, encoder_path
+from incremental import STATE_DIR, load_state
+from features import pitcher_profiles_from_counts, weak_zones
+from master_process import OUTPUT_DIR
+from model_train import TARGETS
+from compiled_model import load_compiled
+from repertoire import build_repertoire, repertoire_rows
+from schema import PREV_PITCH_TYPES
+
+# --- LIVE PREDICTION SERVER ---
+# Loads both boosters, their category encoders (*.encoder.json) and
+# the per-player feature state (feature_state/) once, then answers pitch-by-pitch
+# requests over HTTP:
+#   POST /predict  {"pitcher": 543037, "batter": 660271, "balls": 1, "strikes": 2, ...}
+#                  (or a list of such objects)
+#   GET  /metrics  request count, p50/p99 latency and mean batch size
+# Concurrent requests are collected for up to MAX_WAIT_MS and scored together,
+# so the per-call cost of booster.predict is shared by the whole batch.
+
+# --- CONFIGURATION ---
+HOST = "127.0.0.1"
+PORT = 8765
+TOP_K = 3
+MAX_BATCH = 64           # Requests scored in one predict call
+MAX_WAIT_MS = 2.0        # How long the first request of a batch waits for company
+PREDICT_THREADS = 1      # Small batches are faster without OpenMP fan-out
+LATENCY_WINDOW = 10_000  # Latencies kept for the percentiles
+
+# Request fields that may be left out, and their defaults
+DEFAULTS = {
+    'balls': 0, 'strikes': 0, 'outs_when_up': 0, 'inning': 1,
+    'stand': 'R', 'p_throws': 'R', 'on_1b': False, 'on_2b': False, 'on_3b': False,
+    'home_score': 0, 'away_score': 0, 'prev_pitch_type': 'START', 'prev_zone': 0,
+}
+HANDEDNESS = {'R': 0, 'L': 1, 0: 0, 1: 1}
+NUMERIC_FIELDS = ['balls', 'strikes', 'outs_when_up', 'inning', 'home_score', 'away_score', 'prev_zone']
+# Fields with a fixed set of legal values (prev_zone 0 is the START of an at-bat)
+ALLOWED = {
+    'balls': range(4), 'strikes': range(3), 'outs_when_up': range(3),
+    'prev_zone': [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 11, 12, 13, 14],
+    'prev_pitch_type': PREV_PITCH_TYPES,
+}
+
+def validate(request):
+    """Rejects a malformed request up front, so it cannot fail the batch it would join."""
+    if not isinstance(request, dict):
+        raise TypeError("each request must be a JSON object")
+    for key in ('pitcher', 'batter'):
+        value = request.get(key)
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError(f"'{key}' must be an integer player ID")
+    for key in ('stand', 'p_throws'):
+        if request.get(key, 'R') not in HANDEDNESS:
+            raise ValueError(f"'{key}' must be 'R' or 'L'")
+    # Every other field is combined arithmetically with the rest of the batch
+    for key in NUMERIC_FIELDS:
+        value = request.get(key, 0)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or \
+                (isinstance(value, float) and not math.isfinite(value)):
+            raise ValueError(f"'{key}' must be a finite number")
+    for key in ('on_1b', 'on_2b', 'on_3b'):
+        if not isinstance(request.get(key, False), (bool, int)):
+            raise ValueError(f"'{key}' must be true or false")
+    if not isinstance(request.get('prev_pitch_type', 'START'), str):
+        raise ValueError("'prev_pitch_type' must be a pitch type code")
+    for key, allowed in ALLOWED.items():
+        if request.get(key, DEFAULTS[key]) not in allowed:
+            raise ValueError(f"'{key}' must be one of {list(allowed)}")
+
+# 1. PER-PLAYER FEATURES
+class PlayerTable:
+    """Sorted player IDs with one value each; lookups are a searchsorted, not a pandas reindex."""
+
+    def __init__(self, series, default):
+        series = series.dropna().sort_index()
+        self.ids = series.index.to_numpy()
+        self.values = series.to_numpy()
+        self.default = default
+
+    def lookup(self, ids):
+        if len(self.ids) == 0:
+            return np.full(len(ids), self.default, dtype=self.values.dtype)
+        pos = np.searchsorted(self.ids, ids).clip(max=len(self.ids) - 1)
+        return np.where(self.ids[pos] == ids, self.values[pos], self.default)
+
+class FeatureStore:
+    """Per-player features from the saved incremental state, looked up by ID."""
+
+    def __init__(self, state):
+        pitchers = state['pitchers']
+        profiles = pitcher_profiles_from_counts(pitchers)
+        tail = state['whiff_tail'].groupby('batter')['is_whiff']
+        # Same fallbacks as the master features (min_periods 20 / 10)
+        self.tables = {
+            'pitcher_style': (PlayerTable(profiles['pitcher_style'].astype(object), None), 'pitcher'),
+            'pitcher_ff_usage': (PlayerTable((pitchers['ff'] / pitchers['pitches']).where(pitchers['pitches'] >= 20), 0.35), 'pitcher'),
+            'batter_rolling_whiff_rate': (PlayerTable(tail.mean().where(tail.size() >= 10), 0.25), 'batter'),
+            'batter_weak_zone': (PlayerTable(weak_zones(state['zones']), 14), 'batter'),
+        }
+
+    def features(self, requests):
+        """Raw feature columns (before category encoding) for a batch of requests."""
+        rows = [{**DEFAULTS, **r} for r in requests]
+        def column(name, convert=None):
+            return np.array([convert(r[name]) if convert else r[name] for r in rows])
+
+        raw = {
+            'pitcher': column('pitcher'),
+            'batter': column('batter'),
+            'balls': column('balls'),
+            'strikes': column('strikes'),
+            'outs_when_up': column('outs_when_up'),
+            'stand': column('stand', HANDEDNESS.__getitem__),
+            'p_throws': column('p_throws', HANDEDNESS.__getitem__),
+            'on_1b': column('on_1b', bool),
+            'on_2b': column('on_2b', bool),
+            'on_3b': column('on_3b', bool),
+            'score_diff': column('home_score') - column('away_score'),
+            'is_late_inning': column('inning') >= 7,
+            'prev_pitch_type': column('prev_pitch_type'),
+            'prev_zone': column('prev_zone'),
+        }
+        raw.update(self.player_features(raw['pitcher'], raw['batter']))
+        return raw
+
+    def player_features(self, pitchers, batters):
+        """The per-player columns (style, usage, whiff rate, weak zone) for arrays of IDs."""
+        ids = {'pitcher': pitchers, 'batter': batters}
+        return {name: table.lookup(ids[key]) for name, (table, key) in self.tables.items()}
+
+# 2. MODELS
+class Model:
+    """One booster with the category encoder and class labels it was trained with."""
+
+    def __init__(self, target):
+        model_file = TARGETS[target]['model_file']
+        self.booster = load_compiled(model_file)
+        self.features = self.booster.feature_name()
+        self.encoder = CategoryEncoder.load(encoder_path(model_file))
+        self.classes = np.array(self.encoder.classes)
+        self.mask = None
+
+    def encode(self, raw):
+        # Unseen players / values fall into the encoder's unknown bucket
+        return self.encoder.transform(raw, self.features)
+
+    def probabilities(self, X, pitchers, num_threads=PREDICT_THREADS):
+        """Class probabilities of encoded rows, repertoire-masked if the model has a mask."""
+        # Masked classes' trees are skipped and rows renormalized over the rest
+        allowed = None if self.mask is None else self.mask.rows(pitchers)
+        return self.booster.predict(X, allowed, num_threads=num_threads)
+
+    def top_k(self, probs, k=TOP_K):
+        """[[label, probability], ...] of the k most likely classes of every row."""
+        top = np.argsort(-probs, axis=1, kind='stable')[:, :k]
+        return [
+            [[self.classes[c].item(), round(float(p[c]), 6)] for c in row]
+            for p, row in zip(probs, top)
+        ]
+
+    def predict(self, raw, pitchers, k=TOP_K):
+        return self.top_k(self.probabilities(self.encode(raw), pitchers), k)
+
+class RepertoireMask:
+    """Zeroes out the pitch types a pitcher has never thrown and renormalizes."""
+
+    def __init__(self, pitchers, labels, classes):
+        y = np.searchsorted(classes, labels).clip(max=len(classes) - 1)
+        y = np.where(classes[y] == labels, y, -1)
+        self.pitcher_ids, self.repertoire = build_repertoire(pitchers, y, len(classes))
+
+    def rows(self, pitchers):
+        """Allowed classes of every pitcher (rows x classes, bool)."""
+        return repertoire_rows(self.pitcher_ids, self.repertoire, pitchers)
+
+class Predictor:
+    """Everything the server needs, loaded once."""
+
+    def __init__(self, state_dir=STATE_DIR, data_dir=OUTPUT_DIR):
+        t0 = time.perf_counter()
+        self.store = FeatureStore(load_state(state_dir))
+        self.models = {target: Model(target) for target in TARGETS}
+        history = read_dataset(data_dir, columns=['pitcher', 'pitch_type'])
+        type_model = self.models['pitch_type']
+        type_model.mask = RepertoireMask(
+            history['pitcher'].to_numpy(), history['pitch_type'].astype(str).to_numpy(), type_model.classes,
+        )
+        print(f" Loaded models, encodings and player state in {time.perf_counter() - t0:.1f}s")
+
+    def predict_batch(self, requests):
+        raw = self.store.features(requests)
+        results = [{} for _ in requests]
+        for target, model in self.models.items():
+            for result, top in zip(results, model.predict(raw, raw['pitcher'])):
+                result[target] = top
+        return results
+
+# 3. MICRO-BATCHING AND METRICS
+class LatencyTracker:
+    def __init__(self, size=LATENCY_WINDOW):
+        self.latencies = deque(maxlen=size)
+        self.batch_sizes = deque(maxlen=size)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.count += 1
+
+    def record_batch(self, size):
+        with self.lock:
+            self.batch_sizes.append(size)
+
+    def summary(self):
+        with self.lock:
+            ms = np.array(self.latencies) * 1000
+            batches = np.array(self.batch_sizes)
+        if len(ms) == 0:
+            return {'requests': self.count}
+        return {
+            'requests': self.count,
+            'p50_ms': round(float(np.percentile(ms, 50)), 3),
+            'p99_ms': round(float(np.percentile(ms, 99)), 3),
+            'max_ms': round(float(ms.max()), 3),
+            'mean_batch': round(float(batches.mean()), 2) if len(batches) else None,
+        }
+
+class MicroBatcher:
+    """Collects concurrent requests and scores them with one predict call per batch."""
+
+    def __init__(self, predictor, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS, metrics=None):
+        self.predictor = predictor
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.metrics = metrics or LatencyTracker()
+        self.queue = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, request):
+        future = Future()
+        self.queue.put((request, future))
+        return future
+
+    def _loop(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.metrics.record_batch(len(batch))
+            try:
+                results = self.predictor.predict_batch([request for request, _ in batch])
+            except Exception:
+                # Something validate() let through: score the requests one by
+                # one so only the bad one fails
+                for request, future in batch:
+                    try:
+                        future.set_result(self.predictor.predict_batch([request])[0])
+                    except Exception as e:
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+# 4. HTTP SERVER
+def make_server(predictor, host=HOST, port=PORT):
+    batcher = MicroBatcher(predictor)
+    metrics = batcher.metrics
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._send(200, metrics.summary())
+            elif self.path == "/health":
+                self._send(200, {'status': 'ok'})
+            else:
+                self._send(404, {'error': f"unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                return self._send(404, {'error': f"unknown path {self.path}"})
+            t0 = time.perf_counter()
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                requests = body if isinstance(body, list) else [body]
+                for request in requests:
+                    validate(request)
+            except (ValueError, KeyError, TypeError) as e:
+                return self._send(400, {'error': str(e)})
+            try:
+                results = [f.result() for f in [batcher.submit(r) for r in requests]]
+            except Exception as e:
+                # A valid request the model failed on: answer instead of dropping the connection
+                traceback.print_exc()
+                return self._send(500, {'error': f"prediction failed: {e}"})
+            for _ in requests:
+                metrics.record(time.perf_counter() - t0)
+            self._send(200, results if isinstance(body, list) else results[0])
+
+        def log_message(self, format, *args):
+            pass  # One line per pitch would drown the console
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+# 5. CLIENTS
+class PredictionClient:
+    """Minimal HTTP client for the server."""
+
+    def __init__(self, host=HOST, port=PORT):
+        self.url = f"http://{host}:{port}"
+
+    def _call(self, path, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        req = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req) as resp:
+            return json.loads(resp.read())
+
+    def predict(self, request):
+        return self._call("/predict", request)
+
+    def metrics(self):
+        return self._call("/metrics")
+
+class LocalClient:
+    """Stand-in client that calls the predictor in-process (no sockets), e.g. for tests."""
+
+    def __init__(self, predictor):
+        self.batcher = MicroBatcher(predictor)
+
+    def predict(self, request):
+        validate(request)
+        t0 = time.perf_counter()
+        result = self.batcher.submit(request).result()
+        self.batcher.metrics.record(time.perf_counter() - t0)
+        return result
+
+    def metrics(self):
+        return self.batcher.metrics.summary()
+
+def sample_requests(n, data_dir=OUTPUT_DIR, seed=42):
+    """Realistic requests drawn from rows of the feature dataset."""
+    cols = ['pitcher', 'batter', 'balls', 'strikes', 'outs_when_up', 'inning', 'stand', 'p_throws',
+            'on_1b', 'on_2b', 'on_3b', 'score_diff', 'prev_pitch_type', 'prev_zone']
+    rows = read_dataset(data_dir, columns=cols).sample(n=n, replace=True, random_state=seed)
+    rows['prev_pitch_type'] = rows['prev_pitch_type'].astype(str)
+    rows = rows.rename(columns={'score_diff': 'home_score'}).astype({'on_1b': bool, 'on_2b': bool, 'on_3b': bool})
+    return [{k: v.item() if hasattr(v, 'item') else v for k, v in r.items()} for r in rows.to_dict('records')]
+
+def run_benchmark(n_requests, concurrency, port=PORT):
+    """Starts the server in-process and fires n_requests from concurrency client threads."""
+    server = make_server(Predictor(), port=port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = PredictionClient(port=port)
+    requests = sample_requests(n_requests)
+
+    def timed(request):
+        t0 = time.perf_counter()
+        client.predict(request)
+        return time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        ms = np.array(list(pool.map(timed, requests))) * 1000
+    print(f" Client: {n_requests} requests, {concurrency} concurrent -> "
+          f"p50 {np.percentile(ms, 50):.2f} ms, p99 {np.percentile(ms, 99):.2f} ms")
+    print(f" Server: {client.metrics()}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live pitch prediction server.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    sub = parser.add_subparsers(dest="command")
+    bench = sub.add_parser("bench", help="start the server and measure request latency")
+    bench.add_argument("--requests", type=int, default=2000)
+    bench.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        run_benchmark(args.requests, args.concurrency, port=args.port)
+    else:
+        server = make_server(Predictor(), args.host, args.port)
+        print(f" Serving on http://{args.host}:{args.port} (POST /predict, GET /metrics)")
+        server.serve_forever()
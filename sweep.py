@@ -0,0 +1,252 @@
+import os
+import csv
+import json
+import time
+import random
+import argparse
+import itertools
+import statistics
+import multiprocessing as mp
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import numpy as np
+import lightgbm as lgb
+from model_train import FEATURES, CAT_FEATURES, TARGETS, DATASET_PARAMS
+from feature_matrix import MATRIX_DIR, FeatureMatrix
+from profiling import stage
+
+# --- HYPERPARAMETER SWEEP & WALK-FORWARD BACKTEST ---
+# Scores many LightGBM configurations on walk-forward season folds
+# (train <= 2021 / test 2022, train <= 2022 / test 2023, ...), so no future
+# pitch is ever used to train a model that is evaluated on the past, unlike
+# the random train_test_split in model_train.train_dual_optimized.
+#
+# The data is the memory-mapped feature matrix (python feature_matrix.py
+# export): every worker maps the same read-only pages and bins each fold once,
+# then trains all of its trials on that fold. Workers x n_jobs is planned from
+# the CPU count. A trial whose early-stopping loss is worse than the median of
+# the trials already past the same round (PRUNE_AT) is stopped there.
+# Every finished (trial, fold) is appended to RESULTS_FILE with its metrics
+# and training time.
+#
+#   python sweep.py --target zone --trials 12
+#   python sweep.py --target pitch_type --workers 4 --no-prune
+
+RESULTS_FILE = "sweep_results.csv"
+MIN_TRAIN_SEASONS = 1      # The first fold trains on at least this many seasons
+SEED = 42
+ROUNDS = 1000
+EARLY_STOPPING = 50
+STOPPING_FRACTION = 0.1    # Latest training rows held out for early stopping (rows are in date order)
+PRUNE_AT = [50, 100, 200]  # Rounds at which a trial is compared with its peers
+PRUNE_MIN_PEERS = 3        # ...once at least this many trials reported there
+THREADS_PER_TRIAL = 2      # Preferred LightGBM n_jobs per trial; more CPUs mean more parallel trials
+# min_child_samples varies per trial, so LightGBM must not pre-filter features by it when binning
+SWEEP_DATASET_PARAMS = {**DATASET_PARAMS, 'feature_pre_filter': False}
+
+SEARCH_SPACE = {
+    'num_leaves': [31, 63, 127, 255],
+    'learning_rate': [0.02, 0.05, 0.1],
+    'min_child_samples': [20, 100, 300],
+    'colsample_bytree': [0.7, 1.0],
+    'lambda_l2': [0.0, 1.0],
+}
+
+FIELDS = [
+    'timestamp', 'target', 'trial', 'fold', 'params', 'train_rows', 'test_rows', 'n_jobs',
+    'best_iteration', 'pruned_at', 'stop_logloss', 'test_logloss', 'test_top1', 'test_top3', 'train_s',
+]
+
+# 1. FOLDS AND CONFIGURATIONS
+def walk_forward_folds(seasons, min_train=MIN_TRAIN_SEASONS):
+    """One fold per season after the first min_train: train on every earlier season, test on it."""
+    seasons = sorted(seasons)
+    return [
+        {'name': f"<={seasons[i - 1]}/{seasons[i]}", 'train': seasons[:i], 'test': seasons[i]}
+        for i in range(min_train, len(seasons))
+    ]
+
+def sample_configs(space=SEARCH_SPACE, n=None, seed=SEED):
+    """The whole grid, or n configurations drawn from it without repeats."""
+    grid = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+    if n is None or n >= len(grid):
+        return grid
+    return random.Random(seed).sample(grid, n)
+
+def plan_pool(n_tasks, workers=None, threads=THREADS_PER_TRIAL):
+    """(processes, n_jobs per trial) that together use every CPU once."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    if workers is None:
+        workers = cpus // max(threads, 1)
+    workers = max(1, min(workers, n_tasks, cpus))
+    return workers, max(1, cpus // workers)
+
+# 2. WORKER STATE (one per process: the mapped matrix and the binned folds)
+_state = {}
+
+def _init_worker(path, target, n_jobs, reports, lock):
+    _state.update(matrix=FeatureMatrix(path), target=target, n_jobs=n_jobs,
+                  reports=reports, lock=lock, folds={})
+
+def _span(rows):
+    """A slice when the (sorted) rows are contiguous, so indexing gives a view of the map."""
+    if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+        return slice(rows[0], rows[-1] + 1)
+    return rows
+
+def _fold_data(fold):
+    """Binned train / early-stopping Datasets and the test rows of a fold, built once per process."""
+    if fold['name'] in _state['folds']:
+        return _state['folds'][fold['name']]
+    matrix, target = _state['matrix'], _state['target']
+    y = matrix.labels[target]
+    train_rows = np.flatnonzero(np.isin(matrix.seasons, fold['train']))
+    n_stop = max(1, int(len(train_rows) * STOPPING_FRACTION))
+    fit, stop = _span(train_rows[:-n_stop]), _span(train_rows[-n_stop:])
+    test = _span(np.flatnonzero(matrix.seasons == fold['test']))
+
+    weights = stop_weights = None
+    n_classes = len(matrix.meta['classes'][target])
+    if TARGETS[target]['balanced']:
+        counts = np.bincount(y[fit], minlength=n_classes)
+        class_weight = counts.sum() / (n_classes * np.maximum(counts, 1))
+        weights, stop_weights = class_weight[y[fit]], class_weight[y[stop]]
+
+    train = lgb.Dataset(matrix.X[fit], label=y[fit], weight=weights, feature_name=FEATURES,
+                        categorical_feature=CAT_FEATURES, params=SWEEP_DATASET_PARAMS, free_raw_data=False)
+    valid = lgb.Dataset(matrix.X[stop], label=y[stop], weight=stop_weights, reference=train,
+                        params=SWEEP_DATASET_PARAMS, free_raw_data=False)
+    _state['folds'][fold['name']] = (train, valid, test, n_classes)
+    return _state['folds'][fold['name']]
+
+# 3. PRUNING
+class _Pruner:
+    """
+    LightGBM callback: at each PRUNE_AT round, reports the trial's loss and
+    stops it if it is worse than the median of the peers already reported.
+    """
+    order = 30  # After LightGBM's own evaluation
+
+    def __init__(self, fold_name, enabled):
+        self.fold_name = fold_name
+        self.enabled = enabled
+        self.pruned_at = None
+
+    def __call__(self, env):
+        round_ = env.iteration + 1
+        if not self.enabled or round_ not in PRUNE_AT:
+            return
+        loss = env.evaluation_result_list[0][2]
+        key = f"{self.fold_name}@{round_}"
+        with _state['lock']:
+            peers = list(_state['reports'].get(key, []))
+            _state['reports'][key] = peers + [loss]
+        if len(peers) >= PRUNE_MIN_PEERS and loss > statistics.median(peers):
+            self.pruned_at = round_
+            raise lgb.callback.EarlyStopException(env.iteration, env.evaluation_result_list)
+
+def _top_k_hits(probs, y, k):
+    top = np.argpartition(probs, -k, axis=1)[:, -k:] if probs.shape[1] > k else np.arange(probs.shape[1])[None, :]
+    return np.count_nonzero(np.any(top == y[:, None], axis=1))
+
+def run_trial(trial, config, fold, prune=True):
+    """Trains one configuration on one fold and scores it on the fold's test season."""
+    matrix, target = _state['matrix'], _state['target']
+    train, valid, test, n_classes = _fold_data(fold)
+    params = {**TARGETS[target]['params'], **config, 'num_class': n_classes,
+              'n_jobs': _state['n_jobs'], 'verbose': -1}
+    pruner = _Pruner(fold['name'], prune)
+
+    t0 = time.perf_counter()
+    booster = lgb.train(params, train, num_boost_round=ROUNDS, valid_sets=[valid],
+                        callbacks=[lgb.early_stopping(EARLY_STOPPING, verbose=False), pruner])
+    train_s = time.perf_counter() - t0
+
+    # Scored on the test season in the mapped pages (a view when the season is contiguous)
+    y_test = matrix.labels[target][test]
+    probs = booster.predict(matrix.X[test], num_iteration=booster.best_iteration or None)
+    picked = np.clip(probs[np.arange(len(y_test)), y_test], 1e-15, 1)
+    return {
+        'trial': trial, 'fold': fold['name'], 'params': json.dumps(config, sort_keys=True),
+        'train_rows': train.num_data(), 'test_rows': len(y_test), 'n_jobs': _state['n_jobs'],
+        'best_iteration': booster.best_iteration, 'pruned_at': pruner.pruned_at,
+        'stop_logloss': round(booster.best_score['valid_0']['multi_logloss'], 5),
+        'test_logloss': round(float(-np.log(picked).mean()), 5),
+        'test_top1': round(_top_k_hits(probs, y_test, 1) / len(y_test) * 100, 3),
+        'test_top3': round(_top_k_hits(probs, y_test, 3) / len(y_test) * 100, 3),
+        'train_s': round(train_s, 2),
+    }
+
+# 4. RUNNER
+def _append(rows, path):
+    new_file = not os.path.exists(path)
+    with open(path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+
+def summarize(rows):
+    """Prints the configurations ranked by their mean test log loss over the folds they finished."""
+    by_trial = {}
+    for r in rows:
+        by_trial.setdefault((r['trial'], r['params']), []).append(r)
+    ranked = []
+    for (trial, params), results in by_trial.items():
+        finished = [r for r in results if r['pruned_at'] is None]
+        if finished:
+            ranked.append((statistics.mean(r['test_logloss'] for r in finished),
+                           statistics.mean(r['test_top1'] for r in finished), len(finished), trial, params))
+    print(f"\n{'trial':>5} {'folds':>5} {'test logloss':>12} {'top1 %':>7}  params")
+    for loss, top1, folds, trial, params in sorted(ranked)[:10]:
+        print(f"{trial:>5} {folds:>5} {loss:>12.4f} {top1:>7.2f}  {params}")
+
+def run_sweep(target='zone', n_trials=None, workers=None, prune=True, path=MATRIX_DIR, results_file=RESULTS_FILE):
+    matrix = FeatureMatrix(path)
+    if target not in matrix.labels:
+        raise ValueError(f"{path} has no {target} labels; re-export it")
+    folds = walk_forward_folds(np.unique(matrix.seasons).tolist())
+    if not folds:
+        raise ValueError(f"{path} needs at least {MIN_TRAIN_SEASONS + 1} seasons for a walk-forward fold")
+    configs = sample_configs(n=n_trials)
+    # Fold-major order: every worker bins a fold once and early trials set the pruning medians
+    tasks = [(trial, config, fold) for fold in folds for trial, config in enumerate(configs)]
+    workers, n_jobs = plan_pool(len(tasks), workers)
+    print(f"Sweeping {len(configs)} configs x {len(folds)} folds ({[f['name'] for f in folds]}) "
+          f"with {workers} workers x {n_jobs} threads...")
+
+    stamp = datetime.now().isoformat(timespec="seconds")
+    results = []
+    def record(row):
+        row = {'timestamp': stamp, 'target': target, **row}
+        results.append(row)
+        _append([row], results_file)
+        status = f"pruned at {row['pruned_at']}" if row['pruned_at'] else f"{row['best_iteration']} rounds"
+        print(f"[{len(results)}/{len(tasks)}] trial {row['trial']} {row['fold']}: test logloss "
+              f"{row['test_logloss']:.4f}, top1 {row['test_top1']:.2f}% ({status}, {row['train_s']:.1f}s)")
+
+    with stage(f"Sweep {target}", rows_in=len(matrix)):
+        if workers == 1:
+            _init_worker(path, target, n_jobs, {}, nullcontext())
+            for task in tasks:
+                record(run_trial(*task, prune=prune))
+        else:
+            with mp.Manager() as manager:
+                init = (path, target, n_jobs, manager.dict(), manager.Lock())
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init) as pool:
+                    futures = [pool.submit(run_trial, *task, prune=prune) for task in tasks]
+                    for future in as_completed(futures):
+                        record(future.result())
+    summarize(results)
+    print(f"Saved {len(results)} results to {results_file}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Walk-forward hyperparameter sweep on the feature matrix.")
+    parser.add_argument("--target", choices=list(TARGETS), default="zone")
+    parser.add_argument("--trials", type=int, help="configurations drawn from SEARCH_SPACE (default: the whole grid)")
+    parser.add_argument("--workers", type=int, help="parallel trials (default: from the CPU count)")
+    parser.add_argument("--no-prune", action="store_true", help="train every trial to early stopping")
+    args = parser.parse_args()
+    run_sweep(args.target, args.trials, args.workers, prune=not args.no_prune)
@@ -0,0 +1,217 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from gather import USE_COLS, CHUNK_DTYPES, SORT_COLS, YEARLY_DIR
+from schema import apply_schema
+
+# --- SYNTHETIC STATCAST DATA ---
+# Generates Statcast-shaped pitches (the gather.USE_COLS columns, with the same
+# dtypes as a combined yearly file) so every stage can be run and benchmarked
+# offline. Games are built from at-bats and at-bats from pitches, so the
+# structure the pipeline relies on is realistic: unique (game_pk, at_bat_number,
+# pitch_number) keys, counts that advance within an at-bat, pitchers with their
+# own repertoire / velo / spin, batters with a handedness and a whiff tendency.
+# The same arguments and seed always give the same frame.
+
+SEASON_START = "04-01"
+SEASON_DAYS = 183
+AT_BATS_PER_GAME = 76
+PITCHES_PER_AT_BAT = 3.9   # Mean; at least one pitch per at-bat
+PITCHES_PER_GAME = AT_BATS_PER_GAME * PITCHES_PER_AT_BAT
+BLOCK_ROWS = 1_000_000     # Pitch types are drawn in blocks to bound memory
+
+PITCH_MIX = {
+    # pitch type: (league share, velo offset from the pitcher's fastball, spin offset)
+    'FF': (0.32, 0.0, 0), 'SI': (0.15, -0.8, -150), 'FC': (0.07, -4.5, 50),
+    'SL': (0.15, -8.5, 150), 'ST': (0.05, -11.0, 250), 'CU': (0.08, -13.0, 300),
+    'KC': (0.02, -11.5, 200), 'CH': (0.11, -8.0, -550), 'FS': (0.04, -7.0, -1000),
+    'SV': (0.01, -14.0, 250),
+}
+PITCH_NAMES = {
+    'FF': '4-Seam Fastball', 'SI': 'Sinker', 'FC': 'Cutter', 'SL': 'Slider',
+    'ST': 'Sweeper', 'CU': 'Curveball', 'KC': 'Knuckle Curve', 'CH': 'Changeup',
+    'FS': 'Split-Finger', 'SV': 'Slurve',
+}
+ZONES = [1, 2, 3, 4, 5, 6, 7, 8, 9, 11, 12, 13, 14]
+DESCRIPTION_MIX = {
+    'ball': 0.33, 'called_strike': 0.16, 'foul': 0.17, 'hit_into_play': 0.17,
+    'swinging_strike': 0.10, 'swinging_strike_blocked': 0.01, 'blocked_ball': 0.02,
+    'foul_tip': 0.01, 'hit_by_pitch': 0.003, 'foul_bunt': 0.004, 'missed_bunt': 0.001,
+    'intent_ball': 0.002,
+}
+IN_PLAY_EVENTS = {'field_out': 0.62, 'single': 0.22, 'double': 0.07, 'home_run': 0.05,
+                  'grounded_into_double_play': 0.03, 'triple': 0.01}
+MISSING_RATE = 0.01  # Share of pitches without pitch_type / zone / release data
+
+def rows_to_games(rows):
+    """Number of games that produces roughly the given number of pitches."""
+    return max(1, int(round(rows / PITCHES_PER_GAME)))
+
+def _players(rng, n, low=400_000, high=700_000):
+    return rng.choice(np.arange(low, high, dtype=np.int32), size=n, replace=False)
+
+def _draw(rng, choices, n):
+    labels, probs = zip(*choices.items())
+    probs = np.array(probs) / sum(probs)
+    return np.array(labels, dtype=object)[rng.choice(len(labels), size=n, p=probs)]
+
+def _pitch_types(rng, pitcher_idx, n_pitchers):
+    """Pitch type of every pitch from the pitcher's own repertoire mix."""
+    types = list(PITCH_MIX)
+    league = np.array([PITCH_MIX[t][0] for t in types])
+    # Each pitcher throws 3-6 of the pitch types with Dirichlet-weighted usage
+    mix = rng.dirichlet(league * 8, size=n_pitchers)
+    n_types = rng.integers(3, 7, size=n_pitchers)
+    cutoff = -np.sort(-mix, axis=1)[np.arange(n_pitchers), n_types - 1]
+    mix = np.where(mix >= cutoff[:, None], mix, 0)
+    cum = np.cumsum(mix / mix.sum(axis=1, keepdims=True), axis=1)
+
+    out = np.empty(len(pitcher_idx), dtype=np.int8)
+    for start in range(0, len(pitcher_idx), BLOCK_ROWS):
+        p = pitcher_idx[start:start + BLOCK_ROWS]
+        u = rng.random(len(p))[:, None]
+        out[start:start + BLOCK_ROWS] = np.minimum((cum[p] < u).sum(axis=1), len(types) - 1)
+    return np.array(types, dtype=object)[out], out
+
+def make_season(n_games=2430, n_pitchers=850, n_batters=1000, season=2023, seed=0):
+    """
+    One season of synthetic pitches in the yearly-file schema, sorted like the
+    combined yearly Parquet files (SORT_COLS).
+    """
+    rng = np.random.default_rng(seed)
+    pitchers, batters = _players(rng, n_pitchers), _players(rng, n_batters)
+
+    # 1. GAMES -> AT-BATS -> PITCHES
+    game_day = np.sort(rng.integers(0, SEASON_DAYS, size=n_games))
+    at_bats = rng.poisson(AT_BATS_PER_GAME, size=n_games).clip(54, 110)
+    ab_game = np.repeat(np.arange(n_games), at_bats)
+    ab_number = np.arange(len(ab_game)) - np.repeat(np.cumsum(at_bats) - at_bats, at_bats) + 1
+    pitches = 1 + rng.poisson(PITCHES_PER_AT_BAT - 1, size=len(ab_game)).clip(0, 11)
+    ab_of_pitch = np.repeat(np.arange(len(ab_game)), pitches)
+    pitch_number = np.arange(len(ab_of_pitch)) - np.repeat(np.cumsum(pitches) - pitches, pitches) + 1
+    n = len(ab_of_pitch)
+
+    # Innings and halves follow the at-bat order; each half has its own pitcher pool
+    game_of_pitch = ab_game[ab_of_pitch]
+    inning = 1 + (ab_number - 1) * 9 // at_bats[ab_game]
+    top = ((ab_number - 1) * 18 // at_bats[ab_game]) % 2 == 0
+    starters = rng.integers(0, n_pitchers, size=(n_games, 2))
+    relief = rng.integers(0, n_pitchers, size=(n_games, 2))
+    side = (~top).astype(int)
+    ab_pitcher = np.where(inning <= 6, starters[ab_game, side], relief[ab_game, side])
+    # Batters hit against many pitchers; a few regulars get most of the at-bats
+    batter_weight = rng.pareto(2.0, size=n_batters) + 1
+    ab_batter = rng.choice(n_batters, size=len(ab_game), p=batter_weight / batter_weight.sum())
+
+    pitcher_idx = ab_pitcher[ab_of_pitch]
+    batter_idx = ab_batter[ab_of_pitch]
+    pitch_type, type_idx = _pitch_types(rng, pitcher_idx, n_pitchers)
+
+    # 2. PITCH OUTCOMES AND COUNTS
+    description = _draw(rng, DESCRIPTION_MIX, n)
+    # Batters with a higher whiff tendency swing through more pitches
+    whiff_skill = rng.beta(2, 16, size=n_batters)
+    extra_whiff = (rng.random(n) < whiff_skill[batter_idx] * 0.3) & (description == 'foul')
+    description[extra_whiff] = 'swinging_strike'
+    is_ball = np.isin(description, ['ball', 'blocked_ball', 'intent_ball']).astype(np.int16)
+    is_strike = np.isin(description, ['called_strike', 'swinging_strike', 'swinging_strike_blocked',
+                                      'foul', 'foul_tip', 'foul_bunt', 'missed_bunt']).astype(np.int16)
+    first = np.repeat(np.cumsum(pitches) - pitches, pitches)
+    balls = (np.cumsum(is_ball) - is_ball) - (np.cumsum(is_ball) - is_ball)[first]
+    strikes = (np.cumsum(is_strike) - is_strike) - (np.cumsum(is_strike) - is_strike)[first]
+
+    events = np.full(n, None, dtype=object)
+    last = np.cumsum(pitches) - 1
+    last_desc = description[last]
+    events[last] = np.where(np.isin(last_desc, ['ball', 'blocked_ball', 'intent_ball']), 'walk',
+                   np.where(last_desc == 'hit_by_pitch', 'hit_by_pitch',
+                   np.where(last_desc == 'hit_into_play', _draw(rng, IN_PLAY_EVENTS, len(last)), 'strikeout')))
+
+    # 3. PITCH PHYSICS
+    fastball_velo = rng.normal(94, 2.2, size=n_pitchers)
+    base_spin = rng.normal(2300, 150, size=n_pitchers)
+    velo_offset = np.array([v[1] for v in PITCH_MIX.values()])
+    spin_offset = np.array([v[2] for v in PITCH_MIX.values()])
+    release_speed = fastball_velo[pitcher_idx] + velo_offset[type_idx] + rng.normal(0, 0.9, n)
+    release_spin = base_spin[pitcher_idx] + spin_offset[type_idx] + rng.normal(0, 60, n)
+    zone = rng.choice(np.array(ZONES, dtype=np.float32), size=n)
+
+    # 4. GAME STATE
+    day = pd.Timestamp(f"{season}-{SEASON_START}") + pd.to_timedelta(game_day[game_of_pitch], unit="D")
+    outs = rng.integers(0, 3, size=len(ab_game))[ab_of_pitch]
+    # Runs per inning; the home side's runs in the current inning are not on the board yet
+    away_runs = np.zeros((n_games, 10), dtype=np.int16)
+    home_runs = np.zeros((n_games, 10), dtype=np.int16)
+    away_runs[:, 1:] = rng.poisson(0.5, size=(n_games, 9)).cumsum(axis=1)
+    home_runs[:, 1:] = rng.poisson(0.5, size=(n_games, 9)).cumsum(axis=1)
+    pitch_inning = inning[ab_of_pitch]
+    away_score = away_runs[game_of_pitch, pitch_inning - top[ab_of_pitch]]
+    home_score = home_runs[game_of_pitch, pitch_inning - 1]
+    runners = {}
+    for col, rate in [('on_1b', 0.30), ('on_2b', 0.18), ('on_3b', 0.09)]:
+        on = rng.random(len(ab_game)) < rate
+        runners[col] = np.where(on, batters[rng.integers(0, n_batters, len(ab_game))], np.nan)[ab_of_pitch]
+
+    df = pd.DataFrame({
+        'pitch_type': pitch_type,
+        'pitch_name': pd.Series(pitch_type).map(PITCH_NAMES).to_numpy(),
+        'batter': batters[batter_idx],
+        'pitcher': pitchers[pitcher_idx],
+        'stand': np.where(rng.random(n_batters) < 0.4, 'L', 'R')[batter_idx],
+        'p_throws': np.where(rng.random(n_pitchers) < 0.28, 'L', 'R')[pitcher_idx],
+        'balls': np.minimum(balls, 3),
+        'strikes': np.minimum(strikes, 2),
+        'outs_when_up': outs,
+        'inning': pitch_inning,
+        'inning_topbot': np.where(top, 'Top', 'Bot')[ab_of_pitch],
+        'game_pk': season * 10_000 + game_of_pitch,
+        'game_date': day.strftime("%Y-%m-%d"),
+        'at_bat_number': ab_number[ab_of_pitch],
+        'pitch_number': pitch_number,
+        'zone': zone,
+        'home_score': home_score,
+        'away_score': away_score,
+        **runners,
+        'events': events,
+        'description': description,
+        'release_speed': release_speed,
+        'release_spin_rate': release_spin,
+    })
+    # Statcast leaves a few pitches untracked
+    for cols in [['pitch_type', 'pitch_name'], ['zone'], ['release_speed', 'release_spin_rate']]:
+        df.loc[rng.random(n) < MISSING_RATE, cols] = np.nan
+
+    columns = [c for c in USE_COLS if c]
+    df = df[columns].astype({c: CHUNK_DTYPES[c] for c in columns})
+    return apply_schema(df.sort_values(SORT_COLS, ignore_index=True), numeric=False)
+
+def make_rows(rows, season=2023, seed=0):
+    """A season with roughly the given number of pitches and a matching player pool."""
+    n_games = rows_to_games(rows)
+    scale = min(1.0, n_games / 2430)
+    return make_season(
+        n_games=n_games,
+        n_pitchers=max(20, int(850 * scale ** 0.5)),
+        n_batters=max(40, int(1000 * scale ** 0.5)),
+        season=season, seed=seed,
+    )
+
+def write_season(df, season, out_dir=YEARLY_DIR):
+    """Writes the frame where gather.py puts combined seasons."""
+    os.makedirs(out_dir, exist_ok=True)
+    path = f"{out_dir}/statcast_{season}.parquet"
+    df.to_parquet(path, index=False)
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic Statcast seasons for offline runs.")
+    parser.add_argument("--rows", type=int, default=700_000, help="approximate pitches per season")
+    parser.add_argument("--seasons", type=int, nargs="+", default=[2023])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=YEARLY_DIR)
+    args = parser.parse_args()
+
+    for i, season in enumerate(args.seasons):
+        df = make_rows(args.rows, season=season, seed=args.seed + i)
+        print(f"Saved {write_season(df, season, args.out)} | Rows: {len(df)}")
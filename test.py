@@ -1,63 +1,102 @@
-import pandas as pd
 import numpy as np
-import lightgbm as lgb
+from dataset import read_dataset
+from encoders import CategoryEncoder, encoder_path
+from feature_matrix import FeatureMatrix
+from compiled_model import load_compiled
+from repertoire import build_repertoire, repertoire_rows
 
-def get_filtered_accuracy(model_path, data, target_col):
-    # 1. Load Model
-    model = lgb.Booster(model_file=model_path)
+CHUNK_ROWS = 250_000  # Rows predicted and masked at a time (bounds memory)
+
+def score_chunk(model, X, y_true, pitchers, pitcher_ids, repertoire):
+    """Top-1 and top-3 hits of one chunk after the repertoire mask."""
+    # Missing values are scored as 0 (copying only chunks that have any)
+    if np.isnan(X).any():
+        X = np.where(np.isnan(X), np.float32(0), X)
+
+    # 5-6. Probabilities with THE MASK applied (Shape: (rows, classes))
+    # Only the trees of the pitches the pitcher throws are walked and rows are
+    # normalized over those pitches (same as zeroing the others and re-normalizing)
+    filtered_probs = model.predict(X, allowed=repertoire_rows(pitcher_ids, repertoire, pitchers))
+
+    # 7. Count Hits
+    top1_hits = np.count_nonzero(np.argmax(filtered_probs, axis=1) == y_true)
+    top3_idx = np.argsort(filtered_probs, axis=1)[:, -3:]
+    top3_hits = np.count_nonzero(np.any(top3_idx == y_true[:, None], axis=1))
+    return top1_hits, top3_hits
+
+def get_filtered_accuracy(model_path, data, target_col, reference, chunk_rows=CHUNK_ROWS):
+    """
+    Top-1 / top-3 accuracy (%) after zeroing out the pitches a pitcher never
+    throws in reference and renormalizing. data is scored chunk by chunk.
+    """
+    # 1. Load Model (compiled form, see compiled_model.py)
+    model = load_compiled(model_path)
     expected_features = model.feature_name()
     
-    # 2. Get the Universal Category Mapping (Alphabetical)
-    all_possible_pitches = sorted(df[target_col].unique().tolist())
-    data[target_col] = pd.Categorical(data[target_col], categories=all_possible_pitches)
-    y_true = data[target_col].cat.codes.values
+    # 2. Load the Category Encoder saved with the model (same codes as training)
+    encoder = CategoryEncoder.load(encoder_path(model_path))
+    y_ref = encoder.encode_classes(reference[target_col])
     
     # 3. BUILD THE REPERTOIRE MASK
-    # We create a mapping of pitcher -> list of pitch codes they actually throw
+    # One boolean row per pitcher with the pitch codes they actually throw
     print("🧠 Building Repertoire Mask...")
-    repertoire_map = df.groupby('pitcher')[target_col].unique().apply(
-        lambda x: [all_possible_pitches.index(p) for p in x]
-    ).to_dict()
-
-    # 4. Prepare Features
-    X = data[expected_features].copy()
-    for col in X.columns:
-        if X[col].dtype.name == 'category' or X[col].dtype == 'object':
-            all_col_vals = sorted(df[col].unique().tolist())
-            X[col] = pd.Categorical(X[col], categories=all_col_vals).codes
-        X[col] = X[col].fillna(0).astype(np.float32)
-
-    # 5. Get Raw Probabilities
-    raw_probs = model.predict(X.values) # Shape: (50000, 18)
-    
-    # 6. APPLY THE MASK
-    # For every row, find the pitcher and zero out pitches they don't throw
-    filtered_probs = raw_probs.copy()
-    pitcher_ids = data['pitcher'].values
-    
-    for i, p_id in enumerate(pitcher_ids):
-        allowed_indices = repertoire_map.get(p_id, [])
-        # Create a mask of zeros
-        mask = np.zeros(len(all_possible_pitches))
-        mask[allowed_indices] = 1
-        # Multiply probabilities by the mask
-        filtered_probs[i] = filtered_probs[i] * mask
-        
-        # Re-normalize so the sum is 1.0 again
-        if filtered_probs[i].sum() > 0:
-            filtered_probs[i] /= filtered_probs[i].sum()
-
-    # 7. Calculate Accuracy
-    top1 = np.mean(np.argmax(filtered_probs, axis=1) == y_true) * 100
-    
-    top3_idx = np.argsort(filtered_probs, axis=1)[:, -3:]
-    top3 = np.any(top3_idx == y_true[:, None], axis=1).mean() * 100
-    
+    pitcher_ids, repertoire = build_repertoire(
+        reference['pitcher'].to_numpy(), y_ref, len(encoder.classes)
+    )
+
+    top1_hits, top3_hits = 0, 0
+    for start in range(0, len(data), chunk_rows):
+        chunk = data.iloc[start:start + chunk_rows]
+        # 4. Prepare Features (categoricals are a lookup; unseen values get the unknown code)
+        hits = score_chunk(model, encoder.transform(chunk, expected_features), encoder.encode_classes(chunk[target_col]),
+                           chunk['pitcher'].to_numpy(), pitcher_ids, repertoire)
+        top1_hits, top3_hits = top1_hits + hits[0], top3_hits + hits[1]
+
+    top1 = top1_hits / len(data) * 100
+    top3 = top3_hits / len(data) * 100
     return top1, top3
 
+def get_filtered_accuracy_matrix(model_path, matrix, target_col, rows=None, chunk_rows=CHUNK_ROWS):
+    """
+    get_filtered_accuracy on an exported FeatureMatrix (feature_matrix.py):
+    the repertoire comes from every row of the matrix and the rows to score
+    (default: all) are read from the mapped pages chunk by chunk, already encoded.
+    """
+    model = load_compiled(model_path)
+    encoder = CategoryEncoder.load(encoder_path(model_path))
+    matrix.check_encoder(encoder, target_col)
+    if model.feature_name() != matrix.meta['features']:
+        raise ValueError(f"{model_path} expects other features than {matrix.path}")
+
+    print("🧠 Building Repertoire Mask...")
+    y_all = matrix.labels[target_col]
+    pitcher_ids, repertoire = build_repertoire(matrix.pitchers, y_all, len(encoder.classes))
+
+    n = len(matrix) if rows is None else len(rows)
+    top1_hits, top3_hits = 0, 0
+    for start in range(0, n, chunk_rows):
+        # Contiguous slices are views of the mapped file; sampled rows are gathered
+        idx = slice(start, start + chunk_rows) if rows is None else rows[start:start + chunk_rows]
+        hits = score_chunk(model, matrix.X[idx], y_all[idx], matrix.pitchers[idx], pitcher_ids, repertoire)
+        top1_hits, top3_hits = top1_hits + hits[0], top3_hits + hits[1]
+    return top1_hits / n * 100, top3_hits / n * 100
+
 # --- RUN ---
-df = pd.read_parquet("final_data.parquet")
-test_sample = df.sample(n=50000, random_state=42).copy()
+MODEL_FILE = 'model_type_optimized.txt'
+SAMPLE_ROWS = 50000  # None scores every row
+MATRIX_DIR = None  # e.g. "feature_matrix": score the exported matrix instead of reading final_data
 
-t1, t3 = get_filtered_accuracy('model_type_optimized.txt', test_sample, 'pitch_type')
-print(f"\n✅ Filtered Pitch Type -> Top 1: {t1:.2f}%, Top 3: {t3:.2f}%")
\ No newline at end of file
+if MATRIX_DIR:
+    matrix = FeatureMatrix(MATRIX_DIR)
+    rows = None
+    if SAMPLE_ROWS is not None:
+        # Sorted, so the sample is read from the mapped file front to back
+        rows = np.sort(np.random.default_rng(42).choice(len(matrix), size=SAMPLE_ROWS, replace=False))
+    t1, t3 = get_filtered_accuracy_matrix(MODEL_FILE, matrix, 'pitch_type', rows)
+else:
+    # Only the columns the model and the mask need
+    columns = load_compiled(MODEL_FILE).feature_name() + ['pitch_type', 'pitcher']
+    df = read_dataset("final_data", columns=list(dict.fromkeys(columns)))
+    test_sample = df if SAMPLE_ROWS is None else df.sample(n=SAMPLE_ROWS, random_state=42)
+    t1, t3 = get_filtered_accuracy(MODEL_FILE, test_sample, 'pitch_type', df)
+print(f"\n✅ Filtered Pitch Type -> Top 1: {t1:.2f}%, Top 3: {t3:.2f}%")
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# The modules are flat scripts at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing gather (via serve / incremental) creates its data folders in the
+# working directory: keep them out of the repository
+os.chdir(tempfile.mkdtemp(prefix="pitch_tests_"))
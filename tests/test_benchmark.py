@@ -0,0 +1,23 @@
+import os
+import time
+import benchmark
+
+
+def die(name, size, model_file, verbose, results):
+    """A child killed before it reports, as by the OOM killer."""
+    os._exit(9)
+
+
+def test_child_dying_without_result_is_an_error_row(monkeypatch):
+    monkeypatch.setattr(benchmark, "_child", die)
+    monkeypatch.setattr(benchmark, "RESULT_POLL_S", 0.2)
+    t0 = time.perf_counter()
+    result = benchmark.run_benchmark("clean", 1000)
+    assert time.perf_counter() - t0 < 60
+    assert result['benchmark'] == "clean" and result['size'] == 1000
+    assert "code 9" in result['error']
+
+
+def test_failing_stage_reports_its_error():
+    result = benchmark.run_benchmark("no_such_stage", 1000)
+    assert "KeyError" in result['error']
@@ -0,0 +1,39 @@
+import numpy as np
+import lightgbm as lgb
+import pytest
+import compiled_model
+from compiled_model import compile_booster
+
+
+@pytest.fixture(scope="module")
+def booster():
+    # Category 0 of the categorical feature decides the class, so splits put 0 in their bitsets
+    rng = np.random.default_rng(0)
+    n = 4000
+    cat = rng.integers(0, 6, n).astype(np.float32)
+    num = rng.normal(size=n).astype(np.float32)
+    num[rng.random(n) < 0.1] = np.nan
+    y = np.where(cat == 0, 0, np.where(num > 0, 1, 2))
+    data = lgb.Dataset(np.column_stack([cat, num]), label=y, feature_name=['cat', 'num'],
+                       categorical_feature=['cat'])
+    params = {'objective': 'multiclass', 'num_class': 3, 'num_leaves': 8, 'min_data_per_group': 5,
+              'cat_smooth': 1, 'verbose': -1, 'seed': 0}
+    return lgb.train(params, data, num_boost_round=20)
+
+
+def rows():
+    rng = np.random.default_rng(1)
+    X = np.column_stack([rng.integers(0, 6, 500), rng.normal(size=500)]).astype(np.float32)
+    X[:100, 0] = np.nan  # NaN categoricals
+    X[50:150, 1] = np.nan
+    X[200:220, 0] = -1
+    return X
+
+
+@pytest.mark.parametrize("use_kernel", [True, False])
+def test_matches_booster_with_nan_categoricals(booster, use_kernel):
+    if use_kernel and compiled_model._kernel() is None:
+        pytest.skip("no C compiler")
+    X = rows()
+    model = compile_booster(booster)
+    np.testing.assert_allclose(model.predict(X, use_kernel=use_kernel), booster.predict(X), atol=1e-9)
@@ -0,0 +1,39 @@
+import pandas as pd
+import schema
+import features
+
+
+def write_raw(path):
+    pd.DataFrame({
+        'game_pk': [1, 1, 1, 2], 'at_bat_number': [1, 1, 2, 1], 'pitch_number': [1, 2, 1, 1],
+        'game_date': ['2023-04-01'] * 3 + ['2023-04-02'],
+        'pitch_type': ['FF', 'SL', 'CH', 'FF'], 'zone': [5.0, 11.0, 2.0, 14.0],
+    }).to_parquet(path, index=False)
+    return str(path)
+
+
+def test_base_key_covers_schema(tmp_path, monkeypatch):
+    raw = write_raw(tmp_path / "statcast_2023.parquet")
+    _, key = features.load_base([raw])
+    assert features.load_base([raw])[1] == key
+
+    monkeypatch.setitem(schema.INTEGERS, 'zone', 'int16')
+    _, widened = features.load_base([raw])
+    assert widened != key
+
+    monkeypatch.setitem(schema.CATEGORIES, 'pitch_type', schema.PITCH_TYPES + ['XX'])
+    _, extended = features.load_base([raw])
+    assert extended not in (key, widened)
+
+
+def test_schema_edit_misses_node_cache(tmp_path, monkeypatch):
+    raw = write_raw(tmp_path / "statcast_2023.parquet")
+    df, key = features.load_base([raw])
+    targets = ['prev_pitch_type', 'prev_zone']
+    passes = features.plan(targets, set(df.columns))
+    before = features.node_keys(passes, key, df.columns)
+
+    monkeypatch.setitem(schema.INTEGERS, 'pitch_number', 'int32')
+    df, key = features.load_base([raw])
+    after = features.node_keys(passes, key, df.columns)
+    assert all(before[name] != after[name] for name in before)
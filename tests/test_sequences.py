@@ -0,0 +1,44 @@
+import pytest
+from sequences import SequenceBatch
+
+AT_BAT = {'pitcher': 543037, 'batter': 660271, 'stand': 'L', 'inning': 3, 'on_1b': True}
+PITCHES = [
+    {'balls': 0, 'strikes': 0, 'pitch_type': 'FF', 'zone': 5},
+    {'balls': 0, 'strikes': 1, 'pitch_type': 'SL', 'zone': 14},
+    {'balls': 1, 'strikes': 1},
+]
+
+
+def at_bat(i, **changes):
+    pitches = [dict(p) for p in PITCHES]
+    pitches[i].update(changes)
+    return {**AT_BAT, 'pitches': pitches}
+
+
+def test_valid_at_bat():
+    batch = SequenceBatch.from_at_bats([{**AT_BAT, 'pitches': PITCHES}])
+    assert len(batch) == 3
+    assert list(batch.pitch['prev_pitch_type']) == ['START', 'FF', 'SL']
+    assert list(batch.pitch['prev_zone']) == [0, 5, 14]
+    assert list(batch.pitch['on_1b']) == [True, True, True]
+
+
+@pytest.mark.parametrize("i, changes", [
+    (1, {'strikes': 5}),
+    (1, {'balls': -1}),
+    (0, {'zone': 10}),
+    (0, {'pitch_type': 'XX'}),
+    (1, {'balls': float('inf')}),
+    (2, {'zone': 99}),
+    (1, {'strikes': True}),
+])
+def test_invalid_pitch_rejected(i, changes):
+    with pytest.raises(ValueError, match=f"pitch {i}"):
+        SequenceBatch.from_at_bats([at_bat(i, **changes)])
+
+
+def test_only_last_pitch_may_omit_what_was_thrown():
+    pitches = [dict(p) for p in PITCHES]
+    del pitches[0]['zone']
+    with pytest.raises(ValueError):
+        SequenceBatch.from_at_bats([{**AT_BAT, 'pitches': pitches}])
@@ -0,0 +1,74 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+import serve
+from serve import MicroBatcher, make_server, validate
+
+REQUEST = {'pitcher': 543037, 'batter': 660271, 'balls': 1, 'strikes': 2}
+
+
+@pytest.mark.parametrize("key", ['pitcher', 'batter'])
+@pytest.mark.parametrize("value", [True, False])
+def test_rejects_bool_ids(key, value):
+    with pytest.raises(ValueError):
+        validate({**REQUEST, key: value})
+
+
+@pytest.mark.parametrize("key", serve.NUMERIC_FIELDS)
+@pytest.mark.parametrize("value", [float('inf'), float('-inf'), float('nan'), "3", None])
+def test_rejects_non_finite_numbers(key, value):
+    with pytest.raises(ValueError):
+        validate({**REQUEST, key: value})
+
+
+def test_accepts_valid_request():
+    validate({**REQUEST, 'home_score': 3.0, 'on_1b': True, 'prev_pitch_type': 'FF'})
+
+
+class RaisingPredictor:
+    """Fails every request whose batter is 0, answers the rest."""
+
+    def predict_batch(self, requests):
+        if any(r['batter'] == 0 for r in requests):
+            raise RuntimeError("model failure")
+        return [{'zone': [], 'pitch_type': []} for _ in requests]
+
+
+def test_failing_request_does_not_fail_its_batch():
+    batcher = MicroBatcher(RaisingPredictor(), max_wait_ms=50)
+    futures = [batcher.submit(REQUEST), batcher.submit({**REQUEST, 'batter': 0}), batcher.submit(REQUEST)]
+    assert futures[0].result(timeout=5) == {'zone': [], 'pitch_type': []}
+    with pytest.raises(RuntimeError):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) == {'zone': [], 'pitch_type': []}
+
+
+def post(url, body):
+    req = urllib.request.Request(url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+@pytest.fixture
+def server():
+    server = make_server(RaisingPredictor(), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/predict"
+    server.shutdown()
+    server.server_close()
+
+
+def test_model_error_returns_500(server):
+    status, body = post(server, {**REQUEST, 'batter': 0})
+    assert status == 500 and 'model failure' in body['error']
+    assert post(server, REQUEST)[0] == 200
+
+
+def test_invalid_request_returns_400(server):
+    assert post(server, {**REQUEST, 'pitcher': True})[0] == 400
+    assert post(server, {**REQUEST, 'inning': float('inf')})[0] == 400